@@ -0,0 +1,105 @@
+"""
+Benchmark: kết nối mới cho mỗi request vs connection pool dùng chung.
+
+Chạy một mock server OpenRouter cục bộ (HTTP/1.1 keep-alive) và so sánh:
+    1. `requests.post` (mở TCP connection mới cho mỗi completion - cách cũ)
+    2. `OpenRouterClient.generate` (requests.Session dùng chung)
+    3. `OpenRouterRunnable.abatch` (httpx.AsyncClient dùng chung, chạy đồng thời)
+
+Cách chạy (từ thư mục backend):
+    python -m benchmarks.bench_openrouter_pool --requests 200 --latency-ms 20
+"""
+import argparse
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from src.base.llm_model_openrouter import OpenRouterClient, OpenRouterRunnable
+from src.base.http_pool import aclose_async_client
+
+MOCK_RESPONSE = json.dumps({
+    "choices": [{"message": {"role": "assistant", "content": "Answer: WATA TECH provides IT outsourcing."}}]
+}).encode("utf-8")
+
+
+class MockOpenRouterHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Ghi header + body trong một lần gửi để tránh độ trễ Nagle/delayed-ACK trên keep-alive
+    wbufsize = -1
+    latency = 0.0
+    connections = 0
+
+    def setup(self):
+        super().setup()
+        MockOpenRouterHandler.connections += 1
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        time.sleep(self.latency)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(MOCK_RESPONSE)))
+        self.end_headers()
+        self.wfile.write(MOCK_RESPONSE)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_mock_server(latency_ms: float):
+    MockOpenRouterHandler.latency = latency_ms / 1000
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockOpenRouterHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/api/v1"
+
+
+def report(name: str, elapsed: float, n: int, connections: int) -> None:
+    print(f"{name:<32} {elapsed:8.3f}s  {n / elapsed:8.1f} req/s  {elapsed / n * 1000:7.2f} ms/req  {connections:5d} connections")
+
+
+def bench_fresh_connections(base_url: str, n: int) -> None:
+    MockOpenRouterHandler.connections = 0
+    payload = {"model": "mock", "messages": [{"role": "user", "content": "hi"}], "max_tokens": 16}
+    start = time.perf_counter()
+    for _ in range(n):
+        requests.post(f"{base_url}/chat/completions", json=payload, timeout=10).json()
+    report("requests.post (fresh conn)", time.perf_counter() - start, n, MockOpenRouterHandler.connections)
+
+
+def bench_pooled_sync(base_url: str, n: int) -> None:
+    MockOpenRouterHandler.connections = 0
+    client = OpenRouterClient(api_keys=["mock-key"], base_url=base_url)
+    start = time.perf_counter()
+    for _ in range(n):
+        client.generate(model="mock", prompt="hi", max_tokens=16)
+    report("OpenRouterClient.generate", time.perf_counter() - start, n, MockOpenRouterHandler.connections)
+
+
+async def bench_pooled_async(base_url: str, n: int, concurrency: int) -> None:
+    MockOpenRouterHandler.connections = 0
+    runnable = OpenRouterRunnable(OpenRouterClient(api_keys=["mock-key"], base_url=base_url), model="mock", max_tokens=16)
+    start = time.perf_counter()
+    await runnable.abatch(["hi"] * n, config={"max_concurrency": concurrency})
+    report(f"OpenRouterRunnable.abatch (x{concurrency})", time.perf_counter() - start, n, MockOpenRouterHandler.connections)
+    await aclose_async_client()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Độ trễ giả lập của mock server")
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    server, base_url = start_mock_server(args.latency_ms)
+    try:
+        bench_fresh_connections(base_url, args.requests)
+        bench_pooled_sync(base_url, args.requests)
+        asyncio.run(bench_pooled_async(base_url, args.requests, args.concurrency))
+    finally:
+        server.shutdown()
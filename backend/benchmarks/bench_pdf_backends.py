@@ -0,0 +1,55 @@
+"""
+Benchmark: các backend trích xuất text PDF (PyMuPDF vs pypdf) và cache text theo hash file.
+
+Với mỗi backend, trích xuất toàn bộ PDF trong thư mục dữ liệu và báo cáo:
+    - thời gian, số trang/giây, số ký tự lấy được và số trang rỗng
+    - thời gian đọc lại từ cache (lần chạy thứ hai với cùng nội dung file)
+
+Cách chạy (từ thư mục backend):
+    python -m benchmarks.bench_pdf_backends
+    python -m benchmarks.bench_pdf_backends --data-dir data_source/generative_ai/pdfs --repeat 3
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from src.rag.extraction import BACKENDS, extract_pages
+
+
+def run(files, backend: str, cache_dir=None):
+    pages = chars = empty = 0
+    start = time.perf_counter()
+    for pdf_file in files:
+        texts, _ = extract_pages(pdf_file, backend=backend, cache_dir=cache_dir)
+        pages += len(texts)
+        chars += sum(len(text) for text in texts)
+        empty += sum(1 for text in texts if not text.strip())
+    return time.perf_counter() - start, pages, chars, empty
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default="data_source/generative_ai/pdfs")
+    parser.add_argument("--repeat", type=int, default=1, help="Số lần chạy, lấy lần nhanh nhất")
+    args = parser.parse_args()
+
+    files = sorted(str(path) for path in Path(args.data_dir).glob("*.pdf"))
+    print(f"{len(files)} file PDF trong {args.data_dir}\n")
+    print(f"{'backend':<10} {'time':>8} {'pages/s':>9} {'pages':>6} {'chars':>9} {'empty':>6} {'cached':>8} {'speedup':>8}")
+
+    baseline = None
+    for backend in BACKENDS:
+        elapsed, pages, chars, empty = min(run(files, backend) for _ in range(args.repeat))
+        with tempfile.TemporaryDirectory() as cache_dir:
+            run(files, backend, cache_dir)
+            cached = min(run(files, backend, cache_dir)[0] for _ in range(args.repeat))
+        baseline = baseline or elapsed
+        print(
+            f"{backend:<10} {elapsed:7.2f}s {pages / elapsed:9.1f} {pages:6d} {chars:9d} {empty:6d} "
+            f"{cached:7.2f}s {baseline / elapsed:7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
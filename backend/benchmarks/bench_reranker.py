@@ -0,0 +1,96 @@
+"""
+Benchmark: bước rerank bằng cross-encoder - kích thước prompt giảm được so với độ trễ CPU thêm vào.
+
+Tải và chia chunk các PDF trong thư mục dữ liệu (cùng tham số với chain RAG), lấy k ứng viên cho mỗi
+truy vấn bằng BM25 (không cần load embedding model), rồi rerank giữ top-n và báo cáo:
+    - số token context trung bình khi gửi k chunk vs top-n chunk sau rerank
+    - độ trễ rerank p50/p99 (một batch forward trên CPU)
+    - điểm hoà vốn: LLM phải tốn bao nhiêu ms cho mỗi 1000 token prompt thì rerank mới có lợi
+
+Truy vấn được lấy từ một đoạn ~12 từ trong các chunk ngẫu nhiên.
+
+Cách chạy (từ thư mục backend):
+    python -m benchmarks.bench_reranker --k 10 --top-n 3 --queries 100
+    python -m benchmarks.bench_reranker --model cross-encoder/mmarco-mMiniLMv2-L12-H384-v1 --threads 4
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from src.rag.bm25 import BM25Index
+from src.rag.context_packer import approximate_text_tokens
+from src.rag.reranker import CrossEncoderReranker
+
+
+def make_queries(chunks, n_queries: int, n_words: int = 12, seed: int = 0):
+    rng = random.Random(seed)
+    queries = []
+    for doc in rng.sample(chunks, min(n_queries, len(chunks))):
+        words = doc.page_content.split()
+        start = rng.randint(0, max(len(words) - n_words, 0))
+        queries.append(" ".join(words[start:start + n_words]))
+    return queries
+
+
+def run(reranker: CrossEncoderReranker, chunks, queries, k: int):
+    index = BM25Index()
+    index.add([str(i) for i in range(len(chunks))], (doc.page_content for doc in chunks))
+
+    before_tokens, after_tokens, latencies = [], [], []
+    for query in queries:
+        candidates = [(chunks[int(doc_id)], score) for doc_id, score in index.search(query, k)]
+        if len(candidates) <= 1:
+            continue
+        start = time.perf_counter()
+        reranked = reranker.rerank(query, candidates)
+        latencies.append((time.perf_counter() - start) * 1000)
+        before_tokens.append(sum(approximate_text_tokens(doc.page_content) for doc, _ in candidates))
+        after_tokens.append(sum(approximate_text_tokens(doc.page_content) for doc, _ in reranked))
+
+    latencies = np.array(latencies)
+    return {
+        "queries": len(latencies),
+        "tokens_before": float(np.mean(before_tokens)),
+        "tokens_after": float(np.mean(after_tokens)),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default="data_source/generative_ai/pdfs")
+    parser.add_argument("--model", default=CrossEncoderReranker.DEFAULT_MODEL)
+    parser.add_argument("--k", type=int, default=10, help="Số ứng viên trước rerank")
+    parser.add_argument("--top-n", type=int, default=3, help="Số chunk giữ lại sau rerank")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--threads", type=int, default=0, help="Số thread torch (0: mặc định)")
+    args = parser.parse_args()
+
+    from src.rag.chain_rag import SPLIT_KWARGS
+    from src.rag.file_loader import Loader
+
+    if args.threads:
+        import torch
+        torch.set_num_threads(args.threads)
+
+    chunks = Loader("pdf", split_kwargs=SPLIT_KWARGS).load_dir(args.data_dir, workers=4)
+    queries = make_queries(chunks, args.queries)
+    # Không giới hạn thời gian để đo đủ mọi truy vấn; lần chạy đầu để warm-up
+    reranker = CrossEncoderReranker(args.model, top_n=args.top_n, budget_ms=float("inf"))
+    reranker.rerank(queries[0], [(doc, None) for doc in chunks[:args.k]])
+
+    result = run(reranker, chunks, queries, args.k)
+    saved = result["tokens_before"] - result["tokens_after"]
+    print(f"{len(chunks)} chunk, {result['queries']} truy vấn, k={args.k} -> top-{args.top_n}, model {args.model}\n")
+    print(f"Context trung bình: {result['tokens_before']:.0f} -> {result['tokens_after']:.0f} token "
+          f"(-{saved / result['tokens_before']:.0%})")
+    print(f"Độ trễ rerank: p50 {result['p50_ms']:.1f}ms, p99 {result['p99_ms']:.1f}ms")
+    if saved > 0:
+        print(f"Hoà vốn khi LLM tốn > {result['p50_ms'] / saved * 1000:.1f}ms cho mỗi 1000 token prompt")
+
+
+if __name__ == "__main__":
+    main()
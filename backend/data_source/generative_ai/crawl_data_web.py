@@ -1,23 +1,37 @@
 import os
 import re
+import sys
+import time
+import json
+import argparse
 import urllib3
-from typing import Optional, Tuple, List
-from langchain_community.document_loaders import WebBaseLoader
+from pathlib import Path
+from typing import Any, Dict, Optional, List
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
 from reportlab.pdfbase.pdfmetrics import stringWidth
-from urllib.parse import urlparse
+from urllib.parse import unquote, urlparse
 from reportlab.lib.colors import blue
 
+# Cho phép chạy trực tiếp file này từ thư mục backend
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from src.crawl.engine import MODES, CrawlResult, Crawler  # noqa: E402
+from src.crawl.state import CrawlState  # noqa: E402
+from src.crawl.corpus import result_to_record, write_records  # noqa: E402
+
 # Tắt cảnh báo SSL
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-# Thiết lập User-Agent
-os.environ["USER_AGENT"] = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36"
-
 # Đường dẫn thư mục lưu PDF
 PDF_SAVE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pdfs")
 os.makedirs(PDF_SAVE_DIR, exist_ok=True)
+# Corpus JSONL (mỗi trang một file), được Loader('jsonl') đọc trực tiếp
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+OUTPUT_DIRS = {"jsonl": CORPUS_DIR, "pdf": PDF_SAVE_DIR}
+URL_LIST_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "url_list.txt")
+# Trạng thái crawl (ETag/Last-Modified/hash nội dung) và danh sách tài liệu thay đổi của lần chạy gần nhất
+CRAWL_STATE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "crawl_state.json")
+CRAWL_CHANGES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "crawl_changes.json")
 
 
 def slugify(value: str) -> str:
@@ -56,113 +70,6 @@ def wrap_text(text: str, max_width: int, font_name: str, font_size: int) -> list
     return lines
 
 
-def extract_text_and_title(url: str) -> Tuple[str, str]:
-    """Lấy tiêu đề và nội dung chính từ trang web theo trình tự đúng."""
-    try:
-        try:
-            from selenium import webdriver
-            from selenium.webdriver.chrome.options import Options
-            from selenium.webdriver.common.by import By
-            from selenium.webdriver.support.ui import WebDriverWait
-            from selenium.webdriver.support import expected_conditions as EC
-            import time
-            
-            # Cấu hình Chrome
-            chrome_options = Options()
-            chrome_options.add_argument("--headless")
-            chrome_options.add_argument("--no-sandbox")
-            chrome_options.add_argument("--disable-dev-shm-usage")
-            chrome_options.add_argument(f"user-agent={os.environ['USER_AGENT']}")
-            
-            driver = webdriver.Chrome(options=chrome_options)
-            driver.set_page_load_timeout(30)
-            driver.get(url)
-            
-            wait = WebDriverWait(driver, 10)
-            wait.until(EC.presence_of_element_located((By.TAG_NAME, "body")))
-            
-            last_height = driver.execute_script("return document.body.scrollHeight")
-            for i in range(0, last_height, 300):
-                driver.execute_script(f"window.scrollTo(0, {i});")
-                time.sleep(0.1)
-            
-            time.sleep(4)  
-            
-            title = driver.title
-            
-            driver.execute_script("""
-                var elements = document.querySelectorAll('script, style, noscript, iframe');
-                for (var i = 0; i < elements.length; i++) {
-                    elements[i].remove();
-                }
-            """)
-            
-            main_content = None
-            possible_containers = [
-                "//article", "//main", "//*[@id='content']", "//*[@class='content']", 
-                "//div[contains(@class,'article')]", "//div[contains(@class,'post')]",
-                "//section[contains(@class,'main')]", "//div[contains(@class,'main')]"
-            ]
-            
-            for selector in possible_containers:
-                elements = driver.find_elements(By.XPATH, selector)
-                if elements:
-                    main_content = max(elements, key=lambda e: len(e.text.strip()))
-                    break
-            
-            if not main_content or len(main_content.text) < 100:
-                main_content = driver.find_element(By.TAG_NAME, "body")
-            
-            html_content = main_content.get_attribute('outerHTML')
-            
-            from bs4 import BeautifulSoup
-            soup = BeautifulSoup(html_content, 'html.parser')
-            
-            for tag in soup.find_all(['script', 'style', 'noscript', 'iframe', 'svg']):
-                tag.decompose()
-            
-            for header in soup.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6']):
-                header.insert_before('\n\n')
-                header.insert_after('\n')
-            
-            for p in soup.find_all('p'):
-                p.insert_after('\n')
-            
-            for li in soup.find_all('li'):
-                li.insert_before('• ')
-                li.insert_after('\n')
-            
-            content = soup.get_text(separator=' ')
-            
-            import re
-            content = re.sub(r'\s+', ' ', content)
-            content = re.sub(r'\n\s*\n', '\n\n', content)
-            
-            lines = content.split('\n')
-            unique_lines = []
-            seen = set()
-            
-            for line in lines:
-                line = line.strip()
-                if line and line not in seen:
-                    unique_lines.append(line)
-                    seen.add(line)
-            
-            content = '\n'.join(unique_lines)
-            
-            driver.quit()
-            return title, content
-            
-        except ImportError as e:
-            print(f"[⚠️] Không thể sử dụng Selenium: {e}, sử dụng WebBaseLoader thay thế")
-    
-    except Exception as e:
-        print(f"[❌] Lỗi khi trích xuất từ {url}: {e}")
-        import traceback
-        traceback.print_exc()
-        return "no_title", ""
-
-
 def save_text_to_pdf(text: str, path: str, title: str = "", url: str = "") -> bool:
     """Lưu văn bản vào PDF."""
     try:
@@ -218,22 +125,88 @@ def save_text_to_pdf(text: str, path: str, title: str = "", url: str = "") -> bo
         return False
 
 
-def save_url_to_pdf(url: str) -> Optional[str]:
-    """Trích xuất và lưu trang web thành file PDF duy nhất."""
-    title, content = extract_text_and_title(url)
-    if not content:
-        print(f"[⚠️] Không có nội dung từ: {url}")
+def save_result_to_pdf(result: CrawlResult) -> Optional[str]:
+    """
+    Lưu kết quả crawl của một trang web thành file PDF duy nhất.
+    Không có trạng thái crawl (`result.changed` là None) thì giữ nguyên PDF đã tồn tại, ngược lại ghi đè.
+    """
+    if not result.ok:
+        print(f"[⚠️] Không có nội dung từ: {result.url} ({result.error or 'trang rỗng'})")
         return None
 
-    domain = urlparse(url).netloc
-    pdf_name = f"{slugify(domain)}_{slugify(title)}.pdf"
+    domain = urlparse(result.url).netloc
+    pdf_name = f"{slugify(domain)}_{slugify(result.title or 'no_title')}.pdf"
     pdf_path = os.path.join(PDF_SAVE_DIR, pdf_name)
 
-    if os.path.exists(pdf_path):
+    if result.changed is None and os.path.exists(pdf_path):
         print(f"[✅] PDF đã tồn tại: {pdf_path}")
         return pdf_path
 
-    return pdf_path if save_text_to_pdf(content, pdf_path, title, url) else None
+    return pdf_path if save_text_to_pdf(result.text, pdf_path, result.title, result.url) else None
+
+def save_result_to_jsonl(result: CrawlResult) -> Optional[str]:
+    """Lưu kết quả crawl của một trang web thành một bản ghi trong corpus JSONL (giữ nguyên tiếng Việt)."""
+    if not result.ok:
+        print(f"[⚠️] Không có nội dung từ: {result.url} ({result.error or 'trang rỗng'})")
+        return None
+
+    parsed = urlparse(result.url)
+    # Tên file theo URL (nhiều trang có thể trùng tiêu đề), giới hạn độ dài tên file
+    path_slug = slugify(unquote(f"{parsed.path} {parsed.query}").replace("/", " "))[:150] or "index"
+    jsonl_path = os.path.join(CORPUS_DIR, f"{slugify(parsed.netloc)}_{path_slug}.jsonl")
+    try:
+        write_records(jsonl_path, [result_to_record(result)])
+    except OSError as e:
+        print(f"[❌] Không thể lưu JSONL: {e}")
+        return None
+    print(f"[✅] Đã lưu JSONL: {jsonl_path}")
+    return jsonl_path
+
+
+SAVERS = {"jsonl": save_result_to_jsonl, "pdf": save_result_to_pdf}
+
+
+def _remove_document(state: CrawlState, url: str, path: Optional[str], changes: Dict[str, Any]) -> None:
+    """Xoá tài liệu cũ (PDF hoặc JSONL) của một URL nếu không URL nào khác còn dùng file đó."""
+    if not path or not os.path.exists(path):
+        return
+    if any(entry.get("path") == os.path.basename(path) for other, entry in state.urls.items() if other != url):
+        return
+    os.remove(path)
+    changes["removed"].append(path)
+    print(f"[🗑️] Đã xoá tài liệu cũ: {path}")
+
+
+def sync_result(result: CrawlResult, state: CrawlState, changes: Dict[str, Any], output: str = "pdf") -> None:
+    """
+    Cập nhật tài liệu và trạng thái crawl theo kết quả của một URL: trang không đổi (304 hoặc cùng hash nội dung)
+    thì không ghi lại file, trang đổi thì ghi đè (xoá file cũ nếu tiêu đề đổi làm đổi tên file).
+
+    Args:
+        result: Kết quả crawl
+        state: Trạng thái crawl
+        changes: {"changed", "removed", "failed", "unchanged"}, được cập nhật tại chỗ
+        output: Định dạng tài liệu: 'jsonl' hoặc 'pdf'
+    """
+    previous = state.get(result.url) or {}
+    validators = {
+        "etag": result.etag or previous.get("etag"),
+        "last_modified": result.last_modified or previous.get("last_modified")
+    }
+    if result.changed is False:
+        state.update(result.url, **validators)
+        changes["unchanged"] += 1
+        return
+
+    path = SAVERS[output](result)
+    if path is None:
+        changes["failed"].append(result.url)
+        return
+    state.update(result.url, sha256=result.content_hash, path=os.path.basename(path), **validators)
+    changes["changed"].append(path)
+    if previous.get("path") and previous["path"] != os.path.basename(path):
+        _remove_document(state, result.url, os.path.join(OUTPUT_DIRS[output], previous["path"]), changes)
+
 
 def read_urls_from_file(file_path: str) -> List[str]:
     """
@@ -258,15 +231,63 @@ def read_urls_from_file(file_path: str) -> List[str]:
         print(f"[❌] Lỗi khi đọc file {file_path}: {e}")
         return []
 
-def read_urls_from_file(filepath: str) -> List[str]:
-    with open(filepath, 'r', encoding='utf-8') as f:
-        urls = [line.strip() for line in f if line.strip()]
-    return urls
-
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crawl danh sách URL và lưu nội dung thành corpus JSONL hoặc PDF")
+    parser.add_argument("--urls", default=URL_LIST_FILE, help="File chứa danh sách URL")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("CRAWL_CONCURRENCY", "8")))
+    parser.add_argument("--browsers", type=int, default=int(os.getenv("CRAWL_BROWSERS", "2")),
+                        help="Số Chrome headless tối đa cho trang cần JavaScript (0 để tắt)")
+    parser.add_argument("--per-host", type=int, default=int(os.getenv("CRAWL_PER_HOST", "4")),
+                        help="Số request đồng thời tối đa tới mỗi host")
+    parser.add_argument("--host-delay", type=float, default=float(os.getenv("CRAWL_HOST_DELAY", "0.25")),
+                        help="Khoảng cách tối thiểu (giây) giữa hai request tới cùng host")
+    parser.add_argument("--mode", choices=MODES, default=os.getenv("CRAWL_MODE", "auto"))
+    # Mặc định cùng định dạng với server (DATA_TYPE=pdf, DATA_DIR=.../pdfs); dùng jsonl thì đặt
+    # DATA_TYPE=jsonl và DATA_DIR=data_source/generative_ai/corpus cho server/indexer
+    parser.add_argument("--output", choices=list(OUTPUT_DIRS), default=os.getenv("CRAWL_OUTPUT", "pdf"),
+                        help="pdf: định dạng server đọc mặc định (chỉ giữ ký tự ASCII); "
+                             "jsonl: corpus đọc trực tiếp bằng Loader('jsonl'), cần DATA_TYPE=jsonl")
+    parser.add_argument("--state", default=None, help="File trạng thái crawl (mặc định theo --output)")
+    parser.add_argument("--changes", default=CRAWL_CHANGES_FILE, help="File ghi danh sách tài liệu thay đổi")
+    parser.add_argument("--prune", action="store_true",
+                        help="Xoá tài liệu của các URL đã crawl trước đây nhưng không còn trong danh sách")
+    args = parser.parse_args()
+
     # Load toàn bộ link crawl
-    urls = read_urls_from_file('./data_source/generative_ai/url_list.txt')
+    urls = read_urls_from_file(args.urls)
+
+    output_dir = OUTPUT_DIRS[args.output]
+    # Mỗi định dạng có trạng thái riêng vì tài liệu nằm ở thư mục khác nhau
+    state = CrawlState(args.state or (CRAWL_STATE_FILE if args.output == "pdf" else os.path.join(CORPUS_DIR, "crawl_state.json")))
+    changes: Dict[str, Any] = {"changed": [], "removed": [], "failed": [], "unchanged": 0}
+    # Tài liệu đã bị xoá khỏi đĩa thì crawl lại như URL mới (không gửi GET có điều kiện)
+    for url, entry in list(state.urls.items()):
+        if not os.path.exists(os.path.join(output_dir, entry.get("path") or "")):
+            state.remove(url)
+    if args.prune:
+        for url in set(state.urls) - set(urls):
+            entry = state.remove(url)
+            _remove_document(state, url, os.path.join(output_dir, entry["path"]), changes)
 
-    # load và lưu dữ liệu vào thư mục pdfs
-    for url in urls:
-        save_url_to_pdf(url)
+    # Crawl song song, chỉ ghi lại tài liệu của các trang thay đổi
+    start = time.perf_counter()
+    try:
+        with Crawler(
+            concurrency=args.concurrency,
+            browsers=args.browsers,
+            per_host=args.per_host,
+            host_delay=args.host_delay,
+            mode=args.mode,
+            verify_ssl=False,
+            state=state
+        ) as crawler:
+            for result in crawler.crawl(urls):
+                sync_result(result, state, changes, args.output)
+            stats = crawler.stats
+    finally:
+        state.save()
+        with open(args.changes, "w", encoding="utf-8") as f:
+            json.dump(changes, f, ensure_ascii=False, indent=1)
+    print(f"[✅] Crawl {len(urls)} URL trong {time.perf_counter() - start:.1f}s: "
+          f"{stats['http']} qua HTTP, {stats['browser']} qua trình duyệt, {stats['unchanged']} không đổi, {stats['failed']} lỗi")
+    print(f"[✅] {len(changes['changed'])} tài liệu thay đổi, {len(changes['removed'])} tài liệu bị xoá: {args.changes}")
@@ -2,11 +2,19 @@ from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from dotenv import load_dotenv
 from fastapi.middleware.cors import CORSMiddleware
-from src.rag.chain_rag import build_rag_chain
+from src.rag.chain_rag import build_retrieval_service
+from src.rag.registry import RAGRegistry
 from src.base.llm_model_openrouter import get_openrouter_llm
-from src.rag.source import extract_urls_from_pdf
-from typing import Any, Dict
-from fastapi.responses import RedirectResponse
+from src.rag.source import get_source_links
+from src.base.inference_pool import InferencePool, PoolSaturatedError, InferenceTimeoutError
+from src.base.http_pool import aclose_async_client
+from src.rag.chat_memory import create_history_store
+from src.rag.answer_cache import create_answer_cache
+from src.rag.reranker import CrossEncoderReranker
+from typing import Any, Dict, Optional
+from fastapi.responses import RedirectResponse, StreamingResponse
+import asyncio
+import json
 import os
 
 # Load environment variables
@@ -16,8 +24,38 @@ load_dotenv()
 allowed_origins = os.getenv("ALLOWED_ORIGINS", "").split(",")
 from pathlib import Path
 DATA_DIR = Path(os.getenv("DATA_DIR", "data_source/generative_ai/pdfs")).resolve()
+# "pdf" hoặc "jsonl" (corpus do crawler ghi trực tiếp, ví dụ DATA_DIR=data_source/generative_ai/corpus)
+DATA_TYPE = os.getenv("DATA_TYPE", "pdf")
 supported_models_env = os.getenv("SUPPORTED_MODELS", "")
 SUPPORTED_MODELS = set(model.strip() for model in supported_models_env.split(",") if model.strip())
+CHAT_WORKERS = int(os.getenv("CHAT_WORKERS", "4"))
+CHAT_QUEUE_SIZE = int(os.getenv("CHAT_QUEUE_SIZE", "16"))
+CHAT_TIMEOUT = float(os.getenv("CHAT_TIMEOUT", "60"))
+HISTORY_MAX_TOKENS = int(os.getenv("HISTORY_MAX_TOKENS", "1000"))
+# Token budget for the retrieved context (0 = pass every chunk verbatim), optionally per model:
+# CONTEXT_MAX_TOKENS_BY_MODEL="openai/gpt-4o-mini=6000,meta-llama/llama-3-8b-instruct=2000"
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "3000"))
+# Optional cross-encoder rerank stage, e.g. RERANKER_MODEL=cross-encoder/mmarco-mMiniLMv2-L12-H384-v1 (empty = disabled)
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "")
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "3"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "150"))
+
+def parse_context_budgets(value: str) -> Dict[str, int]:
+    """Parse "model=tokens,..." into a dict, skipping (with a warning) entries that are not model=integer."""
+    budgets = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        model, _, budget = item.rpartition("=")
+        try:
+            if not model.strip():
+                raise ValueError("missing model name")
+            budgets[model.strip()] = int(budget)
+        except ValueError:
+            print(f"⚠️ Ignoring invalid CONTEXT_MAX_TOKENS_BY_MODEL entry: {item.strip()!r} (expected model=tokens)")
+    return budgets
+
+CONTEXT_MAX_TOKENS_BY_MODEL = parse_context_budgets(os.getenv("CONTEXT_MAX_TOKENS_BY_MODEL", ""))
 
 # Initialize FastAPI
 app = FastAPI()
@@ -34,49 +72,167 @@ app.add_middleware(
 class ChatInput(BaseModel):
     message: str
     model: str
+    session_id: Optional[str] = None
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize RAG chains on server startup."""
-    app.state.rag_chains: Dict[str, Any] = {}
-    print(f"DATA_DIR: {DATA_DIR}") 
+    """Initialize the shared retrieval service and one RAG chain per model on server startup."""
+    app.state.inference_pool = InferencePool(
+        max_workers=CHAT_WORKERS,
+        max_queue=CHAT_QUEUE_SIZE,
+        timeout=CHAT_TIMEOUT
+    )
+    app.state.inference_pool.install_as_default_executor()
+    app.state.history_store = create_history_store()
+    app.state.answer_cache = create_answer_cache()
+    app.state.registry = None
+    print(f"DATA_DIR: {DATA_DIR} ({DATA_TYPE})")
+    try:
+        # Embedding model + vector index are loaded once and shared by every model
+        retrieval = build_retrieval_service(data_dir=DATA_DIR, data_type=DATA_TYPE)
+    except Exception as e:
+        print(f"❌ Failed to initialize retrieval: {str(e)}")
+        return
+
+    reranker = None
+    if RERANKER_MODEL:
+        try:
+            reranker = CrossEncoderReranker(RERANKER_MODEL, top_n=RERANK_TOP_N, budget_ms=RERANK_BUDGET_MS)
+            print(f"✅ Reranker loaded: {RERANKER_MODEL}")
+        except Exception as e:
+            print(f"❌ Failed to load reranker {RERANKER_MODEL}: {str(e)}")
+
+    app.state.registry = RAGRegistry(
+        retrieval=retrieval,
+        llm_factory=get_openrouter_llm,
+        history_store=app.state.history_store,
+        history_max_tokens=HISTORY_MAX_TOKENS,
+        answer_cache=app.state.answer_cache,
+        context_max_tokens=CONTEXT_MAX_TOKENS,
+        context_max_tokens_by_model=CONTEXT_MAX_TOKENS_BY_MODEL,
+        reranker=reranker
+    )
     for model in SUPPORTED_MODELS:
         try:
-            llm = get_openrouter_llm(model)
-            chain = build_rag_chain(llm=llm, data_dir=DATA_DIR, data_type="pdf")
-            app.state.rag_chains[model] = chain
+            app.state.registry.add_model(model)
             print(f"✅ RAG chain initialized: {model}")
         except Exception as e:
             print(f"❌ Failed to initialize model {model}: {str(e)}")
 
-@app.post("/api/chat")
-async def chat_with_bot(data: ChatInput):
-    """Handle user chat requests."""
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release the inference worker pool and pooled HTTP connections, persist the query embedding cache."""
+    await aclose_async_client()
+    app.state.inference_pool.shutdown()
+    if getattr(app.state, "registry", None) is not None:
+        try:
+            app.state.registry.retrieval.vectordb.save_query_cache()
+        except Exception as e:
+            print(f"❌ Failed to save embedding cache: {str(e)}")
+
+def get_rag_chain(data: ChatInput):
+    """Validate the chat input and return the RAG chain for the requested model."""
     if not data.message.strip():
         raise HTTPException(status_code=400, detail="Message cannot be empty.")
 
-    chain = app.state.rag_chains.get(data.model)
-    if data.model not in SUPPORTED_MODELS:
+    registry = app.state.registry
+    if registry is None or data.model not in registry:
+        if data.model in SUPPORTED_MODELS:
+            raise HTTPException(status_code=503, detail=f"Model `{data.model}` is not available right now.")
         raise HTTPException(status_code=400, detail=f"Model `{data.model}` is not supported.")
+    return registry.get(data.model)
+
+async def resolve_source_links(sources):
+    """Map the top retrieved source to the links it contains (from ingest metadata, else a cached PDF lookup)."""
+    if not sources:
+        return []
+    links = sources[0].get("links")
+    if links is not None:
+        return [{"url": url} for url in links]
+    return await asyncio.to_thread(get_source_links, sources[0]['url'])
+
+@app.post("/api/chat")
+async def chat_with_bot(data: ChatInput):
+    """Handle user chat requests."""
+    chain = get_rag_chain(data)
+
+    try:
+        result = await app.state.inference_pool.run_async(chain.ainvoke, data.message, data.session_id)
+    except PoolSaturatedError as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy. Please try again later.",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except InferenceTimeoutError:
+        raise HTTPException(status_code=504, detail="The request took too long. Please try again.")
+    except Exception as e:
+        print(f"❌ Error during chat: {str(e)}")
+        return {"reply": "⚠️ Bot is currently unavailable. Please try again later."}
 
     try:
-        result = chain.invoke(data.message)
         if isinstance(result, dict):
             reply = result.get("reply", "")
             sources = result.get("sources", [])
         else:
             reply = str(result)
             sources = []
-        return { "reply": reply, "sources": extract_urls_from_pdf(sources[0]['url']) }
+        return { "reply": reply, "sources": await resolve_source_links(sources) }
 
     except Exception as e:
         error_msg = str(e)
         print(f"❌ Error during chat: {error_msg}")
         return {"reply": "⚠️ Bot is currently unavailable. Please try again later."}
 
+@app.post("/api/chat/stream")
+async def chat_with_bot_stream(data: ChatInput):
+    """Stream the answer as Server-Sent Events: answer deltas first, then the sources."""
+    chain = get_rag_chain(data)
+
+    try:
+        events = app.state.inference_pool.run_stream(chain.astream, data.message, data.session_id)
+    except PoolSaturatedError as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy. Please try again later.",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+    def sse(event: Dict[str, Any]) -> str:
+        return f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+    async def event_stream():
+        try:
+            async for event in events:
+                if event["type"] == "sources":
+                    links = await resolve_source_links(event["sources"])
+                    event = {**event, "sources": links}
+                yield sse(event)
+        except InferenceTimeoutError:
+            yield sse({"type": "error", "message": "The request took too long. Please try again."})
+        except Exception as e:
+            print(f"❌ Error during chat stream: {str(e)}")
+            yield sse({"type": "error", "message": "⚠️ Bot is currently unavailable. Please try again later."})
+        finally:
+            await events.aclose()
+        yield sse({"type": "done"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/health")
 async def health_check():
     return {
         "status": "OK",
-        "rag_initialized": hasattr(app.state, "rag_chains") and bool(app.state.rag_chains)
+        "rag_initialized": getattr(app.state, "registry", None) is not None and len(app.state.registry) > 0,
+        "models": app.state.registry.models() if getattr(app.state, "registry", None) else [],
+        "inference_pool": app.state.inference_pool.stats() if hasattr(app.state, "inference_pool") else None,
+        "history": app.state.history_store.stats() if hasattr(app.state, "history_store") else None,
+        "answer_cache": app.state.answer_cache.stats() if getattr(app.state, "answer_cache", None) else None,
+        "embeddings": app.state.registry.retrieval.vectordb.embedding_stats() if getattr(app.state, "registry", None) is not None else None,
+        "reranker": app.state.registry.reranker.stats() if getattr(app.state, "registry", None) is not None and app.state.registry.reranker is not None else None,
+        "dedup": app.state.registry.retrieval.vectordb.dedup.stats() if getattr(app.state, "registry", None) is not None and app.state.registry.retrieval.vectordb.dedup is not None else None
     }
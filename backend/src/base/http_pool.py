@@ -0,0 +1,156 @@
+import asyncio
+import json
+import os
+import threading
+import logging
+from typing import Any, AsyncIterator, Dict, Optional, Union
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Giới hạn connection pool dùng chung cho mọi request tới OpenRouter
+MAX_CONNECTIONS = int(os.getenv("OPENROUTER_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE = int(os.getenv("OPENROUTER_MAX_KEEPALIVE", "20"))
+KEEPALIVE_EXPIRY = float(os.getenv("OPENROUTER_KEEPALIVE_EXPIRY", "30"))
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+USE_HTTP2 = HTTP2_AVAILABLE and os.getenv("OPENROUTER_HTTP2", "true").lower() != "false"
+
+_sync_session: Optional[requests.Session] = None
+_sync_lock = threading.Lock()
+
+_async_client: Optional[httpx.AsyncClient] = None
+_async_client_loop: Optional[asyncio.AbstractEventLoop] = None
+_async_client_guard: Optional[AsyncIterator[None]] = None
+
+
+def get_sync_session() -> requests.Session:
+    """
+    Lấy requests.Session dùng chung (keep-alive) cho các lời gọi đồng bộ.
+
+    Returns:
+        requests.Session: Session có connection pool giới hạn theo cấu hình
+    """
+    global _sync_session
+    if _sync_session is None:
+        with _sync_lock:
+            if _sync_session is None:
+                session = requests.Session()
+                # pool_connections là số pool theo host (chỉ gọi tới OpenRouter), pool_maxsize là số socket mỗi pool
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_CONNECTIONS)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _sync_session = session
+    return _sync_session
+
+
+async def _close_on_loop_shutdown(client: httpx.AsyncClient) -> AsyncIterator[None]:
+    """
+    Async generator dừng ở `yield` cho tới khi event loop shutdown: `asyncio.run` gọi `shutdown_asyncgens`
+    trước khi đóng loop, nên client được đóng khi loop của nó vẫn còn chạy được.
+    """
+    try:
+        yield
+    finally:
+        if not client.is_closed:
+            await client.aclose()
+
+
+def _close_stale_client(client: httpx.AsyncClient, loop: Optional[asyncio.AbstractEventLoop]) -> None:
+    """Đóng client của event loop cũ trên chính loop đó (transport của client không dùng được từ loop khác)."""
+    if client.is_closed:
+        return
+    if loop is not None and loop.is_running():
+        asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+    else:
+        logger.warning("Event loop cũ đã dừng mà chưa đóng httpx.AsyncClient, các connection sẽ được giải phóng khi GC")
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Lấy httpx.AsyncClient dùng chung cho event loop hiện tại (HTTP/2 nếu có thư viện h2).
+
+    Client bị gắn với event loop tạo ra nó, nên sẽ được tạo lại nếu loop thay đổi
+    (ví dụ khi chạy script bằng nhiều lần `asyncio.run`); client cũ được đóng khi loop của nó shutdown,
+    hoặc ngay trên loop đó nếu loop vẫn đang chạy ở thread khác.
+
+    Returns:
+        httpx.AsyncClient: Client có connection pool giới hạn theo cấu hình
+    """
+    global _async_client, _async_client_loop, _async_client_guard
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client.is_closed or _async_client_loop is not loop:
+        if _async_client is not None:
+            _close_stale_client(_async_client, _async_client_loop)
+        _async_client = httpx.AsyncClient(
+            http2=USE_HTTP2,
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE,
+                keepalive_expiry=KEEPALIVE_EXPIRY
+            )
+        )
+        _async_client_loop = loop
+        # Gọi __anext__ đăng ký generator với loop (asyncgen hook); task chạy nó tới `yield`
+        _async_client_guard = _close_on_loop_shutdown(_async_client)
+        loop.create_task(_async_client_guard.__anext__())
+        logger.info(f"Khởi tạo httpx.AsyncClient (http2={USE_HTTP2}, max_connections={MAX_CONNECTIONS})")
+    return _async_client
+
+
+async def aclose_async_client() -> None:
+    """Đóng AsyncClient dùng chung (gọi khi server shutdown)."""
+    global _async_client, _async_client_loop, _async_client_guard
+    if _async_client is not None and not _async_client.is_closed:
+        await _async_client.aclose()
+    _async_client = None
+    _async_client_loop = None
+    _async_client_guard = None
+
+
+# Giá trị trả về của `parse_sse_line` khi server báo kết thúc stream
+SSE_DONE = object()
+
+
+def parse_sse_line(line: Union[str, bytes]) -> Any:
+    """
+    Phân tích một dòng Server-Sent Events của OpenRouter (`stream: true`).
+
+    Args:
+        line: Một dòng của response (không gồm ký tự xuống dòng)
+
+    Returns:
+        dict JSON của chunk, `SSE_DONE` khi gặp `data: [DONE]`,
+        hoặc None với dòng trống / comment (ví dụ `: OPENROUTER PROCESSING`)
+    """
+    if isinstance(line, bytes):
+        line = line.decode("utf-8")
+    if not line.startswith("data:"):
+        return None
+    data = line[len("data:"):].strip()
+    if data == "[DONE]":
+        return SSE_DONE
+    if not data:
+        return None
+    chunk = json.loads(data)
+    if "error" in chunk:
+        raise ValueError(f"OpenRouter stream error: {chunk['error']}")
+    return chunk
+
+
+def extract_delta(chunk: Dict[str, Any]) -> str:
+    """Lấy phần text mới (delta) từ một chunk chat completion."""
+    choices = chunk.get("choices") or []
+    if not choices:
+        return ""
+    return (choices[0].get("delta") or {}).get("content") or ""
@@ -0,0 +1,311 @@
+import asyncio
+import math
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PoolSaturatedError(Exception):
+    """
+    Hàng đợi của InferencePool đã đầy, request bị từ chối ngay lập tức.
+    """
+    def __init__(self, retry_after: int):
+        super().__init__(f"Inference queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class InferenceTimeoutError(Exception):
+    """
+    Request vượt quá thời hạn (deadline) cho phép.
+    """
+    def __init__(self, timeout: float):
+        super().__init__(f"Inference exceeded deadline of {timeout}s")
+        self.timeout = timeout
+
+
+class InferencePool:
+    """
+    Thread pool có giới hạn để chạy các chain RAG đồng bộ ngoài event loop.
+
+    - Tối đa `max_workers` request chạy song song trên các thread riêng.
+    - Tối đa `max_queue` request chờ; khi đầy sẽ từ chối với `PoolSaturatedError`.
+    - Mỗi request có deadline `timeout` giây tính từ lúc được nhận (gồm cả thời gian chờ).
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 4,
+        max_queue: int = 16,
+        timeout: float = 60.0,
+        retry_after: int = 5
+    ) -> None:
+        """
+        Khởi tạo InferencePool.
+
+        Args:
+            max_workers: Số thread chạy chain đồng thời
+            max_queue: Số request tối đa được phép chờ thread rảnh
+            timeout: Deadline mặc định cho mỗi request (giây)
+            retry_after: Giá trị Retry-After tối thiểu khi từ chối request (giây)
+        """
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix="rag-worker"
+        )
+
+        # Độ trễ được ghi cả từ thread worker (`run`) và slot của stream có thể được trả trong `__del__`
+        # ở bất kỳ thread nào, nên mọi thay đổi bộ đếm/thống kê đều đi qua `_lock`
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.completed = 0
+        self._avg_latency: Optional[float] = None
+
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.max_queue
+
+    def _estimate_retry_after(self) -> int:
+        """Ước lượng thời gian chờ dựa trên độ trễ trung bình và số request đang xử lý."""
+        with self._lock:
+            avg_latency, in_flight = self._avg_latency, self.in_flight
+        if avg_latency is None:
+            return self.retry_after
+        waves = math.ceil(in_flight / self.max_workers)
+        return max(self.retry_after, math.ceil(avg_latency * waves))
+
+    def _record_latency(self, latency: float) -> None:
+        """Cập nhật độ trễ trung bình (EWMA)."""
+        with self._lock:
+            if self._avg_latency is None:
+                self._avg_latency = latency
+            else:
+                self._avg_latency = 0.8 * self._avg_latency + 0.2 * latency
+
+    def _admit(self) -> None:
+        """Nhận request vào một slot, từ chối nếu số request đang xử lý đã chạm giới hạn."""
+        with self._lock:
+            if self.in_flight < self.capacity:
+                self.in_flight += 1
+                return
+            self.rejected += 1
+        raise PoolSaturatedError(self._estimate_retry_after())
+
+    def _release(self) -> None:
+        """Trả slot của một request đã xong."""
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+
+    def _record_timeout(self) -> None:
+        with self._lock:
+            self.timed_out += 1
+
+    async def run(self, func: Callable[..., Any], *args: Any, timeout: Optional[float] = None) -> Any:
+        """
+        Chạy một hàm đồng bộ trên thread pool với kiểm soát hàng đợi và deadline.
+
+        Args:
+            func: Hàm đồng bộ cần chạy (ví dụ `chain.invoke`)
+            *args: Tham số truyền cho hàm
+            timeout: Deadline riêng cho request này (mặc định dùng `self.timeout`)
+
+        Returns:
+            Kết quả của hàm
+
+        Raises:
+            PoolSaturatedError: Khi hàng đợi đã đầy
+            InferenceTimeoutError: Khi vượt quá deadline
+        """
+        self._admit()
+
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+
+        def job():
+            # Bỏ qua request đã hết hạn trong lúc chờ thread rảnh
+            if time.monotonic() >= deadline:
+                raise InferenceTimeoutError(timeout)
+            started = time.monotonic()
+            try:
+                return func(*args)
+            finally:
+                self._record_latency(time.monotonic() - started)
+
+        loop = asyncio.get_running_loop()
+        try:
+            future = loop.run_in_executor(self.executor, job)
+        except BaseException:
+            self._release()
+            raise
+        # Slot chỉ được trả lại khi thread thực sự chạy xong,
+        # kể cả khi client đã nhận lỗi timeout trước đó
+        future.add_done_callback(lambda _: self._release())
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout=timeout)
+        except asyncio.TimeoutError:
+            self._record_timeout()
+            raise InferenceTimeoutError(timeout)
+        except InferenceTimeoutError:
+            self._record_timeout()
+            raise
+
+    async def run_async(
+        self,
+        func: Callable[..., Awaitable[Any]],
+        *args: Any,
+        timeout: Optional[float] = None
+    ) -> Any:
+        """
+        Chạy một coroutine (ví dụ `chain.ainvoke`) với cùng kiểm soát hàng đợi và deadline như `run`.
+
+        Khác với `run`, coroutine bị huỷ thật sự khi hết deadline nên slot được trả lại ngay.
+
+        Args:
+            func: Hàm async cần chạy
+            *args: Tham số truyền cho hàm
+            timeout: Deadline riêng cho request này (mặc định dùng `self.timeout`)
+
+        Returns:
+            Kết quả của coroutine
+        """
+        self._admit()
+
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(func(*args), timeout=timeout)
+            self._record_latency(time.monotonic() - started)
+            return result
+        except asyncio.TimeoutError:
+            self._record_timeout()
+            raise InferenceTimeoutError(timeout)
+        finally:
+            self._release()
+
+    def run_stream(
+        self,
+        func: Callable[..., AsyncIterator[Any]],
+        *args: Any,
+        timeout: Optional[float] = None
+    ) -> "PooledStream":
+        """
+        Nhận một request streaming (ví dụ `rag.astream`) vào pool.
+
+        Việc kiểm tra hàng đợi diễn ra ngay khi gọi hàm (trước khi gửi response),
+        còn deadline được áp dụng cho toàn bộ quá trình stream.
+
+        Args:
+            func: Hàm trả về async iterator
+            *args: Tham số truyền cho hàm
+            timeout: Deadline riêng cho request này (mặc định dùng `self.timeout`)
+
+        Returns:
+            PooledStream: Async iterator trả về các phần tử của stream; slot được trả lại khi stream kết thúc,
+            khi gọi `aclose()` hoặc khi object bị thu hồi (kể cả nếu stream chưa từng được đọc)
+
+        Raises:
+            PoolSaturatedError: Khi hàng đợi đã đầy
+        """
+        self._admit()
+        return PooledStream(self, func, args, self.timeout if timeout is None else timeout)
+
+    def install_as_default_executor(self) -> None:
+        """
+        Dùng thread pool này làm executor mặc định của event loop hiện tại, để các bước
+        đồng bộ trong chain async (FAISS search, embedding) cũng bị giới hạn bởi `max_workers`.
+        """
+        asyncio.get_running_loop().set_default_executor(self.executor)
+
+    def stats(self) -> Dict[str, Any]:
+        """Thống kê trạng thái của pool."""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "in_flight": self.in_flight,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "avg_latency": round(self._avg_latency, 3) if self._avg_latency is not None else None,
+            }
+
+    def shutdown(self) -> None:
+        """Dừng thread pool, không chờ các request đang chạy."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class PooledStream:
+    """
+    Stream đang giữ một slot của InferencePool.
+
+    Slot được lấy trong `run_stream` (để request bị từ chối trước khi gửi response) và trả lại đúng một lần:
+    khi stream chạy xong/lỗi, khi gọi `aclose()`, hoặc khi object bị thu hồi mà chưa từng được đọc
+    (ví dụ client ngắt kết nối trước khi StreamingResponse bắt đầu).
+    """
+
+    def __init__(self, pool: InferencePool, func: Callable[..., AsyncIterator[Any]], args: tuple, timeout: float) -> None:
+        self._pool = pool
+        self._func = func
+        self._args = args
+        self._timeout = timeout
+        self._started = time.monotonic()
+        self._iterator: Optional[AsyncIterator[Any]] = None
+        self._released = False
+
+    def _release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._pool._release()
+
+    async def _iterate(self):
+        deadline = self._started + self._timeout
+        stream = self._func(*self._args)
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise InferenceTimeoutError(self._timeout)
+                try:
+                    item = await asyncio.wait_for(stream.__anext__(), timeout=remaining)
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    raise InferenceTimeoutError(self._timeout)
+                yield item
+            self._pool._record_latency(time.monotonic() - self._started)
+        except InferenceTimeoutError:
+            self._pool._record_timeout()
+            raise
+        finally:
+            await stream.aclose()
+            self._release()
+
+    def __aiter__(self) -> "PooledStream":
+        return self
+
+    async def __anext__(self) -> Any:
+        if self._iterator is None:
+            if self._released:
+                raise StopAsyncIteration
+            self._iterator = self._iterate()
+        return await self._iterator.__anext__()
+
+    async def aclose(self) -> None:
+        """Dừng stream (nếu đang chạy) và trả slot về pool."""
+        if self._iterator is not None:
+            await self._iterator.aclose()
+        self._release()
+
+    def __del__(self) -> None:
+        self._release()
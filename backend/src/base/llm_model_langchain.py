@@ -1,18 +1,28 @@
 import os
-from typing import Any, Dict, List, Mapping, Optional, Union
+from typing import Any, AsyncIterator, Dict, Iterator, List, Mapping, Optional, Union
 from dotenv import load_dotenv
 
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.messages import (
     AIMessage,
+    AIMessageChunk,
     BaseMessage,
     HumanMessage,
     SystemMessage
 )
-from langchain_core.outputs import ChatGeneration, ChatResult
-from langchain_core.callbacks.manager import CallbackManagerForLLMRun
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.callbacks.manager import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun
+)
 
-import requests
+from src.base.http_pool import (
+    SSE_DONE,
+    extract_delta,
+    get_async_client,
+    get_sync_session,
+    parse_sse_line
+)
 
 load_dotenv()
 
@@ -83,14 +93,13 @@ class OpenRouterChat(BaseChatModel):
                 
         return openrouter_messages
     
-    def _generate(
+    def _build_request(
         self,
         messages: List[BaseMessage],
         stop: Optional[List[str]] = None,
-        run_manager: Optional[CallbackManagerForLLMRun] = None,
         **kwargs
-    ) -> ChatResult:
-        """Generate response using OpenRouter API."""
+    ):
+        """Build url, headers and JSON body for the chat completions endpoint."""
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json",
@@ -117,26 +126,39 @@ class OpenRouterChat(BaseChatModel):
                 params[key] = value
         
         url = f"{self.base_url.rstrip('/')}/chat/completions"
+        return url, headers, params
+
+    def _create_chat_result(self, response_data: Dict[str, Any]) -> ChatResult:
+        """Convert an OpenRouter JSON response to a ChatResult."""
+        if not response_data or 'choices' not in response_data or not response_data['choices']:
+            raise ValueError(f"No results found in response: {response_data}")
+        
+        content = response_data["choices"][0]["message"]["content"]
+        
+        message = AIMessage(content=content)
+        generation = ChatGeneration(message=message)
+        
+        return ChatResult(generations=[generation])
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs
+    ) -> ChatResult:
+        """Generate response using OpenRouter API."""
+        url, headers, params = self._build_request(messages, stop, **kwargs)
         
         try:
-            response = requests.post(
+            response = get_sync_session().post(
                 url,
                 headers=headers,
                 json=params,
                 timeout=self.timeout
             )
             response.raise_for_status()
-            response_data = response.json()
-            
-            if not response_data or 'choices' not in response_data or not response_data['choices']:
-                raise ValueError(f"No results found in response: {response_data}")
-            
-            content = response_data["choices"][0]["message"]["content"]
-            
-            message = AIMessage(content=content)
-            generation = ChatGeneration(message=message)
-            
-            return ChatResult(generations=[generation])
+            return self._create_chat_result(response.json())
             
         except Exception as e:
             raise ValueError(f"Error calling OpenRouter API: {str(e)}")
@@ -145,11 +167,94 @@ class OpenRouterChat(BaseChatModel):
         self,
         messages: List[BaseMessage],
         stop: Optional[List[str]] = None,
-        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
         **kwargs: Any,
     ) -> ChatResult:
-        """Async implementation - not implemented yet."""
-        raise NotImplementedError("Async generation not implemented yet")
+        """Generate response asynchronously over the shared httpx connection pool."""
+        url, headers, params = self._build_request(messages, stop, **kwargs)
+
+        try:
+            response = await get_async_client().post(
+                url,
+                headers=headers,
+                json=params,
+                timeout=self.timeout
+            )
+            response.raise_for_status()
+            return self._create_chat_result(response.json())
+
+        except Exception as e:
+            raise ValueError(f"Error calling OpenRouter API: {str(e)}")
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        """Stream response deltas parsed from OpenRouter SSE chunks."""
+        url, headers, params = self._build_request(messages, stop, **kwargs)
+        params["stream"] = True
+
+        try:
+            with get_sync_session().post(
+                url,
+                headers=headers,
+                json=params,
+                timeout=self.timeout,
+                stream=True
+            ) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    chunk = parse_sse_line(line)
+                    if chunk is SSE_DONE:
+                        break
+                    if not chunk:
+                        continue
+                    delta = extract_delta(chunk)
+                    if delta:
+                        if run_manager:
+                            run_manager.on_llm_new_token(delta)
+                        yield ChatGenerationChunk(message=AIMessageChunk(content=delta))
+
+        except Exception as e:
+            raise ValueError(f"Error calling OpenRouter API: {str(e)}")
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        """Stream response deltas asynchronously over the shared httpx connection pool."""
+        url, headers, params = self._build_request(messages, stop, **kwargs)
+        params["stream"] = True
+
+        try:
+            async with get_async_client().stream(
+                "POST",
+                url,
+                headers=headers,
+                json=params,
+                timeout=self.timeout
+            ) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    chunk = parse_sse_line(line)
+                    if chunk is SSE_DONE:
+                        break
+                    if not chunk:
+                        continue
+                    delta = extract_delta(chunk)
+                    if delta:
+                        if run_manager:
+                            await run_manager.on_llm_new_token(delta)
+                        yield ChatGenerationChunk(message=AIMessageChunk(content=delta))
+
+        except Exception as e:
+            raise ValueError(f"Error calling OpenRouter API: {str(e)}")
 
 
 def create_openrouter_chat(
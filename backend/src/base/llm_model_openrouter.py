@@ -1,13 +1,14 @@
-import requests
 import json
 import os
-from typing import Dict, List, Optional, Any, Union
+import threading
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Any, Union
 from langchain_core.runnables import Runnable
 from langchain_core.documents import Document
 from dotenv import load_dotenv
 import time
 load_dotenv()
 from langchain_core.messages import HumanMessage, SystemMessage
+from src.base.http_pool import get_sync_session, get_async_client, parse_sse_line, extract_delta, SSE_DONE
 
 
 class OpenRouterClient:
@@ -30,26 +31,55 @@ class OpenRouterClient:
             "X-Title": "ChatBotAI" 
         }
         self.current_key_index = 0  # Lưu trữ chỉ số key hiện tại
+        # Nhiều request chạy đồng thời (thread pool, event loop) cùng đọc/đổi key hiện tại
+        self._key_lock = threading.Lock()
 
     def get_current_api_key(self):
         """
         Lấy API key hiện tại
         """
-        return self.api_keys[self.current_key_index]
+        with self._key_lock:
+            return self.api_keys[self.current_key_index]
 
     def switch_to_next_key(self):
         """
         Chuyển sang API key tiếp theo trong danh sách
         """
-        self.current_key_index = (self.current_key_index + 1) % len(self.api_keys)
+        with self._key_lock:
+            self.current_key_index = (self.current_key_index + 1) % len(self.api_keys)
 
-    def generate(self, 
+    def _key_order(self) -> List[int]:
+        """
+        Thứ tự key cho một request: bắt đầu từ key hiện tại, mỗi key được thử một lần.
+        Mỗi request giữ thứ tự riêng nên request chạy song song không làm nhau bỏ qua hoặc thử lặp key.
+        """
+        with self._key_lock:
+            start = self.current_key_index
+        return [(start + i) % len(self.api_keys) for i in range(len(self.api_keys))]
+
+    def _mark_key_failed(self, index: int, error: Exception) -> None:
+        """
+        Ghi nhận key bị lỗi và chuyển key hiện tại sang key tiếp theo, trừ khi request khác đã chuyển rồi
+        """
+        print(f"Error with API key {self.api_keys[index]}: {str(error)}")
+        with self._key_lock:
+            if self.current_key_index == index:
+                self.current_key_index = (index + 1) % len(self.api_keys)
+
+    def _headers_for_key(self, index: int) -> Dict[str, str]:
+        """
+        Tạo headers cho API key thứ `index` (bản sao riêng cho từng request)
+        """
+        return {**self.headers, "Authorization": f"Bearer {self.api_keys[index]}"}
+
+    def _build_payload(self,
             model: str,
             prompt: Union[str, List[Dict[str, str]], Document, List[Document]],
-            max_tokens: int = 1024,
-            timeout: int = 60,
+            max_tokens: int,
             **kwargs) -> Dict[str, Any]:
-        
+        """
+        Chuyển prompt thành payload cho endpoint /chat/completions
+        """
         if isinstance(prompt, Document):
             messages = [{"role": "user","content":prompt.page_content}]
         elif isinstance(prompt, list) and all(isinstance(p, Document) for p in prompt):
@@ -61,23 +91,30 @@ class OpenRouterClient:
         else:
             raise ValueError("Prompt phải là chuỗi, danh sách messages, Document hoặc danh sách Document")
 
-        payload = {
+        return {
             "model": model,
             "messages": messages,
             "max_tokens": max_tokens,
             **kwargs
         }
 
+    def generate(self, 
+            model: str,
+            prompt: Union[str, List[Dict[str, str]], Document, List[Document]],
+            max_tokens: int = 1024,
+            timeout: int = 60,
+            **kwargs) -> Dict[str, Any]:
+        
+        payload = self._build_payload(model, prompt, max_tokens, **kwargs)
         full_url = f"{self.base_url}/chat/completions"
+        session = get_sync_session()
         
-        while True:
+        for index in self._key_order():
             try:
-                # Sử dụng API key hiện tại
-                self.headers["Authorization"] = f"Bearer {self.get_current_api_key()}"
-
-                response = requests.post(
+                # Connection được tái sử dụng qua session dùng chung
+                response = session.post(
                     full_url,
-                    headers=self.headers,
+                    headers=self._headers_for_key(index),
                     json=payload,
                     timeout=timeout
                 )
@@ -85,12 +122,120 @@ class OpenRouterClient:
                 return response.json()
             
             except Exception as e:
-                print(f"Error with API key {self.get_current_api_key()}: {str(e)}")
-                self.switch_to_next_key()  # Chuyển sang key tiếp theo
-                if self.current_key_index == 0:
-                    # Nếu đã quay lại key đầu tiên, dừng lại
-                    raise Exception("All API keys failed. Please check your keys and try again.")
+                self._mark_key_failed(index, e)  # Chuyển sang key tiếp theo
+        # Đã thử hết các key
+        raise Exception("All API keys failed. Please check your keys and try again.")
+
+    async def agenerate(self,
+            model: str,
+            prompt: Union[str, List[Dict[str, str]], Document, List[Document]],
+            max_tokens: int = 1024,
+            timeout: int = 60,
+            **kwargs) -> Dict[str, Any]:
+        """
+        Phiên bản bất đồng bộ của `generate`, dùng httpx.AsyncClient với connection pool dùng chung
+        """
+        payload = self._build_payload(model, prompt, max_tokens, **kwargs)
+        full_url = f"{self.base_url}/chat/completions"
+        client = get_async_client()
+
+        for index in self._key_order():
+            try:
+                response = await client.post(
+                    full_url,
+                    headers=self._headers_for_key(index),
+                    json=payload,
+                    timeout=timeout
+                )
+                response.raise_for_status()
+                return response.json()
+
+            except Exception as e:
+                self._mark_key_failed(index, e)
+        raise Exception("All API keys failed. Please check your keys and try again.")
+
+
+    def stream(self,
+            model: str,
+            prompt: Union[str, List[Dict[str, str]], Document, List[Document]],
+            max_tokens: int = 1024,
+            timeout: int = 60,
+            **kwargs) -> Iterator[str]:
+        """
+        Gọi API với `stream: true` và trả về từng đoạn text (delta) ngay khi nhận được
+        """
+        payload = self._build_payload(model, prompt, max_tokens, stream=True, **kwargs)
+        full_url = f"{self.base_url}/chat/completions"
+        session = get_sync_session()
+
+        for index in self._key_order():
+            try:
+                response = session.post(
+                    full_url,
+                    headers=self._headers_for_key(index),
+                    json=payload,
+                    timeout=timeout,
+                    stream=True
+                )
+                response.raise_for_status()
+                break
+            except Exception as e:
+                self._mark_key_failed(index, e)
+        else:
+            raise Exception("All API keys failed. Please check your keys and try again.")
 
+        # Chỉ đổi key khi chưa nhận được dữ liệu; lỗi giữa stream được trả thẳng cho caller
+        with response:
+            for line in response.iter_lines():
+                chunk = parse_sse_line(line)
+                if chunk is SSE_DONE:
+                    break
+                if chunk:
+                    delta = extract_delta(chunk)
+                    if delta:
+                        yield delta
+
+    async def astream(self,
+            model: str,
+            prompt: Union[str, List[Dict[str, str]], Document, List[Document]],
+            max_tokens: int = 1024,
+            timeout: int = 60,
+            **kwargs) -> AsyncIterator[str]:
+        """
+        Phiên bản bất đồng bộ của `stream`
+        """
+        payload = self._build_payload(model, prompt, max_tokens, stream=True, **kwargs)
+        full_url = f"{self.base_url}/chat/completions"
+        client = get_async_client()
+
+        for index in self._key_order():
+            request = client.build_request(
+                "POST",
+                full_url,
+                headers=self._headers_for_key(index),
+                json=payload,
+                timeout=timeout
+            )
+            try:
+                response = await client.send(request, stream=True)
+                response.raise_for_status()
+                break
+            except Exception as e:
+                self._mark_key_failed(index, e)
+        else:
+            raise Exception("All API keys failed. Please check your keys and try again.")
+
+        try:
+            async for line in response.aiter_lines():
+                chunk = parse_sse_line(line)
+                if chunk is SSE_DONE:
+                    break
+                if chunk:
+                    delta = extract_delta(chunk)
+                    if delta:
+                        yield delta
+        finally:
+            await response.aclose()
 
 
 class OpenRouterRunnable(Runnable):
@@ -100,28 +245,29 @@ class OpenRouterRunnable(Runnable):
         self.max_tokens = max_tokens
         self.kwargs = kwargs
 
+    def _to_messages(self, input: Any) -> List[Dict[str, str]]:
+        # Nếu input là ChatPromptValue, convert sang messages
+        if hasattr(input, "to_messages"):
+            messages_obj = input.to_messages()
+            return [
+                {
+                    "role": "system" if isinstance(msg, SystemMessage) else "user",
+                    "content": msg.content
+                }
+                for msg in messages_obj
+            ]
+        elif isinstance(input, list) and all(isinstance(msg, dict) for msg in input):
+            return input  # Đã là định dạng đúng
+        elif isinstance(input, str):
+            return [{"role": "user", "content": input}]
+        else:
+            raise ValueError("Invalid input format - expected ChatPromptValue with .to_messages() method")
+
     def invoke(self, input: Any, config: Optional[Dict] = None) -> str:
         try:
-            # Nếu input là ChatPromptValue, convert sang messages
-            if hasattr(input, "to_messages"):
-                messages_obj = input.to_messages()
-                messages = [
-                    {
-                        "role": "system" if isinstance(msg, SystemMessage) else "user",
-                        "content": msg.content
-                    }
-                    for msg in messages_obj
-                ]
-            elif isinstance(input, list) and all(isinstance(msg, dict) for msg in input):
-                messages = input  # Đã là định dạng đúng
-            elif isinstance(input, str):
-                messages = [{"role": "user", "content": input}]
-            else:
-                raise ValueError("Invalid input format - expected ChatPromptValue with .to_messages() method")
-
             response = self.client.generate(
                 model=self.model,
-                prompt=messages,
+                prompt=self._to_messages(input),
                 max_tokens=self.max_tokens,
                 **self.kwargs
             )
@@ -130,6 +276,38 @@ class OpenRouterRunnable(Runnable):
         except Exception as e:
             raise ValueError(f"API call failed: {str(e)}")
 
+    async def ainvoke(self, input: Any, config: Optional[Dict] = None, **kwargs: Any) -> str:
+        # `abatch` của Runnable sẽ gọi lại hàm này với giới hạn max_concurrency trong config
+        try:
+            response = await self.client.agenerate(
+                model=self.model,
+                prompt=self._to_messages(input),
+                max_tokens=self.max_tokens,
+                **self.kwargs
+            )
+
+            return response["choices"][0]["message"]["content"]
+        except Exception as e:
+            raise ValueError(f"API call failed: {str(e)}")
+
+    def stream(self, input: Any, config: Optional[Dict] = None, **kwargs: Any) -> Iterator[str]:
+        # Trả về từng delta thay vì chờ toàn bộ câu trả lời (Runnable mặc định chỉ yield một lần)
+        yield from self.client.stream(
+            model=self.model,
+            prompt=self._to_messages(input),
+            max_tokens=self.max_tokens,
+            **self.kwargs
+        )
+
+    async def astream(self, input: Any, config: Optional[Dict] = None, **kwargs: Any) -> AsyncIterator[str]:
+        async for delta in self.client.astream(
+            model=self.model,
+            prompt=self._to_messages(input),
+            max_tokens=self.max_tokens,
+            **self.kwargs
+        ):
+            yield delta
+
 
 def get_openrouter_llm(model_name: str = "google/gemma-3-27b-it:free", 
                     api_keys: Optional[List[str]] = None,
@@ -0,0 +1,48 @@
+"""
+Corpus JSONL cho các trang đã crawl: mỗi dòng một bản ghi
+
+    {"url", "title", "headings": [{"level", "text"}], "text", "links", "content_hash", "crawled_at"}
+
+giữ nguyên Unicode (tiếng Việt) và được `Loader('jsonl')` đọc trực tiếp, không qua PDF.
+"""
+
+import json
+import os
+import time
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator
+
+if TYPE_CHECKING:
+    from src.crawl.engine import CrawlResult
+
+
+def result_to_record(result: "CrawlResult") -> Dict[str, Any]:
+    return {
+        "url": result.url,
+        "title": result.title,
+        "headings": result.headings,
+        "text": result.text,
+        "links": result.links,
+        "content_hash": result.content_hash,
+        "crawled_at": time.time()
+    }
+
+
+def write_records(path: str, records: Iterable[Dict[str, Any]]) -> None:
+    """Ghi các bản ghi vào file JSONL (ghi file tạm rồi thay thế)."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False))
+            f.write("\n")
+    os.replace(tmp_path, path)
+
+
+def read_records(path: str) -> Iterator[Dict[str, Any]]:
+    """Đọc lần lượt các bản ghi trong file JSONL (bỏ qua dòng trống)."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
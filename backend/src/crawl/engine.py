@@ -0,0 +1,462 @@
+"""
+Crawl engine: tải nhiều URL song song với giới hạn theo host.
+
+- Đường nhanh HTTP: tải HTML bằng requests (keep-alive) và trích nội dung bằng BeautifulSoup.
+- Trang cần JavaScript (đường nhanh lấy được quá ít text) được render bằng một pool Chrome headless
+  dùng lại giữa các URL, chờ trang sẵn sàng (readyState + chiều cao/độ dài text ổn định) thay vì sleep cố định.
+- Có `CrawlState`: GET có điều kiện theo ETag/Last-Modified (304 thì không tải/render lại) và so hash
+  nội dung để biết trang nào thật sự thay đổi.
+"""
+
+import os
+import queue
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+from urllib.parse import urldefrag, urljoin, urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup
+
+from src.crawl.state import CrawlState, content_sha256
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+USER_AGENT = os.getenv(
+    "CRAWL_USER_AGENT",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36"
+)
+MODES = ("auto", "http", "browser")
+
+# Các vùng nội dung chính, theo thứ tự ưu tiên
+CONTENT_SELECTORS = [
+    "article", "main", "#content", ".content",
+    "div[class*=article]", "div[class*=post]", "section[class*=main]", "div[class*=main]"
+]
+DROP_TAGS = ["script", "style", "noscript", "iframe", "svg"]
+HEADING_TAGS = ["h1", "h2", "h3", "h4", "h5", "h6"]
+
+
+@dataclass
+class PageContent:
+    """Nội dung đã trích xuất từ một trang HTML."""
+    title: str = ""
+    text: str = ""
+    # {"level": 1-6, "text": ...} theo thứ tự xuất hiện
+    headings: List[Dict[str, Any]] = field(default_factory=list)
+    links: List[str] = field(default_factory=list)
+
+
+@dataclass
+class CrawlResult:
+    """Kết quả crawl một URL."""
+    url: str
+    title: str = ""
+    text: str = ""
+    headings: List[Dict[str, Any]] = field(default_factory=list)
+    links: List[str] = field(default_factory=list)
+    status: Optional[int] = None
+    fetched_via: str = ""
+    elapsed: float = 0.0
+    error: Optional[str] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_hash: Optional[str] = None
+    # None: không có CrawlState để so sánh
+    changed: Optional[bool] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and bool(self.text)
+
+    @property
+    def not_modified(self) -> bool:
+        return self.status == 304
+
+    def set_content(self, content: PageContent) -> None:
+        self.title = content.title
+        self.text = content.text
+        self.headings = content.headings
+        self.links = content.links
+
+
+def extract_content(html: Union[str, bytes], base_url: str = "") -> PageContent:
+    """
+    Lấy tiêu đề, nội dung chính (giữ xuống dòng theo heading/đoạn/mục danh sách), các heading và
+    các link trong nội dung chính từ HTML.
+
+    Args:
+        html: HTML dạng str hoặc bytes (bytes để BeautifulSoup tự nhận charset)
+        base_url: URL của trang, để chuyển link tương đối thành tuyệt đối
+
+    Returns:
+        PageContent: Nội dung đã bỏ dòng trùng lặp, heading và link http(s) không trùng lặp
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    title = soup.title.get_text(strip=True) if soup.title else ""
+    for tag in soup.find_all(DROP_TAGS):
+        tag.decompose()
+
+    main_content = None
+    for selector in CONTENT_SELECTORS:
+        elements = soup.select(selector)
+        if elements:
+            main_content = max(elements, key=lambda e: len(e.get_text(strip=True)))
+            break
+    if main_content is None or len(main_content.get_text(strip=True)) < 100:
+        main_content = soup.body or soup
+
+    headings = []
+    for header in main_content.find_all(HEADING_TAGS):
+        heading = " ".join(header.get_text(separator=" ").split())
+        if heading:
+            headings.append({"level": int(header.name[1]), "text": heading})
+        header.insert_before("\n\n")
+        header.insert_after("\n")
+    for p in main_content.find_all("p"):
+        p.insert_after("\n")
+    for li in main_content.find_all("li"):
+        li.insert_before("• ")
+        li.insert_after("\n")
+
+    links = {}
+    for anchor in main_content.find_all("a", href=True):
+        link = urldefrag(urljoin(base_url, anchor["href"].strip())).url
+        if urlparse(link).scheme in ("http", "https"):
+            links[link] = None
+
+    lines = []
+    seen = set()
+    for line in main_content.get_text(separator=" ").split("\n"):
+        line = " ".join(line.split())
+        if line and line not in seen:
+            lines.append(line)
+            seen.add(line)
+    return PageContent(title=title, text="\n".join(lines), headings=headings, links=list(links))
+
+
+class HostLimiter:
+    """Giới hạn số request đồng thời và khoảng cách tối thiểu giữa hai request tới cùng một host."""
+
+    def __init__(self, per_host: int = 4, delay: float = 0.25) -> None:
+        """
+        Args:
+            per_host: Số request đồng thời tối đa tới mỗi host
+            delay: Khoảng cách tối thiểu (giây) giữa thời điểm bắt đầu hai request tới cùng host
+        """
+        self.per_host = per_host
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._next_start: Dict[str, float] = {}
+
+    @contextmanager
+    def slot(self, url: str) -> Iterator[None]:
+        host = urlparse(url).netloc
+        with self._lock:
+            semaphore = self._semaphores.setdefault(host, threading.BoundedSemaphore(self.per_host))
+        semaphore.acquire()
+        try:
+            with self._lock:
+                now = time.monotonic()
+                start = max(now, self._next_start.get(host, 0.0))
+                self._next_start[host] = start + self.delay
+            if start > now:
+                time.sleep(start - now)
+            yield
+        finally:
+            semaphore.release()
+
+
+class BrowserPool:
+    """
+    Pool Chrome headless sống lâu, tạo khi cần tới tối đa `size` trình duyệt và dùng lại giữa các URL.
+    Trình duyệt gặp lỗi bị đóng và sẽ được tạo mới ở lần dùng sau.
+    """
+
+    def __init__(self, size: int = 2, page_load_timeout: float = 30, user_agent: str = USER_AGENT) -> None:
+        """
+        Args:
+            size: Số trình duyệt tối đa
+            page_load_timeout: Thời gian tối đa (giây) để tải một trang
+            user_agent: User-Agent của trình duyệt
+        """
+        self.size = size
+        self.page_load_timeout = page_load_timeout
+        self.user_agent = user_agent
+        self._available = threading.BoundedSemaphore(size)
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._drivers: List[Any] = []
+        self._lock = threading.Lock()
+
+    def _create(self) -> Any:
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+
+        options = Options()
+        options.add_argument("--headless=new")
+        options.add_argument("--no-sandbox")
+        options.add_argument("--disable-dev-shm-usage")
+        options.add_argument("--blink-settings=imagesEnabled=false")
+        options.add_argument(f"user-agent={self.user_agent}")
+        # Trả về khi DOM sẵn sàng; phần còn lại do wait_until_ready chờ
+        options.page_load_strategy = "eager"
+        driver = webdriver.Chrome(options=options)
+        driver.set_page_load_timeout(self.page_load_timeout)
+        with self._lock:
+            self._drivers.append(driver)
+        logger.info(f"Khởi tạo trình duyệt {len(self._drivers)}/{self.size}")
+        return driver
+
+    def _discard(self, driver: Any) -> None:
+        with self._lock:
+            if driver in self._drivers:
+                self._drivers.remove(driver)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    @contextmanager
+    def driver(self) -> Iterator[Any]:
+        self._available.acquire()
+        try:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                driver = self._create()
+            try:
+                yield driver
+            except BaseException:
+                self._discard(driver)
+                raise
+            self._idle.put(driver)
+        finally:
+            self._available.release()
+
+    def close(self) -> None:
+        with self._lock:
+            drivers, self._drivers = self._drivers, []
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+        self._idle = queue.LifoQueue()
+
+
+def wait_until_ready(driver: Any, timeout: float = 10, settle_timeout: float = 5, poll: float = 0.25) -> None:
+    """
+    Chờ trang render xong: document.readyState khác 'loading', rồi cuộn xuống cuối trang (kích hoạt
+    lazy-load) cho tới khi chiều cao trang và độ dài text không đổi giữa hai lần kiểm tra.
+
+    Args:
+        driver: Selenium WebDriver đã mở trang
+        timeout: Thời gian chờ tối đa (giây) cho readyState
+        settle_timeout: Thời gian chờ tối đa (giây) để nội dung ổn định
+        poll: Khoảng cách (giây) giữa hai lần kiểm tra
+    """
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    WebDriverWait(driver, timeout, poll_frequency=poll).until(
+        lambda d: d.execute_script("return document.readyState") != "loading"
+    )
+    deadline = time.monotonic() + settle_timeout
+    last = None
+    while time.monotonic() < deadline:
+        state = driver.execute_script(
+            "window.scrollTo(0, document.body.scrollHeight);"
+            "return [document.body.scrollHeight, document.body.innerText.length];"
+        )
+        if state == last:
+            return
+        last = state
+        time.sleep(poll)
+
+
+class Crawler:
+    """
+    Crawl một danh sách URL song song.
+
+    Mỗi URL đi qua đường nhanh HTTP trước (mode 'auto'); nếu nội dung lấy được ít hơn `min_text_chars`
+    ký tự (trang render bằng JavaScript) thì render lại bằng trình duyệt trong pool. Mode 'http' chỉ dùng
+    đường nhanh, mode 'browser' luôn render bằng trình duyệt.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = 8,
+        browsers: int = 2,
+        per_host: int = 4,
+        host_delay: float = 0.25,
+        mode: str = "auto",
+        timeout: float = 30,
+        min_text_chars: int = 200,
+        settle_timeout: float = 5,
+        verify_ssl: bool = True,
+        user_agent: str = USER_AGENT,
+        state: Optional[CrawlState] = None
+    ) -> None:
+        """
+        Args:
+            concurrency: Số URL xử lý đồng thời
+            browsers: Số trình duyệt tối đa trong pool (0 để tắt trình duyệt)
+            per_host: Số request đồng thời tối đa tới mỗi host
+            host_delay: Khoảng cách tối thiểu (giây) giữa hai request tới cùng host
+            mode: 'auto', 'http' hoặc 'browser'
+            timeout: Thời gian tối đa (giây) cho mỗi request/lần tải trang
+            min_text_chars: Số ký tự tối thiểu để chấp nhận kết quả đường nhanh ở mode 'auto'
+            settle_timeout: Thời gian chờ tối đa (giây) để trang render xong
+            verify_ssl: Kiểm tra chứng chỉ SSL ở đường nhanh
+            user_agent: User-Agent cho cả HTTP và trình duyệt
+            state: Trạng thái lần crawl trước, để gửi GET có điều kiện và đánh dấu `CrawlResult.changed`
+        """
+        if mode not in MODES:
+            raise ValueError(f"Mode crawl không hợp lệ: {mode} (hỗ trợ {', '.join(MODES)})")
+        if mode == "browser" and browsers < 1:
+            raise ValueError("Mode 'browser' cần ít nhất 1 trình duyệt")
+        self.concurrency = concurrency
+        self.mode = mode
+        self.timeout = timeout
+        self.min_text_chars = min_text_chars
+        self.settle_timeout = settle_timeout
+        self.verify_ssl = verify_ssl
+        self.state = state
+        self.limiter = HostLimiter(per_host, host_delay)
+        self.browser_pool = BrowserPool(browsers, timeout, user_agent) if mode != "http" and browsers > 0 else None
+        self._browser_error: Optional[str] = None
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"User-Agent": user_agent, "Accept-Language": "vi,en;q=0.8"})
+
+        self.stats = {"http": 0, "browser": 0, "unchanged": 0, "failed": 0}
+        self._stats_lock = threading.Lock()
+
+    def fetch_http(self, url: str, result: CrawlResult) -> None:
+        headers = self.state.conditional_headers(url) if self.state is not None else {}
+        with self.limiter.slot(url):
+            response = self.session.get(url, headers=headers, timeout=self.timeout, verify=self.verify_ssl)
+        result.status = response.status_code
+        result.fetched_via = "http"
+        result.etag = response.headers.get("ETag")
+        result.last_modified = response.headers.get("Last-Modified")
+        if response.status_code == 304:
+            return
+        if response.status_code >= 400:
+            result.error = f"HTTP {response.status_code}"
+            return
+        # bytes: để BeautifulSoup đọc charset trong <meta> thay vì mặc định ISO-8859-1 của requests
+        result.set_content(extract_content(response.content, base_url=response.url))
+
+    def fetch_browser(self, url: str, result: CrawlResult) -> None:
+        with self.browser_pool.driver() as driver:
+            with self.limiter.slot(url):
+                driver.get(url)
+            wait_until_ready(driver, timeout=self.timeout, settle_timeout=self.settle_timeout)
+            content = extract_content(driver.page_source, base_url=driver.current_url)
+            content.title = driver.title or content.title
+            result.set_content(content)
+        result.error = None
+        result.fetched_via = "browser"
+
+    def _needs_browser(self, result: CrawlResult) -> bool:
+        if self.browser_pool is None or self._browser_error is not None:
+            return False
+        if self.mode == "browser":
+            return True
+        return result.error is None and not result.not_modified and len(result.text) < self.min_text_chars
+
+    def _compare(self, result: CrawlResult) -> None:
+        """Tính hash nội dung và so với lần crawl trước (304 coi như không đổi)."""
+        if result.not_modified:
+            result.changed = False
+            return
+        if not result.ok:
+            return
+        result.content_hash = content_sha256(result.title, result.text, *result.links)
+        if self.state is not None:
+            entry = self.state.get(result.url)
+            result.changed = entry is None or entry.get("sha256") != result.content_hash
+
+    def fetch(self, url: str) -> CrawlResult:
+        """
+        Crawl một URL, không ném exception (lỗi được ghi vào `CrawlResult.error`).
+
+        Args:
+            url: URL cần crawl
+
+        Returns:
+            CrawlResult: Kết quả crawl
+        """
+        start = time.perf_counter()
+        result = CrawlResult(url)
+        try:
+            if self.mode != "browser":
+                self.fetch_http(url, result)
+            if self._needs_browser(result):
+                try:
+                    self.fetch_browser(url, result)
+                except ImportError as e:
+                    # Không có selenium: giữ kết quả đường nhanh cho các URL còn lại
+                    self._browser_error = str(e)
+                    logger.warning(f"Không thể dùng trình duyệt ({e}), chỉ crawl bằng HTTP")
+                    if self.mode == "browser":
+                        raise
+            self._compare(result)
+        except Exception as e:
+            result.error = f"{type(e).__name__}: {e}"
+        result.elapsed = time.perf_counter() - start
+
+        with self._stats_lock:
+            if result.changed is False:
+                self.stats["unchanged"] += 1
+            elif not result.ok:
+                self.stats["failed"] += 1
+            else:
+                self.stats[result.fetched_via] += 1
+        return result
+
+    def crawl(self, urls: Iterable[str]) -> Iterator[CrawlResult]:
+        """
+        Crawl các URL (bỏ URL trùng) song song, trả kết quả theo thứ tự hoàn thành.
+
+        Args:
+            urls: Danh sách URL
+
+        Yields:
+            CrawlResult: Kết quả của từng URL
+        """
+        urls = list(dict.fromkeys(urls))
+        start = time.perf_counter()
+        executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="crawl")
+        try:
+            futures = [executor.submit(self.fetch, url) for url in urls]
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+        logger.info(
+            f"Crawl {len(urls)} URL trong {time.perf_counter() - start:.1f}s: "
+            f"{self.stats['http']} qua HTTP, {self.stats['browser']} qua trình duyệt, "
+            f"{self.stats['unchanged']} không đổi, {self.stats['failed']} lỗi"
+        )
+
+    def close(self) -> None:
+        self.session.close()
+        if self.browser_pool is not None:
+            self.browser_pool.close()
+
+    def __enter__(self) -> "Crawler":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
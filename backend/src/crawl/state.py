@@ -0,0 +1,83 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import logging
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+CRAWL_STATE_VERSION = 1
+
+
+def content_sha256(*parts: str) -> str:
+    """Hash SHA-256 của nội dung đã trích xuất (tiêu đề, text, ...)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class CrawlState:
+    """
+    Trạng thái crawl của từng URL, dùng để crawl lại có điều kiện (If-None-Match / If-Modified-Since)
+    và chỉ ghi lại tài liệu khi nội dung thật sự thay đổi.
+
+    Cấu trúc file JSON:
+        {"version": 1, "urls": {url: {"etag", "last_modified", "sha256", "path", "crawled_at"}}}
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Args:
+            path: Đường dẫn file trạng thái
+        """
+        self.path = path
+        self.urls: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            self.load()
+
+    def load(self) -> None:
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != CRAWL_STATE_VERSION:
+            logger.warning(f"Trạng thái crawl {self.path} có phiên bản không hỗ trợ, bỏ qua")
+            return
+        self.urls = data.get("urls", {})
+
+    def save(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with self._lock:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": CRAWL_STATE_VERSION, "urls": self.urls}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self.urls.get(url)
+            return dict(entry) if entry else None
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        """Header cho GET có điều kiện từ ETag/Last-Modified của lần crawl trước (rỗng nếu chưa có)."""
+        entry = self.get(url)
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def update(self, url: str, **fields: Any) -> None:
+        with self._lock:
+            entry = self.urls.setdefault(url, {})
+            entry.update(fields, crawled_at=time.time())
+
+    def remove(self, url: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self.urls.pop(url, None)
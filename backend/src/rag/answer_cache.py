@@ -0,0 +1,203 @@
+import hashlib
+import os
+import re
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_question(question: str) -> str:
+    """Chuẩn hoá câu hỏi để so khớp: chữ thường, gộp khoảng trắng, bỏ dấu câu ở cuối."""
+    question = re.sub(r"\s+", " ", question.strip().lower())
+    return question.rstrip(" ?!.…")
+
+
+def fingerprint_documents(docs: Iterable[Document]) -> str:
+    """Dấu vân tay của tập chunk được retrieve (nguồn + nội dung, giữ thứ tự)."""
+    digest = hashlib.sha1()
+    for doc in docs:
+        digest.update(str(doc.metadata.get("source", "")).encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(doc.page_content.encode("utf-8"))
+        digest.update(b"\1")
+    return digest.hexdigest()
+
+
+class AnswerCache:
+    """
+    Cache câu trả lời của LLM gồm hai tầng:
+
+    - Exact: khoá là (model, câu hỏi đã chuẩn hoá, fingerprint các chunk được retrieve).
+    - Semantic: dùng lại câu trả lời của câu hỏi có embedding gần (cosine >= ngưỡng) trên cùng model.
+
+    Các entry bị loại theo LRU/TTL và toàn bộ cache bị xoá khi phiên bản vector index thay đổi.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        ttl: Optional[float] = 3600,
+        semantic_threshold: Optional[float] = 0.95
+    ) -> None:
+        """
+        Khởi tạo AnswerCache.
+
+        Args:
+            max_entries: Số câu trả lời tối đa được giữ
+            ttl: Thời gian sống của mỗi entry (giây), None để không hết hạn
+            semantic_threshold: Ngưỡng cosine cho tầng semantic, None để tắt tầng này
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.semantic_threshold = semantic_threshold
+        self.index_version: Any = None
+        self._entries: "OrderedDict[Tuple[str, str, str], Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_index_version(self, index_version: Any) -> None:
+        if index_version != self.index_version:
+            if self._entries:
+                self.invalidations += 1
+                logger.info("Vector index đã thay đổi, xoá answer cache")
+            self._entries.clear()
+            self.index_version = index_version
+
+    def _is_expired(self, entry: Dict[str, Any], now: float) -> bool:
+        return self.ttl is not None and now - entry["created"] >= self.ttl
+
+    def _semantic_lookup(self, model: str, query_vector: List[float], now: float) -> Optional[Dict[str, Any]]:
+        keys, vectors = [], []
+        for key, entry in self._entries.items():
+            if key[0] == model and entry["vector"] is not None and not self._is_expired(entry, now):
+                keys.append(key)
+                vectors.append(entry["vector"])
+        if not vectors:
+            return None
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        similarities = np.stack(vectors) @ query
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.semantic_threshold:
+            return None
+        self._entries.move_to_end(keys[best])
+        return self._entries[keys[best]]
+
+    def get(
+        self,
+        model: str,
+        question: str,
+        fingerprint: str,
+        query_vector: Optional[List[float]] = None,
+        index_version: Any = None
+    ) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """
+        Tìm câu trả lời đã cache.
+
+        Args:
+            model: Tên model (câu trả lời không dùng chung giữa các model)
+            question: Câu hỏi gốc
+            fingerprint: Fingerprint các chunk được retrieve (`fingerprint_documents`)
+            query_vector: Embedding của câu hỏi, cần cho tầng semantic
+            index_version: Phiên bản vector index hiện tại
+
+        Returns:
+            (tầng cache 'exact' | 'semantic', giá trị đã lưu) hoặc None nếu miss
+        """
+        with self._lock:
+            self._check_index_version(index_version)
+            now = time.monotonic()
+            key = (model, normalize_question(question), fingerprint)
+            entry = self._entries.get(key)
+            if entry is not None:
+                if not self._is_expired(entry, now):
+                    self._entries.move_to_end(key)
+                    self.exact_hits += 1
+                    return "exact", entry["value"]
+                del self._entries[key]
+
+            if self.semantic_threshold is not None and query_vector is not None:
+                entry = self._semantic_lookup(model, query_vector, now)
+                if entry is not None:
+                    self.semantic_hits += 1
+                    return "semantic", entry["value"]
+
+            self.misses += 1
+            return None
+
+    def put(
+        self,
+        model: str,
+        question: str,
+        fingerprint: str,
+        value: Dict[str, Any],
+        query_vector: Optional[List[float]] = None,
+        index_version: Any = None
+    ) -> None:
+        """Lưu câu trả lời vào cache (tham số giống `get`)."""
+        vector = None
+        if query_vector is not None:
+            vector = np.asarray(query_vector, dtype=np.float32)
+            vector = vector / (np.linalg.norm(vector) or 1.0)
+
+        with self._lock:
+            self._check_index_version(index_version)
+            key = (model, normalize_question(question), fingerprint)
+            self._entries[key] = {"value": value, "vector": vector, "created": time.monotonic()}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self) -> None:
+        """Xoá toàn bộ cache."""
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Số entry và số lần hit/miss theo từng tầng."""
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.exact_hits + self.semantic_hits) / lookups, 3) if lookups else None,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations
+        }
+
+
+def create_answer_cache() -> Optional[AnswerCache]:
+    """
+    Tạo answer cache theo biến môi trường.
+
+    ANSWER_CACHE_ENABLED (mặc định true), ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL (giây, 0 = không hết hạn),
+    ANSWER_CACHE_SEMANTIC_THRESHOLD (0 để tắt tầng semantic)
+
+    Returns:
+        AnswerCache hoặc None nếu cache bị tắt
+    """
+    if os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "false":
+        return None
+    threshold = float(os.getenv("ANSWER_CACHE_SEMANTIC_THRESHOLD", "0.95"))
+    return AnswerCache(
+        max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "1000")),
+        ttl=float(os.getenv("ANSWER_CACHE_TTL", "3600")) or None,
+        semantic_threshold=threshold or None
+    )
@@ -0,0 +1,162 @@
+import heapq
+import json
+import math
+import os
+import re
+import threading
+import unicodedata
+import logging
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+BM25_FORMAT_VERSION = 1
+
+
+def tokenize(text: str) -> List[str]:
+    """Tách từ cho BM25: Unicode NFC, chữ thường, giữ nguyên dấu tiếng Việt."""
+    return TOKEN_PATTERN.findall(unicodedata.normalize("NFC", text).lower())
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Gộp nhiều danh sách xếp hạng bằng Reciprocal Rank Fusion: score(d) = sum 1 / (k + rank).
+
+    Args:
+        rankings: Các danh sách id đã xếp hạng (tốt nhất trước)
+        k: Hằng số làm mượt của RRF (60 theo bài báo gốc)
+
+    Returns:
+        List[Tuple[str, float]]: (id, score RRF) theo score giảm dần
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class BM25Index:
+    """
+    Inverted index BM25 trong bộ nhớ, khoá theo id chunk của vector database.
+    Lưu ra file JSON cạnh FAISS index.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75) -> None:
+        """
+        Args:
+            k1: Độ bão hoà tần suất từ
+            b: Mức chuẩn hoá theo độ dài chunk
+        """
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._doc_terms: Dict[str, Dict[str, int]] = {}
+        self._doc_len: Dict[str, int] = {}
+        self._total_len = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._doc_len)
+
+    def ids(self) -> Set[str]:
+        """Id các chunk đang có trong index."""
+        with self._lock:
+            return set(self._doc_len)
+
+    def add(self, ids: Iterable[str], texts: Iterable[str]) -> None:
+        """Thêm (hoặc thay thế) các chunk vào index."""
+        with self._lock:
+            for doc_id, text in zip(ids, texts):
+                self._add_terms(doc_id, Counter(tokenize(text)))
+
+    def _add_terms(self, doc_id: str, terms: Dict[str, int]) -> None:
+        if doc_id in self._doc_len:
+            self._remove(doc_id)
+        self._doc_terms[doc_id] = dict(terms)
+        length = sum(terms.values())
+        self._doc_len[doc_id] = length
+        self._total_len += length
+        for term, tf in terms.items():
+            self._postings.setdefault(term, {})[doc_id] = tf
+
+    def _remove(self, doc_id: str) -> None:
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        self._total_len -= self._doc_len.pop(doc_id)
+        for term in terms:
+            posting = self._postings.get(term)
+            if posting is not None:
+                posting.pop(doc_id, None)
+                if not posting:
+                    del self._postings[term]
+
+    def delete(self, ids: Iterable[str]) -> None:
+        """Xoá các chunk khỏi index (bỏ qua id không tồn tại)."""
+        with self._lock:
+            for doc_id in ids:
+                self._remove(doc_id)
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """
+        Tìm các chunk khớp từ khoá nhất.
+
+        Args:
+            query: Câu truy vấn
+            k: Số kết quả
+
+        Returns:
+            List[Tuple[str, float]]: (id, score BM25) theo score giảm dần
+        """
+        terms = tokenize(query)
+        with self._lock:
+            n_docs = len(self._doc_len)
+            if not n_docs or not terms:
+                return []
+            avg_len = self._total_len / n_docs
+            scores: Dict[str, float] = {}
+            for term in set(terms):
+                posting = self._postings.get(term)
+                if not posting:
+                    continue
+                idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+                for doc_id, tf in posting.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_len[doc_id] / avg_len)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def save(self, path: str) -> None:
+        """Lưu index ra file JSON (ghi file tạm rồi thay thế)."""
+        with self._lock:
+            data = {"version": BM25_FORMAT_VERSION, "k1": self.k1, "b": self.b, "docs": self._doc_terms}
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+        os.replace(f"{path}.tmp", path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["BM25Index"]:
+        """
+        Load index từ file JSON.
+
+        Returns:
+            BM25Index hoặc None nếu file không đọc được / khác phiên bản
+        """
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Không thể load BM25 index {path}: {str(e)}")
+            return None
+        if data.get("version") != BM25_FORMAT_VERSION:
+            logger.warning(f"BM25 index {path} có phiên bản không hỗ trợ, bỏ qua")
+            return None
+        index = cls(k1=data["k1"], b=data["b"])
+        for doc_id, terms in data["docs"].items():
+            index._add_terms(doc_id, terms)
+        return index
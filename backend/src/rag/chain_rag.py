@@ -1,55 +1,179 @@
 from pydantic import Field
-from typing import Literal
+from typing import Literal, Optional
 
 from langchain_community.vectorstores import FAISS
 from src.rag.file_loader import Loader
 from src.rag.vectorstore import VectorDB
 from src.rag.offline_rag import Offline_RAG
+from src.rag.retrieval import RetrievalService
+from src.rag.indexer import sync_index
+from src.rag.index_spec import IndexSpec
 import os
 from pathlib import Path
 from dotenv import load_dotenv
 load_dotenv()
 
 
-def build_rag_chain(llm, data_dir, data_type: Literal['pdf'] = 'pdf'):
+# Tham số chia chunk khi index dữ liệu
+# CHUNKER=structured (mặc định): chia theo heading/đoạn/câu, kích thước theo token của embedding model
+# (CHUNK_TOKENS, mặc định 120 vì paraphrase-multilingual-mpnet-base-v2 cắt input ở 128 token)
+# CHUNKER=recursive: chia theo số ký tự như trước
+if os.environ.get("CHUNKER", "structured") == "structured":
+    SPLIT_KWARGS = {
+        "chunker": "structured",
+        "chunk_tokens": int(os.environ.get("CHUNK_TOKENS", "120")),
+        "overlap_tokens": int(os.environ.get("CHUNK_OVERLAP_TOKENS", "16"))
+    }
+else:
+    SPLIT_KWARGS = {"chunk_size": 700, "chunk_overlap": 200}
+
+
+def open_vectordb(data_path=None, data_name=None) -> VectorDB:
     """
-    Xây dựng chuỗi RAG (Retrieval-Augmented Generation)
+    Mở vector index đã lưu (nếu có) cùng embedding model, cache và micro-batching theo biến môi trường.
+    
+    Args:
+        data_path: Thư mục lưu index (mặc định DATA_PATH)
+        data_name: Tên index (mặc định DATA_NAME)
+        
+    Returns:
+        VectorDB: Vector database, `db` là None nếu chưa có index trên đĩa
+    """
+    DATA_PATH = data_path or os.environ.get("DATA_PATH")
+    DATA_NAME = data_name or os.environ.get("DATA_NAME")
+    # Cache embedding câu hỏi: EMBEDDING_CACHE_SIZE (0 để tắt), EMBEDDING_CACHE_PATH (.npz, tuỳ chọn)
+    # Micro-batching: EMBEDDING_BATCH_SIZE (<= 1 để tắt), EMBEDDING_BATCH_WAIT_MS
+    embedding_kwargs = {
+        "query_cache_size": int(os.environ.get("EMBEDDING_CACHE_SIZE", "10000")),
+        "query_cache_path": os.environ.get("EMBEDDING_CACHE_PATH") or None,
+        "query_batch_size": int(os.environ.get("EMBEDDING_BATCH_SIZE", "32")),
+        "query_batch_wait_ms": float(os.environ.get("EMBEDDING_BATCH_WAIT_MS", "5"))
+    }
+    return VectorDB(
+        vector_db_cls=FAISS,
+        persist_directory=DATA_PATH,
+        index_name=DATA_NAME,
+        # INDEX_STORAGE_FORMAT=mmap: index memory-map + docstore SQLite (khởi động nhanh, dùng chung giữa các worker)
+        storage_format=os.environ.get("INDEX_STORAGE_FORMAT", "pickle"),
+        # INDEX_SPEC: loại index khi build, ví dụ "hnsw,M=32,ef_search=64" hoặc "ivfflat,nlist=256,nprobe=16"
+        index_spec=IndexSpec.from_string(os.environ.get("INDEX_SPEC")),
+        # RETRIEVAL_MODE=hybrid (mặc định): duy trì thêm index BM25 cạnh FAISS; dense: chỉ tìm theo vector
+        keyword_search=os.environ.get("RETRIEVAL_MODE", "hybrid").lower() == "hybrid",
+        # DEDUP_THRESHOLD: bỏ chunk gần trùng (Jaccard >= ngưỡng) khi ingest, 0 để tắt
+        dedup_threshold=float(os.environ.get("DEDUP_THRESHOLD", "0.85")) or None,
+        **embedding_kwargs
+    )
+
+
+def sync_vectordb(vectordb: VectorDB, data_dir, data_type: Literal['pdf', 'jsonl'] = 'pdf', workers: Optional[int] = None, full: bool = False) -> dict:
+    """
+    Embed các file mới/thay đổi trong `data_dir` và xoá vector của file đã bị xoá (theo manifest cạnh index).
+    
+    Args:
+        vectordb: Vector database cần đồng bộ
+        data_dir: Đường dẫn thư mục chứa dữ liệu
+        data_type: Loại dữ liệu: 'pdf' hoặc 'jsonl' (corpus do crawler ghi ra)
+        workers: Số process tải + chia chunk (mặc định INGEST_WORKERS=8)
+        full: Index lại toàn bộ dữ liệu
+        
+    Returns:
+        dict: Thống kê số file/chunk đã thêm, cập nhật, xoá
+    """
+    # PDF_BACKEND: pymupdf (mặc định, pypdf làm dự phòng) hoặc pypdf
+    # PDF_PAGE_CACHE_DIR: cache text từng trang theo hash file (mặc định `{DATA_PATH}/page_cache`, "off" để tắt)
+    backend = os.environ.get("PDF_BACKEND", "pymupdf")
+    cache_dir = os.environ.get("PDF_PAGE_CACHE_DIR")
+    if cache_dir is None and vectordb.persist_directory:
+        cache_dir = os.path.join(vectordb.persist_directory, "page_cache")
+    split_kwargs = dict(SPLIT_KWARGS)
+    if split_kwargs.get("chunker") == "structured":
+        # Đếm token bằng tokenizer của chính embedding model
+        split_kwargs["tokenizer"] = vectordb.embedding_model_name
+    loader = Loader(data_type, split_kwargs=split_kwargs, backend=backend, cache_dir=None if cache_dir == "off" else cache_dir)
+    # Đổi backend trích xuất, cách chia chunk, embedding model, loại index hoặc ngưỡng chống trùng lặp thì phải index lại toàn bộ
+    config = {
+        "data_type": data_type,
+        "pdf_backend": backend,
+        **split_kwargs,
+        "embedding": vectordb.embedding_model_name,
+        # Chỉ tham số lúc build: chỉnh nprobe/ef_search/refine k_factor không cần index lại
+        "index": vectordb.index_spec.build_key,
+        "dedup_threshold": vectordb.dedup_threshold
+    }
+    return sync_index(
+        vectordb,
+        data_dir,
+        loader,
+        workers=workers or int(os.environ.get("INGEST_WORKERS", "8")),
+        pattern=f"*.{data_type}",
+        config=config,
+        full=full,
+        # Pipeline index streaming: số chunk mỗi lần embed và số chunk giữa hai checkpoint
+        batch_size=int(os.environ.get("INGEST_BATCH_SIZE", "256")),
+        checkpoint_every=int(os.environ.get("INGEST_CHECKPOINT_EVERY", "2000")),
+        # Số thread embed chạy song song với process pool tải file
+        embed_workers=int(os.environ.get("INGEST_EMBED_WORKERS", "1"))
+    )
+
+
+def build_retrieval_service(data_dir, data_type: Literal['pdf', 'jsonl'] = 'pdf', search_kwargs=None) -> RetrievalService:
+    """
+    Load embedding model và vector index một lần để dùng chung, đồng bộ index với `data_dir`.
+    
+    Chỉ các file mới hoặc đã thay đổi được embed; đặt INDEX_SYNC_ON_STARTUP=false để
+    dùng nguyên index đã lưu (khi đó chạy `python -m src.rag.indexer` để đồng bộ).
+    
+    Với RETRIEVAL_MODE=hybrid, kết quả vector và BM25 (mỗi bên HYBRID_CANDIDATES ứng viên)
+    được gộp bằng RRF; RETRIEVAL_K là số chunk đưa vào context, mỗi chunk kèm NEIGHBOR_WINDOW
+    chunk liền trước/liền sau trong cùng file (0 để tắt).
     
     Args:
-        llm: Mô hình ngôn ngữ để sử dụng
         data_dir: Đường dẫn thư mục chứa dữ liệu
-        data_type: Loại dữ liệu (hiện chỉ hỗ trợ 'pdf')
+        data_type: Loại dữ liệu: 'pdf' hoặc 'jsonl' (corpus do crawler ghi ra)
+        search_kwargs: Tham số tìm kiếm (mặc định k=RETRIEVAL_K)
         
     Returns:
-        Chuỗi RAG đã được xây dựng
+        RetrievalService: Dịch vụ retrieval dùng chung cho các chain
     """
 
     try:
-        DATA_PATH = os.environ.get("DATA_PATH")
-        DATA_NAME = os.environ.get("DATA_NAME")
-        faiss_files_exist = (
-            Path(DATA_PATH).exists() and 
-            (Path(DATA_PATH) / f"{DATA_NAME}.faiss").exists() and 
-            (Path(DATA_PATH) / f"{DATA_NAME}.pkl").exists()
+        vectordb = open_vectordb()
+        if not vectordb.db or os.environ.get("INDEX_SYNC_ON_STARTUP", "true").lower() != "false":
+            sync_vectordb(vectordb, data_dir, data_type)
+        return RetrievalService(
+            vectordb,
+            search_kwargs=search_kwargs or {"k": int(os.environ.get("RETRIEVAL_K", "10"))},
+            hybrid=vectordb.bm25 is not None,
+            candidates=int(os.environ.get("HYBRID_CANDIDATES", "30")),
+            neighbor_window=int(os.environ.get("NEIGHBOR_WINDOW", "1"))
         )
+        
+    except Exception as e:
+        print(f"Lỗi khi xây dựng retrieval: {str(e)}")
+        raise
+
+
+def build_rag_chain(llm, data_dir=None, data_type: Literal['pdf', 'jsonl'] = 'pdf', history_store=None, history_max_tokens: int = 1000, retrieval: Optional[RetrievalService] = None):
+    """
+    Xây dựng chuỗi RAG (Retrieval-Augmented Generation)
+    
+    Args:
+        llm: Mô hình ngôn ngữ để sử dụng
+        data_dir: Đường dẫn thư mục chứa dữ liệu (chỉ dùng khi chưa có `retrieval`)
+        data_type: Loại dữ liệu: 'pdf' hoặc 'jsonl' (corpus do crawler ghi ra)
+        history_store: Nơi lưu lịch sử hội thoại theo session (dùng chung giữa các model)
+        history_max_tokens: Ngân sách token cho lịch sử gửi kèm mỗi prompt
+        retrieval: RetrievalService dùng chung; nếu không truyền sẽ load mới từ `data_dir`
+        
+    Returns:
+        Offline_RAG: Chuỗi RAG đã được xây dựng (hỗ trợ invoke/ainvoke/stream/astream)
+    """
 
-        if faiss_files_exist:
-            vectordb = VectorDB(
-            vector_db_cls=FAISS,
-            persist_directory=DATA_PATH,
-            index_name=DATA_NAME
-            )
-        else:
-            loader = Loader(data_type,split_kwargs={"chunk_size": 700, "chunk_overlap": 200})
-            documents = loader.load_dir(data_dir, workers=8)    
-            vectordb = VectorDB(
-                documents=documents,
-                vector_db_cls=FAISS,
-                persist_directory=DATA_PATH,
-                index_name=DATA_NAME
-            )
-        retriever = vectordb.get_retriever(search_kwargs={"k": 10}) 
-        chain_rag = Offline_RAG(llm).get_chain(retriever=retriever)
+    try:
+        if retrieval is None:
+            retrieval = build_retrieval_service(data_dir, data_type)
+        chain_rag = Offline_RAG(llm, history_store=history_store, history_max_tokens=history_max_tokens)
+        chain_rag.get_chain(retriever=retrieval)
         return chain_rag
         
     except Exception as e:
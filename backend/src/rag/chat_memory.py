@@ -0,0 +1,264 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import logging
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.messages import (
+    BaseMessage,
+    messages_from_dict,
+    messages_to_dict,
+    trim_messages
+)
+
+logger = logging.getLogger(__name__)
+
+
+def approximate_token_count(messages: List[BaseMessage]) -> int:
+    """
+    Ước lượng số token của danh sách messages (~4 ký tự/token + overhead mỗi message).
+    """
+    return sum(len(str(message.content)) // 4 + 4 for message in messages)
+
+
+def trim_history(
+    messages: List[BaseMessage],
+    max_tokens: int,
+    token_counter: Callable[[List[BaseMessage]], int] = approximate_token_count
+) -> List[BaseMessage]:
+    """
+    Giữ lại các lượt hội thoại gần nhất nằm trong ngân sách token.
+
+    Args:
+        messages: Lịch sử hội thoại đầy đủ của session
+        max_tokens: Số token tối đa được gửi kèm prompt
+        token_counter: Hàm đếm token cho danh sách messages
+
+    Returns:
+        List[BaseMessage]: Cửa sổ lịch sử bắt đầu bằng một câu hỏi của người dùng
+    """
+    if not messages or max_tokens <= 0:
+        return []
+    return trim_messages(
+        messages,
+        max_tokens=max_tokens,
+        token_counter=token_counter,
+        strategy="last",
+        start_on="human",
+        allow_partial=False
+    )
+
+
+class BaseHistoryStore(ABC):
+    """
+    Lưu lịch sử hội thoại theo session_id.
+    """
+
+    def __init__(self, max_sessions: int = 1000, ttl: Optional[float] = 1800, max_messages: int = 50) -> None:
+        """
+        Args:
+            max_sessions: Số session tối đa được giữ (LRU)
+            ttl: Thời gian (giây) một session không hoạt động trước khi bị xoá, None để không hết hạn
+            max_messages: Số message tối đa lưu cho mỗi session
+        """
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_messages = max_messages
+        self.evictions = 0
+        self.expirations = 0
+
+    @abstractmethod
+    def get_messages(self, session_id: str) -> List[BaseMessage]:
+        """Lấy toàn bộ lịch sử (đã lưu) của session."""
+
+    @abstractmethod
+    def add_messages(self, session_id: str, messages: List[BaseMessage]) -> None:
+        """Thêm các message mới vào cuối lịch sử của session."""
+
+    @abstractmethod
+    def clear(self, session_id: str) -> None:
+        """Xoá lịch sử của session."""
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """Số session đang được lưu."""
+
+    def stats(self) -> Dict[str, Any]:
+        """Thống kê số session và số lần bị loại bỏ."""
+        return {
+            "backend": type(self).__name__,
+            "sessions": len(self),
+            "max_sessions": self.max_sessions,
+            "ttl": self.ttl,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+
+class InMemoryHistoryStore(BaseHistoryStore):
+    """
+    Lưu lịch sử trong bộ nhớ của process, dạng LRU có TTL.
+    """
+
+    def __init__(self, max_sessions: int = 1000, ttl: Optional[float] = 1800, max_messages: int = 50) -> None:
+        super().__init__(max_sessions=max_sessions, ttl=ttl, max_messages=max_messages)
+        self._sessions: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float) -> None:
+        if self.ttl is None:
+            return
+        # Session cũ nhất nằm ở đầu OrderedDict
+        while self._sessions:
+            session_id, (last_access, _) = next(iter(self._sessions.items()))
+            if now - last_access < self.ttl:
+                break
+            del self._sessions[session_id]
+            self.expirations += 1
+
+    def get_messages(self, session_id: str) -> List[BaseMessage]:
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return []
+            self._sessions[session_id] = (now, entry[1])
+            self._sessions.move_to_end(session_id)
+            return list(entry[1])
+
+    def add_messages(self, session_id: str, messages: List[BaseMessage]) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            _, history = self._sessions.pop(session_id, (now, []))
+            history = (history + list(messages))[-self.max_messages:]
+            self._sessions[session_id] = (now, history)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+class SQLiteHistoryStore(BaseHistoryStore):
+    """
+    Lưu lịch sử vào file SQLite, dùng chung được giữa các worker và giữ lại khi restart.
+    """
+
+    def __init__(
+        self,
+        db_path: str = "chat_history.db",
+        max_sessions: int = 10000,
+        ttl: Optional[float] = 1800,
+        max_messages: int = 50
+    ) -> None:
+        super().__init__(max_sessions=max_sessions, ttl=ttl, max_messages=max_messages)
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                last_access REAL NOT NULL,
+                messages TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_sessions_last_access ON sessions(last_access);
+        """)
+        self._conn.commit()
+
+    def _expire(self, now: float) -> None:
+        if self.ttl is None:
+            return
+        cursor = self._conn.execute("DELETE FROM sessions WHERE last_access < ?", (now - self.ttl,))
+        self.expirations += cursor.rowcount
+
+    def _evict(self) -> None:
+        count = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        overflow = count - self.max_sessions
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM sessions WHERE session_id IN "
+                "(SELECT session_id FROM sessions ORDER BY last_access ASC LIMIT ?)",
+                (overflow,)
+            )
+            self.evictions += overflow
+
+    def get_messages(self, session_id: str) -> List[BaseMessage]:
+        with self._lock:
+            now = time.time()
+            self._expire(now)
+            row = self._conn.execute(
+                "SELECT messages FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                self._conn.commit()
+                return []
+            self._conn.execute("UPDATE sessions SET last_access = ? WHERE session_id = ?", (now, session_id))
+            self._conn.commit()
+            return messages_from_dict(json.loads(row[0]))
+
+    def add_messages(self, session_id: str, messages: List[BaseMessage]) -> None:
+        with self._lock:
+            now = time.time()
+            self._expire(now)
+            row = self._conn.execute(
+                "SELECT messages FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            history = json.loads(row[0]) if row else []
+            history = (history + messages_to_dict(messages))[-self.max_messages:]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, last_access, messages) VALUES (?, ?, ?)",
+                (session_id, now, json.dumps(history, ensure_ascii=False))
+            )
+            self._evict()
+            self._conn.commit()
+
+    def clear(self, session_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+def create_history_store() -> BaseHistoryStore:
+    """
+    Tạo history store theo biến môi trường.
+
+    HISTORY_BACKEND: 'memory' (mặc định) hoặc 'sqlite'
+    HISTORY_MAX_SESSIONS, HISTORY_TTL (giây, 0 = không hết hạn), HISTORY_MAX_MESSAGES, HISTORY_DB_PATH
+
+    Returns:
+        BaseHistoryStore: Store đã được cấu hình
+    """
+    backend = os.getenv("HISTORY_BACKEND", "memory").lower()
+    ttl = float(os.getenv("HISTORY_TTL", "1800")) or None
+    max_messages = int(os.getenv("HISTORY_MAX_MESSAGES", "50"))
+
+    if backend == "sqlite":
+        return SQLiteHistoryStore(
+            db_path=os.getenv("HISTORY_DB_PATH", "chat_history.db"),
+            max_sessions=int(os.getenv("HISTORY_MAX_SESSIONS", "10000")),
+            ttl=ttl,
+            max_messages=max_messages
+        )
+    if backend != "memory":
+        raise ValueError(f"HISTORY_BACKEND không hợp lệ: {backend}")
+    return InMemoryHistoryStore(
+        max_sessions=int(os.getenv("HISTORY_MAX_SESSIONS", "1000")),
+        ttl=ttl,
+        max_messages=max_messages
+    )
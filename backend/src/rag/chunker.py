@@ -0,0 +1,202 @@
+"""
+Chia chunk theo cấu trúc văn bản, kích thước tính bằng token của embedding model.
+
+Ranh giới chunk ưu tiên theo thứ tự: heading (mỗi chunk chỉ thuộc một mục) -> đoạn văn -> câu -> từ.
+Nhờ vậy chunk ít khi bị cắt giữa ý và chỉ cần chồng lấp vài câu thay vì hàng trăm ký tự.
+
+Mỗi chunk có thêm metadata:
+    - section_title: heading gần nhất phía trên (hoặc tiêu đề tài liệu)
+    - chunk_tokens: số token của chunk
+Id chunk liền trước/liền sau (`prev_chunk_id`/`next_chunk_id`) được gán khi ingest, lúc id đã được tạo.
+"""
+
+import re
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from src.rag.context_packer import approximate_text_tokens
+
+logger = logging.getLogger(__name__)
+
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+# Dấu kết thúc câu (cả dấu ba chấm Unicode) theo sau là khoảng trắng
+SENTENCE_BREAK = re.compile(r"(?<=[.!?…])[\"'”’)\]]*\s+")
+
+_token_counters: Dict[str, Callable[[str], int]] = {}
+
+
+def get_token_counter(model_name: Optional[str] = None) -> Callable[[str], int]:
+    """
+    Hàm đếm token theo tokenizer của embedding model (nhớ lại trong mỗi process).
+
+    Args:
+        model_name: Tên model trên HuggingFace (tên ngắn được hiểu là 'sentence-transformers/<tên>')
+
+    Returns:
+        Callable[[str], int]: Hàm đếm token (không tính token đặc biệt); ước lượng theo số ký tự nếu
+        không có model hoặc không tải được tokenizer
+    """
+    if not model_name:
+        return approximate_text_tokens
+    if model_name not in _token_counters:
+        try:
+            from transformers import AutoTokenizer
+            name = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+            tokenizer = AutoTokenizer.from_pretrained(name)
+            _token_counters[model_name] = lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+        except Exception as e:
+            logger.warning(f"Không tải được tokenizer của {model_name} ({str(e)}), ước lượng token theo số ký tự")
+            _token_counters[model_name] = approximate_text_tokens
+    return _token_counters[model_name]
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    Tách câu theo dấu kết thúc câu; không tách khi phần sau bắt đầu bằng chữ thường
+    (viết tắt như 'v.v. và', 'TP. hồ ...'), áp dụng được cho tiếng Việt có dấu.
+    """
+    sentences: List[str] = []
+    for piece in SENTENCE_BREAK.split(text.strip()):
+        if not piece:
+            continue
+        if sentences and piece[0].islower():
+            sentences[-1] = f"{sentences[-1]} {piece}"
+        else:
+            sentences.append(piece)
+    return sentences
+
+
+class StructuredChunker:
+    """Chia document thành chunk theo heading/đoạn/câu với ngân sách token của embedding model."""
+
+    def __init__(
+        self,
+        chunk_tokens: int = 120,
+        overlap_tokens: int = 16,
+        tokenizer: Optional[str] = None,
+        token_counter: Optional[Callable[[str], int]] = None
+    ) -> None:
+        """
+        Args:
+            chunk_tokens: Số token tối đa của mỗi chunk (không vượt quá max_seq_length của embedding model,
+                phần vượt sẽ bị model cắt bỏ khi embed)
+            overlap_tokens: Số token tối đa lặp lại ở đầu chunk sau, lấy trọn câu cuối của chunk trước;
+                không chồng lấp qua ranh giới mục
+            tokenizer: Tên embedding model để đếm token (None: ước lượng theo số ký tự)
+            token_counter: Hàm đếm token tuỳ chỉnh, ưu tiên hơn `tokenizer`
+        """
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.count_tokens = token_counter or get_token_counter(tokenizer)
+
+    def _blocks(self, doc: Document) -> List[Tuple[str, Optional[int]]]:
+        """
+        Các khối (text, cấp heading hoặc None) của document. Document có metadata "headings" (corpus crawl)
+        có mỗi dòng là một khối; text trích từ PDF có dòng bị ngắt theo khổ giấy nên chỉ tách theo dòng trống.
+        """
+        structured = "headings" in doc.metadata
+        headings = {heading["text"]: heading["level"] for heading in doc.metadata.get("headings") or []}
+        blocks = []
+        for paragraph in PARAGRAPH_BREAK.split(doc.page_content):
+            lines = [line.strip() for line in paragraph.split("\n") if line.strip()]
+            if not structured:
+                if lines:
+                    blocks.append((" ".join(lines), None))
+                continue
+            blocks.extend((line, headings.get(line)) for line in lines)
+        return blocks
+
+    def _pieces(self, text: str) -> List[Tuple[str, int]]:
+        """Chia một khối thành các phần (kèm số token) không vượt `chunk_tokens`: cả khối, từng câu, hoặc cụm từ."""
+        tokens = self.count_tokens(text)
+        if tokens <= self.chunk_tokens:
+            return [(text, tokens)]
+        pieces = []
+        for sentence in split_sentences(text):
+            tokens = self.count_tokens(sentence)
+            if tokens <= self.chunk_tokens:
+                pieces.append((sentence, tokens))
+                continue
+            # Câu quá dài: cắt theo từ
+            words, used = [], 0
+            for word in sentence.split():
+                word_tokens = self.count_tokens(word)
+                if words and used + word_tokens > self.chunk_tokens:
+                    pieces.append((" ".join(words), used))
+                    words, used = [], 0
+                words.append(word)
+                used += word_tokens
+            if words:
+                pieces.append((" ".join(words), used))
+        return pieces
+
+    def _make_chunk(self, doc: Document, units: List[Tuple[str, int, str]], section_title: Optional[str]) -> Document:
+        text = units[0][0] + "".join(f"{separator}{unit}" for unit, _, separator in units[1:])
+        metadata = {key: value for key, value in doc.metadata.items() if key != "headings"}
+        metadata.update(section_title=section_title, chunk_tokens=sum(tokens for _, tokens, _ in units))
+        return Document(page_content=text, metadata=metadata)
+
+    def split_document(self, doc: Document) -> List[Document]:
+        chunks: List[Document] = []
+        # (text, số token, ký tự nối với phần trước): "\n" giữa hai khối, " " giữa hai câu cùng khối
+        units: List[Tuple[str, int, str]] = []
+        used = 0
+        headings_only = True
+        section_title = doc.metadata.get("title")
+
+        for block, level in self._blocks(doc):
+            if level is not None:
+                # Heading mở mục mới; các heading liền nhau (mục rỗng) đi chung với nội dung phía sau
+                if units and not headings_only:
+                    chunks.append(self._make_chunk(doc, units, section_title))
+                    units, used = [], 0
+                section_title = block
+                headings_only = True
+                tokens = self.count_tokens(block)
+                units.append((block, tokens, "\n"))
+                used += tokens
+                continue
+
+            for i, (piece, tokens) in enumerate(self._pieces(block)):
+                if units and used + tokens > self.chunk_tokens:
+                    chunks.append(self._make_chunk(doc, units, section_title))
+                    # Chồng lấp: các câu cuối của chunk trước, nếu còn chỗ cho phần tiếp theo
+                    carry, carried = [], 0
+                    for unit in reversed(units):
+                        if carried + unit[1] > self.overlap_tokens:
+                            break
+                        carry.insert(0, unit)
+                        carried += unit[1]
+                    units, used = (carry, carried) if carried + tokens <= self.chunk_tokens else ([], 0)
+                units.append((piece, tokens, " " if i else "\n"))
+                used += tokens
+                headings_only = False
+
+        if units:
+            chunks.append(self._make_chunk(doc, units, section_title))
+        return chunks
+
+    def split_documents(self, documents: List[Document]) -> List[Document]:
+        chunks = []
+        for doc in documents:
+            chunks.extend(self.split_document(doc))
+        return chunks
+
+    def __call__(self, documents: List[Document]) -> List[Document]:
+        """
+        Phân chia documents thành các chunk.
+
+        Args:
+            documents: Danh sách các document cần phân chia
+
+        Returns:
+            List[Document]: Danh sách các chunk
+        """
+        if not documents:
+            logger.warning("Không có documents để phân chia")
+            return []
+        chunks = self.split_documents(documents)
+        logger.info(f"Đã phân chia thành {len(chunks)} đoạn văn bản")
+        return chunks
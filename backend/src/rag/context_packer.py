@@ -0,0 +1,172 @@
+import re
+import unicodedata
+import logging
+from dataclasses import dataclass, field
+from typing import Callable, List, Sequence, Set, Tuple
+
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def approximate_text_tokens(text: str) -> int:
+    """Ước lượng số token của một đoạn văn bản (~4 ký tự/token, cùng cách đếm với lịch sử hội thoại)."""
+    return len(text) // 4 + 1
+
+
+def _shingles(text: str, size: int) -> Set[Tuple[str, ...]]:
+    words = WORD_PATTERN.findall(unicodedata.normalize("NFC", text).lower())
+    if len(words) < size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def overlap_length(left: str, right: str, min_overlap: int) -> int:
+    """Độ dài phần cuối của `left` trùng với phần đầu của `right` (0 nếu ngắn hơn `min_overlap`)."""
+    for length in range(min(len(left), len(right)), min_overlap - 1, -1):
+        if left.endswith(right[:length]):
+            return length
+    return 0
+
+
+@dataclass
+class Passage:
+    """Một đoạn context: một hoặc nhiều chunk liền nhau của cùng một source."""
+
+    source: str
+    text: str
+    rank: int
+    documents: List[Document] = field(default_factory=list)
+
+
+class ContextPacker:
+    """
+    Ghép các chunk đã retrieve thành context cho prompt trong một ngân sách token.
+
+    - Các chunk cùng source có phần chồng lấn (chunk_overlap của splitter) được nối thành một đoạn,
+      phần trùng chỉ giữ một lần.
+    - Chunk gần trùng lặp với nội dung đã chọn (tỉ lệ shingle từ đã có >= `duplicate_threshold`) bị bỏ.
+    - Các đoạn được xếp theo thứ hạng retrieval tốt nhất của chunk trong đoạn và thêm vào cho tới khi
+      hết `max_tokens`; đoạn đầu tiên bị cắt bớt nếu một mình đã vượt ngân sách.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 3000,
+        duplicate_threshold: float = 0.9,
+        min_overlap: int = 20,
+        shingle_size: int = 5,
+        token_counter: Callable[[str], int] = approximate_text_tokens,
+        separator: str = "\n\n"
+    ) -> None:
+        """
+        Args:
+            max_tokens: Ngân sách token cho phần context
+            duplicate_threshold: Tỉ lệ shingle trùng để coi một chunk là bản lặp
+            min_overlap: Số ký tự chồng lấn tối thiểu để nối hai chunk cùng source
+            shingle_size: Số từ của mỗi shingle khi so trùng lặp
+            token_counter: Hàm đếm token cho một đoạn văn bản
+            separator: Chuỗi ngăn cách giữa các đoạn
+        """
+        self.max_tokens = max_tokens
+        self.duplicate_threshold = duplicate_threshold
+        self.min_overlap = min_overlap
+        self.shingle_size = shingle_size
+        self.token_counter = token_counter
+        self.separator = separator
+
+    def _merge(self, passage: Passage, text: str) -> bool:
+        """Nối `text` vào đầu hoặc cuối đoạn nếu hai bên chồng lấn; trả về True nếu đã nối."""
+        overlap = overlap_length(passage.text, text, self.min_overlap)
+        if overlap:
+            passage.text += text[overlap:]
+            return True
+        overlap = overlap_length(text, passage.text, self.min_overlap)
+        if overlap:
+            passage.text = text + passage.text[overlap:]
+            return True
+        return False
+
+    def _absorb(self, passages: List[Passage], passage: Passage) -> None:
+        """Sau khi một đoạn dài ra, nối tiếp các đoạn cùng source giờ đã chồng lấn với nó."""
+        merged = True
+        while merged:
+            merged = False
+            for other in passages:
+                if other is not passage and other.source == passage.source and self._merge(passage, other.text):
+                    passage.rank = min(passage.rank, other.rank)
+                    passage.documents.extend(other.documents)
+                    passages.remove(other)
+                    merged = True
+                    break
+
+    def passages(self, documents: Sequence[Document]) -> List[Passage]:
+        """
+        Gộp chunk chồng lấn và bỏ chunk gần trùng lặp (chưa áp dụng ngân sách token).
+
+        Args:
+            documents: Các chunk theo thứ tự liên quan giảm dần
+
+        Returns:
+            List[Passage]: Các đoạn theo thứ hạng tốt nhất
+        """
+        passages: List[Passage] = []
+        seen: Set[Tuple[str, ...]] = set()
+        for rank, doc in enumerate(documents):
+            text = doc.page_content.strip()
+            if not text:
+                continue
+            shingles = _shingles(text, self.shingle_size)
+            if shingles and len(shingles & seen) / len(shingles) >= self.duplicate_threshold:
+                continue
+            seen |= shingles
+
+            source = doc.metadata.get("source", "")
+            target = next((p for p in passages if p.source == source and self._merge(p, text)), None)
+            if target is None:
+                passages.append(Passage(source=source, text=text, rank=rank, documents=[doc]))
+            else:
+                target.documents.append(doc)
+                self._absorb(passages, target)
+        return sorted(passages, key=lambda p: p.rank)
+
+    def select(self, documents: Sequence[Document]) -> List[Passage]:
+        """
+        Các đoạn được đưa vào prompt, nằm trong ngân sách `max_tokens`.
+
+        Args:
+            documents: Các chunk theo thứ tự liên quan giảm dần
+
+        Returns:
+            List[Passage]: Các đoạn đã chọn
+        """
+        selected: List[Passage] = []
+        used = 0
+        separator_tokens = self.token_counter(self.separator) if self.separator else 0
+        for passage in self.passages(documents):
+            cost = self.token_counter(passage.text) + (separator_tokens if selected else 0)
+            if used + cost <= self.max_tokens:
+                selected.append(passage)
+                used += cost
+            elif not selected:
+                # Đoạn liên quan nhất luôn có mặt, cắt theo tỉ lệ ký tự/token
+                ratio = self.max_tokens / cost
+                passage.text = passage.text[:int(len(passage.text) * ratio)]
+                selected.append(passage)
+                used = self.token_counter(passage.text)
+        logger.debug(f"Context: {len(selected)} đoạn từ {len(documents)} chunk, ~{used} token")
+        return selected
+
+    def pack(self, documents: Sequence[Document]) -> str:
+        """
+        Context cho prompt từ các chunk đã retrieve.
+
+        Args:
+            documents: Các chunk theo thứ tự liên quan giảm dần
+
+        Returns:
+            str: Các đoạn đã chọn, ngăn cách bởi `separator`
+        """
+        return self.separator.join(passage.text for passage in self.select(list(documents)))
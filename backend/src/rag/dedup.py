@@ -0,0 +1,227 @@
+"""
+Loại bỏ chunk gần trùng lặp (boilerplate header/footer lặp lại ở mọi trang) trước khi embed, bằng MinHash + LSH.
+
+Chunk đầu tiên của mỗi nhóm gần trùng được giữ làm chunk đại diện (canonical) trong index; các chunk trùng
+chỉ được lưu lại làm tham chiếu ngược (id, text, metadata) để biết mọi nguồn chứa nội dung đó, và được
+đưa lên làm đại diện mới nếu chunk đại diện bị xoá (file bị xoá/thay đổi).
+"""
+
+import json
+import os
+import threading
+import zlib
+import logging
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from src.rag.bm25 import tokenize
+
+logger = logging.getLogger(__name__)
+
+DEDUP_VERSION = 1
+# Số nguyên tố lớn nhất < 2^32: (a * x + b) với a, x < 2^32 không tràn uint64
+_PRIME = np.uint64(4294967291)
+
+
+class ChunkDeduplicator:
+    """
+    Chỉ mục MinHash-LSH của các chunk đại diện.
+
+    Chữ ký MinHash gồm `num_perm` giá trị, chia thành `bands` dải; hai chunk là ứng viên nếu trùng toàn bộ
+    một dải, và được coi là gần trùng nếu tỉ lệ giá trị chữ ký trùng nhau (ước lượng độ tương đồng Jaccard
+    trên các shingle từ) >= `threshold`.
+    """
+
+    def __init__(self, threshold: float = 0.85, num_perm: int = 128, bands: int = 16, shingle_size: int = 5) -> None:
+        """
+        Args:
+            threshold: Độ tương đồng Jaccard tối thiểu để coi hai chunk là gần trùng
+            num_perm: Số hàm băm của chữ ký MinHash
+            bands: Số dải LSH (`num_perm` phải chia hết cho `bands`)
+            shingle_size: Số từ mỗi shingle
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm phải chia hết cho bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(20240101)
+        self._a = rng.randint(1, 2**32 - 6, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 2**32 - 6, size=num_perm, dtype=np.uint64)
+
+        self.signatures: Dict[str, np.ndarray] = {}
+        self.duplicates: Dict[str, List[Dict[str, Any]]] = {}
+        self.duplicate_of: Dict[str, str] = {}
+        self._buckets: Dict[Tuple[int, bytes], Set[str]] = {}
+        self._lock = threading.RLock()
+
+    def signature(self, text: str) -> np.ndarray:
+        words = tokenize(text)
+        if len(words) <= self.shingle_size:
+            shingles = {" ".join(words)}
+        else:
+            shingles = {" ".join(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)}
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+        return ((self._a[:, None] * hashes[None, :] + self._b[:, None]) % _PRIME).min(axis=1)
+
+    def _band_keys(self, signature: np.ndarray) -> List[Tuple[int, bytes]]:
+        return [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+
+    def _register(self, doc_id: str, signature: np.ndarray) -> None:
+        self.signatures[doc_id] = signature
+        for key in self._band_keys(signature):
+            self._buckets.setdefault(key, set()).add(doc_id)
+
+    def _unregister(self, doc_id: str) -> np.ndarray:
+        signature = self.signatures.pop(doc_id)
+        for key in self._band_keys(signature):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(doc_id)
+                if not bucket:
+                    del self._buckets[key]
+        return signature
+
+    def find(self, signature: np.ndarray) -> Optional[str]:
+        """Chunk đại diện gần trùng nhất với chữ ký (None nếu không có chunk nào đạt `threshold`)."""
+        best_id, best_score = None, self.threshold
+        with self._lock:
+            candidates = set()
+            for key in self._band_keys(signature):
+                candidates |= self._buckets.get(key, set())
+            for candidate in candidates:
+                score = float(np.mean(self.signatures[candidate] == signature))
+                if score >= best_score:
+                    best_id, best_score = candidate, score
+        return best_id
+
+    def add(self, doc_id: str, doc: Document) -> Optional[str]:
+        """
+        Thêm một chunk: ghi làm tham chiếu ngược nếu gần trùng một chunk đại diện, ngược lại đăng ký làm đại diện.
+
+        Args:
+            doc_id: Id của chunk
+            doc: Chunk
+
+        Returns:
+            Optional[str]: Id chunk đại diện nếu `doc` là bản trùng (không cần embed), None nếu là chunk mới
+        """
+        signature = self.signature(doc.page_content)
+        with self._lock:
+            canonical = self.find(signature)
+            if canonical is None:
+                self._register(doc_id, signature)
+                return None
+            self.duplicates.setdefault(canonical, []).append(
+                {"id": doc_id, "text": doc.page_content, "metadata": doc.metadata}
+            )
+            self.duplicate_of[doc_id] = canonical
+            return canonical
+
+    def register(self, doc_id: str, doc: Document) -> None:
+        """Đăng ký một chunk đã có trong index làm đại diện (không kiểm tra trùng)."""
+        signature = self.signature(doc.page_content)
+        with self._lock:
+            self._register(doc_id, signature)
+
+    def drop(self, ids: List[str]) -> List[Tuple[str, Document]]:
+        """
+        Bỏ các chunk (đại diện hoặc bản trùng) khỏi chỉ mục. Bản trùng còn lại của một chunk đại diện bị bỏ
+        được đưa lên làm đại diện mới và trả về để thêm vào index.
+
+        Args:
+            ids: Id các chunk bị xoá
+
+        Returns:
+            List[Tuple[str, Document]]: (id, document) các chunk cần thêm vào index thay cho đại diện bị xoá
+        """
+        promoted = []
+        with self._lock:
+            dropped = set(ids)
+            for doc_id in dropped & set(self.duplicate_of):
+                canonical = self.duplicate_of.pop(doc_id)
+                remaining = [ref for ref in self.duplicates.get(canonical, []) if ref["id"] != doc_id]
+                if remaining:
+                    self.duplicates[canonical] = remaining
+                else:
+                    self.duplicates.pop(canonical, None)
+            for doc_id in dropped & set(self.signatures):
+                self._unregister(doc_id)
+                remaining = self.duplicates.pop(doc_id, [])
+                if not remaining:
+                    continue
+                head, rest = remaining[0], remaining[1:]
+                self.duplicate_of.pop(head["id"], None)
+                self._register(head["id"], self.signature(head["text"]))
+                if rest:
+                    self.duplicates[head["id"]] = rest
+                    for ref in rest:
+                        self.duplicate_of[ref["id"]] = head["id"]
+                promoted.append((head["id"], Document(page_content=head["text"], metadata=head["metadata"])))
+        return promoted
+
+    def ids(self) -> Set[str]:
+        """Id mọi chunk đang được theo dõi (đại diện và bản trùng)."""
+        with self._lock:
+            return set(self.signatures) | set(self.duplicate_of)
+
+    def duplicate_refs(self, doc_id: str) -> List[Dict[str, Any]]:
+        """Metadata (source, page, url, ...) của các bản trùng đã gộp vào chunk đại diện `doc_id`."""
+        with self._lock:
+            return [dict(ref["metadata"], chunk_id=ref["id"]) for ref in self.duplicates.get(doc_id, [])]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            canonical = len(self.signatures)
+            duplicates = len(self.duplicate_of)
+        total = canonical + duplicates
+        return {
+            "threshold": self.threshold,
+            "canonical": canonical,
+            "duplicates": duplicates,
+            "duplicate_ratio": round(duplicates / total, 4) if total else 0.0
+        }
+
+    def __len__(self) -> int:
+        return len(self.signatures)
+
+    def save(self, path: str) -> None:
+        """Lưu chỉ mục ra file JSON (ghi file tạm rồi thay thế)."""
+        with self._lock:
+            data = {
+                "version": DEDUP_VERSION,
+                "params": {
+                    "threshold": self.threshold,
+                    "num_perm": self.num_perm,
+                    "bands": self.bands,
+                    "shingle_size": self.shingle_size
+                },
+                "signatures": {doc_id: signature.tolist() for doc_id, signature in self.signatures.items()},
+                "duplicates": self.duplicates
+            }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["ChunkDeduplicator"]:
+        """Load chỉ mục đã lưu, None nếu file không đọc được hoặc khác phiên bản."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Không thể load chỉ mục chống trùng lặp {path}: {str(e)}")
+            return None
+        if data.get("version") != DEDUP_VERSION:
+            return None
+        dedup = cls(**data["params"])
+        for doc_id, signature in data["signatures"].items():
+            dedup._register(doc_id, np.array(signature, dtype=np.uint64))
+        dedup.duplicates = data["duplicates"]
+        dedup.duplicate_of = {ref["id"]: canonical for canonical, refs in dedup.duplicates.items() for ref in refs}
+        return dedup
@@ -0,0 +1,278 @@
+import os
+import queue
+import threading
+import time
+import unicodedata
+import logging
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Chuẩn hoá văn bản làm khoá cache: Unicode NFC, gộp khoảng trắng, chữ thường."""
+    return " ".join(unicodedata.normalize("NFC", text).split()).lower()
+
+
+def embedding_model_name(embedding: Embeddings) -> str:
+    """Tên mô hình embedding gốc nằm dưới các lớp bọc (cache, micro-batching)."""
+    while hasattr(embedding, "underlying"):
+        embedding = embedding.underlying
+    return getattr(embedding, "model_name", type(embedding).__name__)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Bọc một mô hình embedding với LRU cache cho embedding của câu hỏi.
+
+    - `embed_query` / `embed_queries` dùng cache, các câu chưa có được encode chung một batch.
+    - `embed_documents` (dùng khi build index) đi thẳng tới mô hình gốc để không đẩy
+      các câu hỏi ra khỏi cache.
+    - Cache có thể được lưu ra file `.npz` (không dùng pickle) và load lại khi khởi động.
+    """
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        max_size: int = 10000,
+        persist_path: Optional[str] = None,
+        namespace: Optional[str] = None
+    ) -> None:
+        """
+        Khởi tạo CachedEmbeddings.
+
+        Args:
+            underlying: Mô hình embedding gốc
+            max_size: Số embedding tối đa được giữ trong cache
+            persist_path: File .npz để lưu/khôi phục cache (None để chỉ giữ trong bộ nhớ)
+            namespace: Tên mô hình, tránh dùng nhầm cache của mô hình khác khi load từ file
+        """
+        self.underlying = underlying
+        self.max_size = max_size
+        self.persist_path = persist_path
+        self.namespace = namespace or embedding_model_name(underlying)
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if persist_path and os.path.exists(persist_path):
+            self.load()
+
+    def _get(self, key: str) -> Optional[List[float]]:
+        vector = self._cache.get(key)
+        if vector is not None:
+            self._cache.move_to_end(key)
+        return vector
+
+    def _put(self, key: str, vector: List[float]) -> None:
+        self._cache[key] = vector
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embedding cho nhiều câu hỏi; chỉ các câu chưa có trong cache được encode, trong một batch.
+
+        Args:
+            texts: Danh sách câu hỏi
+
+        Returns:
+            List[List[float]]: Embedding theo đúng thứ tự đầu vào
+        """
+        keys = [normalize_text(text) for text in texts]
+        results: Dict[str, List[float]] = {}
+        with self._lock:
+            for key in keys:
+                vector = self._get(key)
+                if vector is not None:
+                    results[key] = vector
+            missing = [key for key in dict.fromkeys(keys) if key not in results]
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            originals = {}
+            for key, text in zip(keys, texts):
+                originals.setdefault(key, text)
+            miss_texts = [originals[key] for key in missing]
+            if len(miss_texts) == 1:
+                vectors = [self.underlying.embed_query(miss_texts[0])]
+            else:
+                vectors = self.underlying.embed_documents(miss_texts)
+            with self._lock:
+                for key, vector in zip(missing, vectors):
+                    vector = list(vector)
+                    self._put(key, vector)
+                    results[key] = vector
+
+        return [results[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_queries([text])[0]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.underlying.embed_documents(texts)
+
+    def save(self, path: Optional[str] = None) -> None:
+        """Lưu cache ra file .npz."""
+        path = path or self.persist_path
+        if not path:
+            raise ValueError("Không có persist_path để lưu embedding cache")
+        with self._lock:
+            keys = list(self._cache.keys())
+            vectors = np.asarray(list(self._cache.values()), dtype=np.float32)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, keys=np.asarray(keys, dtype=str), vectors=vectors, namespace=np.asarray(self.namespace))
+        os.replace(tmp_path, path)
+        logger.info(f"Đã lưu {len(keys)} embedding vào {path}")
+
+    def load(self, path: Optional[str] = None) -> None:
+        """Khôi phục cache từ file .npz (bỏ qua nếu file thuộc mô hình khác)."""
+        path = path or self.persist_path
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if str(data["namespace"]) != self.namespace:
+                    logger.warning(f"Embedding cache {path} thuộc mô hình khác, bỏ qua")
+                    return
+                keys = data["keys"].tolist()
+                vectors = data["vectors"].tolist()
+        except Exception as e:
+            logger.error(f"Không thể load embedding cache {path}: {str(e)}")
+            return
+        with self._lock:
+            for key, vector in list(zip(keys, vectors))[-self.max_size:]:
+                self._put(key, vector)
+        logger.info(f"Đã load {len(self._cache)} embedding từ {path}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Kích thước cache và tỉ lệ hit."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._cache),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None
+        }
+
+
+class MicroBatchingEmbeddings(Embeddings):
+    """
+    Gom các lời gọi `embed_query` đồng thời thành một lần `embed_documents` của mô hình gốc.
+
+    Một thread nền lấy câu hỏi từ hàng đợi, chờ tối đa `max_wait_ms` (hoặc tới khi đủ
+    `max_batch_size` câu) rồi encode cả batch và trả kết quả cho từng bên đang chờ.
+    Khi mô hình đang bận encode, các câu hỏi mới tự dồn lại cho batch kế tiếp.
+    """
+
+    def __init__(self, underlying: Embeddings, max_batch_size: int = 32, max_wait_ms: float = 5.0) -> None:
+        """
+        Khởi tạo MicroBatchingEmbeddings.
+
+        Args:
+            underlying: Mô hình embedding gốc
+            max_batch_size: Số câu tối đa trong một batch
+            max_wait_ms: Thời gian tối đa (ms) chờ gom thêm câu hỏi sau câu đầu tiên
+        """
+        self.underlying = underlying
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self._queue: "queue.Queue" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+        self.total_wait = 0.0
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None or not self._worker.is_alive():
+            with self._lock:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self._worker.start()
+
+    def _collect(self, first) -> list:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = self._collect(first)
+            now = time.monotonic()
+            texts = [text for text, _, _ in batch]
+            try:
+                vectors = self.underlying.embed_documents(texts)
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future, _), vector in zip(batch, vectors):
+                future.set_result(list(vector))
+
+            self.batches += 1
+            self.items += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            self.total_wait += sum(now - enqueued for _, _, enqueued in batch)
+
+    def submit(self, text: str) -> Future:
+        """
+        Đưa một câu hỏi vào hàng đợi.
+
+        Returns:
+            Future: Hoàn thành với embedding của câu hỏi khi batch chứa nó được encode
+        """
+        self._ensure_worker()
+        future: Future = Future()
+        self._queue.put((text, future, time.monotonic()))
+        return future
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.submit(text).result()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.underlying.embed_documents(texts)
+
+    def close(self) -> None:
+        """Dừng thread nền sau khi xử lý hết các câu hỏi đang chờ."""
+        if self._worker is not None and self._worker.is_alive():
+            self._queue.put(None)
+            self._worker.join()
+
+    def stats(self) -> Dict[str, Any]:
+        """Số batch, độ đầy trung bình của batch và thời gian chờ trung bình trong hàng đợi."""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "items": self.items,
+            "largest_batch": self.largest_batch,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else None,
+            "avg_batch_fill": round(self.items / (self.batches * self.max_batch_size), 3) if self.batches else None,
+            "avg_queue_wait_ms": round(self.total_wait / self.items * 1000, 2) if self.items else None
+        }
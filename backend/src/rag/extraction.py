@@ -0,0 +1,146 @@
+"""
+Trích xuất text từ PDF với backend chọn được và cache text theo hash nội dung file.
+
+- `pymupdf` (mặc định): PyMuPDF/MuPDF viết bằng C, nhanh hơn pypdf nhiều lần; lấy luôn link trong cùng lượt đọc.
+- `pypdf`: thuần Python, dùng làm dự phòng khi PyMuPDF không đọc được file.
+
+Cache lưu text từng trang + link của mỗi file theo SHA-256 nội dung, nên chia chunk lại với
+`split_kwargs` khác (hoặc file bị đổi tên/di chuyển) không phải parse lại PDF.
+"""
+
+import hashlib
+import json
+import os
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+import fitz  # PyMuPDF
+
+from src.rag.source import extract_links
+
+logger = logging.getLogger(__name__)
+
+PAGE_CACHE_VERSION = 1
+DEFAULT_BACKEND = "pymupdf"
+FALLBACK_BACKEND = "pypdf"
+
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    """Hash SHA-256 nội dung của một file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def extract_pages_pymupdf(pdf_file: str) -> Tuple[List[str], List[str]]:
+    """Text từng trang và các link (không trùng lặp, giữ thứ tự) bằng PyMuPDF, một lần mở file."""
+    pages = []
+    links = {}
+    with fitz.open(pdf_file) as doc:
+        for page in doc:
+            pages.append(page.get_text("text"))
+            for link in page.get_links():
+                uri = link.get("uri")
+                if uri:
+                    links[uri] = None
+    return pages, list(links)
+
+
+def extract_pages_pypdf(pdf_file: str) -> Tuple[List[str], List[str]]:
+    """Text từng trang bằng pypdf; link vẫn lấy bằng PyMuPDF nếu đọc được."""
+    from pypdf import PdfReader
+
+    pages = [page.extract_text() or "" for page in PdfReader(pdf_file).pages]
+    try:
+        links = extract_links(pdf_file)
+    except Exception as e:
+        logger.warning(f"Không thể lấy link từ file {pdf_file}: {str(e)}")
+        links = []
+    return pages, links
+
+
+BACKENDS: Dict[str, Callable[[str], Tuple[List[str], List[str]]]] = {
+    "pymupdf": extract_pages_pymupdf,
+    "pypdf": extract_pages_pypdf
+}
+
+
+class PageCache:
+    """
+    Cache text đã trích xuất trên đĩa: `{directory}/{sha[:2]}/{sha}.{backend}.json`.
+    Ghi file tạm rồi thay thế, nên nhiều process ingest có thể dùng chung một thư mục.
+    """
+
+    def __init__(self, directory: str) -> None:
+        """
+        Args:
+            directory: Thư mục lưu cache
+        """
+        self.directory = directory
+
+    def path(self, content_hash: str, backend: str) -> str:
+        return os.path.join(self.directory, content_hash[:2], f"{content_hash}.{backend}.json")
+
+    def get(self, content_hash: str, backend: str) -> Optional[Tuple[List[str], List[str]]]:
+        try:
+            with open(self.path(content_hash, backend), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("version") != PAGE_CACHE_VERSION:
+            return None
+        return data["pages"], data["links"]
+
+    def put(self, content_hash: str, backend: str, pages: List[str], links: List[str]) -> None:
+        path = self.path(content_hash, backend)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": PAGE_CACHE_VERSION, "pages": pages, "links": links}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+def extract_pages(
+    pdf_file: str,
+    backend: str = DEFAULT_BACKEND,
+    cache_dir: Optional[str] = None,
+    content_hash: Optional[str] = None
+) -> Tuple[List[str], List[str]]:
+    """
+    Text từng trang và link của một file PDF, ưu tiên lấy từ cache.
+
+    Args:
+        pdf_file: Đường dẫn file PDF
+        backend: 'pymupdf' hoặc 'pypdf'; PyMuPDF lỗi thì thử lại bằng pypdf
+        cache_dir: Thư mục cache text theo hash nội dung (None để tắt cache)
+        content_hash: SHA-256 nội dung file nếu đã tính trước (ví dụ khi so với manifest), tránh đọc file hai lần
+
+    Returns:
+        Tuple[List[str], List[str]]: (text từng trang, danh sách link)
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend trích xuất PDF không hợp lệ: {backend} (hỗ trợ {', '.join(BACKENDS)})")
+    cache = PageCache(cache_dir) if cache_dir else None
+    if cache:
+        content_hash = content_hash or file_sha256(pdf_file)
+        cached = cache.get(content_hash, backend)
+        if cached is not None:
+            return cached
+
+    try:
+        pages, links = BACKENDS[backend](pdf_file)
+    except Exception as e:
+        if backend == FALLBACK_BACKEND:
+            raise
+        logger.warning(f"{backend} không đọc được {pdf_file} ({str(e)}), thử lại bằng {FALLBACK_BACKEND}")
+        # Kết quả dự phòng được cache dưới tên backend thật sự đã trích xuất
+        return extract_pages(pdf_file, FALLBACK_BACKEND, cache_dir, content_hash)
+
+    if cache:
+        try:
+            cache.put(content_hash, backend, pages, links)
+        except OSError as e:
+            logger.warning(f"Không thể ghi cache text cho {pdf_file}: {str(e)}")
+    return pages, links
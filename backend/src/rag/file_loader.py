@@ -1,11 +1,18 @@
-from typing import Union, List, Literal, Optional
+from typing import Dict, Iterator, Union, List, Literal, Optional, Tuple
+import queue
+import time
+from itertools import islice
 import glob
 from tqdm import tqdm
 import multiprocessing
 import logging
-from langchain_community.document_loaders import PyPDFLoader
+from functools import partial
+from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from pathlib import Path
+from src.rag.extraction import DEFAULT_BACKEND, extract_pages
+from src.crawl.corpus import read_records
+from src.rag.chunker import StructuredChunker
 # Thiết lập logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -16,25 +23,128 @@ def remove_non_utf_characters(text: str) -> str:
 
 
 
-def load_pdf(pdf_file: str) -> List:
+def load_pdf(
+    pdf_file: str,
+    backend: str = DEFAULT_BACKEND,
+    cache_dir: Optional[str] = None,
+    content_hash: Optional[str] = None,
+    raise_errors: bool = False
+) -> List:
     """
     Tải một file pdf và xử lý nội dung.
 
     Args:
         pdf_file: Đường dẫn đến file PDF
+        backend: Backend trích xuất text ('pymupdf' hoặc 'pypdf', xem `extraction`)
+        cache_dir: Thư mục cache text theo hash nội dung file (None để tắt)
+        content_hash: SHA-256 nội dung file nếu đã tính trước (không phải hash lại khi dùng cache)
+        raise_errors: Ném lỗi khi không tải được file thay vì trả về danh sách rỗng
 
     Return:
-        List: Danh sách các document từ PDF
+        List: Danh sách các document từ PDF (mỗi trang một document)
     """
     try:
-        loader = PyPDFLoader(pdf_file)
-        docs = loader.load()
-        for doc in docs:
-            doc.metadata["source"] = Path(pdf_file).absolute().as_posix()  # Lưu full path
-            doc.metadata["title"] = Path(pdf_file).stem  # Tên file làm title
-        return docs
+        # Link trong PDF được lấy một lần khi ingest, chat không cần mở lại file
+        pages, links = extract_pages(pdf_file, backend=backend, cache_dir=cache_dir, content_hash=content_hash)
+        source = Path(pdf_file).absolute().as_posix()  # Lưu full path
+        return [
+            Document(
+                page_content=text,
+                metadata={
+                    "source": source,
+                    "page": i,
+                    "total_pages": len(pages),
+                    "title": Path(pdf_file).stem,  # Tên file làm title
+                    "links": links
+                }
+            )
+            for i, text in enumerate(pages)
+        ]
     except Exception as e:
+        if raise_errors:
+            raise
         logger.error(f"Không thể tải file {pdf_file}: {str(e)}")
+        return []
+
+def load_jsonl(jsonl_file: str, raise_errors: bool = False) -> List:
+    """
+    Tải một file JSONL của corpus crawl (xem `src.crawl.corpus`), mỗi bản ghi là một document.
+
+    Args:
+        jsonl_file: Đường dẫn đến file JSONL
+        raise_errors: Ném lỗi khi không tải được file thay vì trả về danh sách rỗng
+
+    Return:
+        List: Danh sách các document (mỗi trang web một document)
+    """
+    try:
+        records = list(read_records(jsonl_file))
+        source = Path(jsonl_file).absolute().as_posix()
+        return [
+            Document(
+                page_content=record["text"],
+                metadata={
+                    "source": source,
+                    "page": i,
+                    "total_pages": len(records),
+                    "title": record.get("title") or Path(jsonl_file).stem,
+                    "url": record.get("url"),
+                    "headings": record.get("headings", []),
+                    # URL của trang là link nguồn trả về cho người dùng (như link in trong PDF)
+                    "links": [record["url"]] if record.get("url") else []
+                }
+            )
+            for i, record in enumerate(records)
+            if record.get("text")
+        ]
+    except Exception as e:
+        if raise_errors:
+            raise
+        logger.error(f"Không thể tải file {jsonl_file}: {str(e)}")
+        return []
+
+def load_file(
+    file: str,
+    file_type: str = 'pdf',
+    backend: str = DEFAULT_BACKEND,
+    cache_dir: Optional[str] = None,
+    content_hash: Optional[str] = None,
+    raise_errors: bool = False
+) -> List:
+    """Tải một file theo loại ('pdf' hoặc 'jsonl')."""
+    if file_type == 'jsonl':
+        return load_jsonl(file, raise_errors=raise_errors)
+    return load_pdf(file, backend=backend, cache_dir=cache_dir, content_hash=content_hash, raise_errors=raise_errors)
+
+def load_and_split(
+    pdf_file: str,
+    split_kwargs: dict,
+    backend: str = DEFAULT_BACKEND,
+    cache_dir: Optional[str] = None,
+    file_type: str = 'pdf',
+    content_hash: Optional[str] = None
+) -> Tuple[List, int, float]:
+    """
+    Tải một file và chia chunk ngay trong process đang tải (dùng cho process pool khi ingest).
+    Lỗi khi tải file được ném ra để phân biệt với file tải được nhưng không có nội dung (không có chunk).
+
+    Args:
+        pdf_file: Đường dẫn đến file dữ liệu
+        split_kwargs: Tham số cho bộ chia chunk (xem `make_splitter`)
+        backend: Backend trích xuất text PDF
+        cache_dir: Thư mục cache text PDF theo hash nội dung file
+        file_type: Loại file ('pdf' hoặc 'jsonl')
+        content_hash: SHA-256 nội dung file nếu đã tính trước (ví dụ trong `sync_index`)
+
+    Returns:
+        Tuple[List, int, float]: (các chunk, số trang, thời gian xử lý tính bằng giây)
+    """
+    start = time.perf_counter()
+    docs = load_file(
+        pdf_file, file_type=file_type, backend=backend, cache_dir=cache_dir, content_hash=content_hash, raise_errors=True
+    )
+    chunks = make_splitter(split_kwargs).split_documents(docs) if docs else []
+    return chunks, len(docs), time.perf_counter() - start
 
 def get_num_cpu() -> int:
     """Lấy số lượng CPU có sẵn."""  
@@ -49,8 +159,12 @@ class BaseLoader:
         pass
 
 class PDFLoader(BaseLoader):
-    def __init__(self):
+    file_type = 'pdf'
+
+    def __init__(self, backend: str = DEFAULT_BACKEND, cache_dir: Optional[str] = None):
         super().__init__()
+        self.backend = backend
+        self.cache_dir = cache_dir
 
     def __call__(self, pdf_files: List[str], **kwargs):
         """
@@ -65,13 +179,14 @@ class PDFLoader(BaseLoader):
         """
         workers = kwargs.get("workers", 1)
         num_processes = min(self.num_cpu_process, workers)
+        load = partial(load_file, file_type=self.file_type, backend=self.backend, cache_dir=self.cache_dir)
 
         if num_processes > 1:
             with multiprocessing.Pool(processes=num_processes) as pool:
                 doc_loaded = []
                 total_files = len(pdf_files)
                 with tqdm(total=total_files, desc="Đang tải PDF", unit="file") as pbar:
-                    for result in pool.imap_unordered(load_pdf, pdf_files):
+                    for result in pool.imap_unordered(load, pdf_files):
                         doc_loaded.extend(result)
                         pbar.update(1)
         else:
@@ -79,17 +194,24 @@ class PDFLoader(BaseLoader):
             total_files = len(pdf_files)
             with tqdm(total=total_files, desc="Đang tải PDF", unit="file") as pbar:
                 for pdf_file in pdf_files:
-                    result = load_pdf(pdf_file)
+                    result = load(pdf_file)
                     doc_loaded.extend(result)
                     pbar.update(1)
         
-        logger.info(f"Đã tải {len(doc_loaded)} trang từ file PDF")
+        logger.info(f"Đã tải {len(doc_loaded)} trang từ file {self.file_type.upper()}")
         return doc_loaded
+
+class JSONLLoader(PDFLoader):
+    """Tải corpus JSONL do crawler ghi ra; text đã có sẵn nên không cần backend/cache trích xuất."""
+    file_type = 'jsonl'
+
+    def __init__(self):
+        super().__init__(cache_dir=None)
     
 class TextSplitter:
-    """Phân chia văn bản thành các đoạn nhỏ hơn."""
+    """Phân chia văn bản thành các đoạn nhỏ hơn theo số ký tự."""
     def __init__(self,
-                separators: List[str] = ["\n", " ",",", ".", ";","\n\n"],
+                separators: List[str] = ["\n\n", "\n", ". ", "; ", ", ", " ", ""],
                 chunk_size: int = 300,
                 chunk_overlap: int = 30
                 ) -> None:
@@ -107,6 +229,9 @@ class TextSplitter:
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap
         )
+
+    def split_documents(self, documents):
+        return self.splitter.split_documents(documents)
     def __call__(self, documents):
         """
         Phân chia documents thành các đoạn nhỏ hơn.
@@ -126,17 +251,38 @@ class TextSplitter:
         return chunks
         
 
+def make_splitter(split_kwargs: dict):
+    """
+    Tạo bộ chia chunk từ `split_kwargs`: khoá "chunker" là 'structured' (`StructuredChunker`, theo heading/
+    đoạn/câu và số token) hoặc 'recursive' (mặc định, `TextSplitter` theo số ký tự); các khoá còn lại
+    là tham số của bộ chia tương ứng.
+    """
+    kwargs = dict(split_kwargs)
+    if kwargs.pop("chunker", "recursive") == "structured":
+        return StructuredChunker(**kwargs)
+    return TextSplitter(**kwargs)
+
 class Loader:
     """Lớp chính để tải và xử lý các tài liệu"""
     def __init__(self,
-                file_type: Literal['pdf'] = 'pdf',
-                split_kwargs: Optional[dict] = None
+                file_type: Literal['pdf', 'jsonl'] = 'pdf',
+                split_kwargs: Optional[dict] = None,
+                backend: str = DEFAULT_BACKEND,
+                cache_dir: Optional[str] = None
                 ) -> None:
-        if file_type != 'pdf':
-            raise ValueError("Hiện tại chỉ hỗ trợ file PDF")
+        """
+        Args:
+            file_type: Loại file: 'pdf' hoặc 'jsonl' (corpus do crawler ghi ra)
+            split_kwargs: Tham số cho bộ chia chunk (xem `make_splitter`)
+            backend: Backend trích xuất text PDF: 'pymupdf' (mặc định, pypdf làm dự phòng) hoặc 'pypdf'
+            cache_dir: Thư mục cache text từng trang theo hash nội dung file, để chia chunk lại
+                không phải parse lại PDF (None để tắt)
+        """
+        if file_type not in ('pdf', 'jsonl'):
+            raise ValueError("Hiện tại chỉ hỗ trợ file PDF và JSONL")
         
         self.file_type = file_type
-        self.doc_loader = PDFLoader()
+        self.doc_loader = PDFLoader(backend=backend, cache_dir=cache_dir) if file_type == 'pdf' else JSONLLoader()
 
         #Tham số mặc định cho text splitter
         if split_kwargs is None:
@@ -145,7 +291,8 @@ class Loader:
                 "chunk_overlap":100
             }
 
-        self.doc_splitter = TextSplitter(**split_kwargs)
+        self.split_kwargs = split_kwargs
+        self.doc_splitter = make_splitter(split_kwargs)
 
 
     def load(self, pdf_files: Union[str, List[str]], workers: int = 1):
@@ -176,28 +323,89 @@ class Loader:
         
         doc_split = self.doc_splitter(doc_loaded)
         return doc_split
+
+    def iter_load(
+        self,
+        pdf_files: List[str],
+        workers: int = 1,
+        max_pending: Optional[int] = None,
+        content_hashes: Optional[Dict[str, str]] = None
+    ) -> Iterator[Tuple[str, List, int, float]]:
+        """
+        Tải và chia chunk từng file một (trong process pool), trả về dần theo thứ tự tải xong
+        thay vì gom toàn bộ corpus.
+
+        Args:
+            pdf_files: Danh sách đường dẫn các file PDF
+            workers: Số process dùng để tải và chia chunk
+            max_pending: Số file tối đa đang được tải/chờ xử lý cùng lúc (mặc định 2 x workers),
+                giới hạn bộ nhớ khi phía tiêu thụ chậm hơn
+            content_hashes: Hash nội dung đã tính của từng file (dùng làm khoá cache text, không hash lại)
+
+        Yields:
+            Tuple[str, Optional[List], int, float]: (đường dẫn file, các chunk của file - None nếu không tải được,
+            rỗng nếu file không có nội dung, số trang, thời gian tải + chia chunk tính bằng giây)
+        """
+        content_hashes = content_hashes or {}
+        num_processes = min(self.doc_loader.num_cpu_process, workers)
+        if num_processes <= 1:
+            for pdf_file in pdf_files:
+                try:
+                    result = load_and_split(
+                        pdf_file, self.split_kwargs, self.doc_loader.backend, self.doc_loader.cache_dir, self.file_type,
+                        content_hashes.get(pdf_file)
+                    )
+                except Exception as e:
+                    logger.error(f"Không thể xử lý file {pdf_file}: {str(e)}")
+                    result = (None, 0, 0.0)
+                yield (pdf_file, *result)
+            return
+
+        max_pending = max_pending or 2 * num_processes
+        done = queue.Queue()
+        with multiprocessing.Pool(processes=num_processes) as pool:
+            files = iter(pdf_files)
+
+            def submit(count: int) -> int:
+                submitted = 0
+                for pdf_file in islice(files, count):
+                    pool.apply_async(
+                        load_and_split,
+                        (pdf_file, self.split_kwargs, self.doc_loader.backend, self.doc_loader.cache_dir, self.file_type,
+                         content_hashes.get(pdf_file)),
+                        callback=lambda result, pdf_file=pdf_file: done.put((pdf_file, result)),
+                        error_callback=lambda error, pdf_file=pdf_file: done.put((pdf_file, error))
+                    )
+                    submitted += 1
+                return submitted
+
+            pending = submit(max_pending)
+            while pending:
+                pdf_file, result = done.get()
+                pending += submit(1) - 1
+                if isinstance(result, BaseException):
+                    logger.error(f"Không thể xử lý file {pdf_file}: {str(result)}")
+                    result = (None, 0, 0.0)
+                yield (pdf_file, *result)
     
     def load_dir(self, dir_path: str, workers: int = 1):
         """
-        Tải tất cả file PDF từ một thư mục.
+        Tải tất cả file dữ liệu (theo `file_type`) từ một thư mục.
         
         Args:
-            dir_path: Đường dẫn đến thư mục các file PDF
+            dir_path: Đường dẫn đến thư mục các file dữ liệu
             workers: Số luồng xử lý đồng thời
 
         Returns:
             List: Danh sách các document đã được phân chia
         """
 
-        if self.file_type == "pdf":
-            dir_path = str(Path(dir_path).resolve()) 
-            files = list(Path(dir_path).glob("*.pdf"))
-            if not files:
-                logger.error(f"Không tìm thấy file nào trong {dir_path}")
-                return []
-        else:
-            raise ValueError("Hiện tại chỉ hỗ trợ file PDF")
-        logger.info(f"Tìm thấy {len(files)} file PDF trong thư mục {dir_path}")
+        dir_path = str(Path(dir_path).resolve()) 
+        files = list(Path(dir_path).glob(f"*.{self.file_type}"))
+        if not files:
+            logger.error(f"Không tìm thấy file nào trong {dir_path}")
+            return []
+        logger.info(f"Tìm thấy {len(files)} file {self.file_type.upper()} trong thư mục {dir_path}")
         return self.load(files,workers=workers)
 
 #if __name__ == "__main__":
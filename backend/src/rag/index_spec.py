@@ -0,0 +1,193 @@
+from dataclasses import dataclass, fields
+from typing import ClassVar, Optional
+import logging
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class IndexSpec:
+    """
+    Cấu hình loại FAISS index được dùng khi build vector database.
+
+    - flat: tìm kiếm chính xác, chi phí tuyến tính theo số vector
+    - ivfflat: chia vector thành `nlist` cụm, mỗi truy vấn chỉ duyệt `nprobe` cụm
+    - hnsw: đồ thị HNSW với `M` láng giềng, `ef_search` càng lớn càng chính xác (và chậm)
+    - ivfpq: như ivfflat nhưng nén vector bằng product quantization (`pq_m` x `pq_bits` bit)
+
+    `storage` chọn cách lưu vector cho flat/ivfflat/hnsw: float32, fp16 (nhỏ hơn 2 lần) hoặc
+    sq8 (scalar quantization int8, nhỏ hơn 4 lần). `refine` > 0 tính lại khoảng cách chính xác
+    bằng float32 cho `k * refine` ứng viên (IndexRefineFlat) - tăng recall nhưng giữ thêm một
+    bản float32 của vector trong RAM.
+
+    Các index IVF/PQ/SQ được train trên chính các vector lúc build; nlist tự giảm khi corpus quá nhỏ.
+    """
+
+    KINDS: ClassVar[tuple] = ("flat", "ivfflat", "hnsw", "ivfpq")
+    STORAGES: ClassVar[dict] = {
+        "float32": None,
+        "fp16": faiss.ScalarQuantizer.QT_fp16,
+        "sq8": faiss.ScalarQuantizer.QT_8bit
+    }
+    # FAISS khuyến nghị tối thiểu ~39 điểm train cho mỗi centroid
+    MIN_POINTS_PER_CENTROID: ClassVar[int] = 39
+
+    kind: str = "flat"
+    nlist: int = 256
+    nprobe: int = 16
+    M: int = 32
+    ef_construction: int = 80
+    ef_search: int = 64
+    pq_m: int = 16
+    pq_bits: int = 8
+    storage: str = "float32"
+    refine: int = 0
+
+    def __post_init__(self) -> None:
+        self.kind = self.kind.lower()
+        if self.kind not in self.KINDS:
+            raise ValueError(f"Loại index không hợp lệ: {self.kind} (hỗ trợ {', '.join(self.KINDS)})")
+        if self.storage not in self.STORAGES:
+            raise ValueError(f"storage không hợp lệ: {self.storage} (hỗ trợ {', '.join(self.STORAGES)})")
+        if self.kind == "ivfpq" and self.storage != "float32":
+            raise ValueError("ivfpq đã nén vector bằng PQ, không dùng chung với storage")
+
+    @classmethod
+    def from_string(cls, value: Optional[str]) -> "IndexSpec":
+        """
+        Tạo IndexSpec từ chuỗi cấu hình, ví dụ "hnsw,M=32,ef_search=128", "ivfflat,nlist=1024,nprobe=32"
+        hoặc "flat,storage=sq8,refine=4".
+
+        Args:
+            value: Chuỗi cấu hình (rỗng/None -> flat)
+
+        Returns:
+            IndexSpec: Cấu hình index
+        """
+        if not value:
+            return cls()
+        kind, *params = [part.strip() for part in value.split(",") if part.strip()]
+        types = {field.name: field.type for field in fields(cls)}
+        kwargs = {}
+        for param in params:
+            key, _, raw = param.partition("=")
+            if key not in types or key == "kind":
+                raise ValueError(f"Tham số index không hợp lệ: {key}")
+            kwargs[key] = types[key](raw)
+        return cls(kind=kind, **kwargs)
+
+    def __str__(self) -> str:
+        params = {
+            "flat": (),
+            "ivfflat": ("nlist", "nprobe"),
+            "hnsw": ("M", "ef_construction", "ef_search"),
+            "ivfpq": ("nlist", "nprobe", "pq_m", "pq_bits")
+        }[self.kind]
+        if self.storage != "float32":
+            params += ("storage",)
+        if self.refine:
+            params += ("refine",)
+        return ",".join([self.kind] + [f"{name}={getattr(self, name)}" for name in params])
+
+    @property
+    def build_key(self) -> str:
+        """
+        Chuỗi chỉ gồm các tham số lúc build (loại index, nlist, M, ef_construction, PQ, storage, có refine hay không),
+        dùng để biết khi nào phải build lại index; đổi nprobe/ef_search/hệ số refine không làm thay đổi chuỗi này.
+        """
+        params = {
+            "flat": (),
+            "ivfflat": ("nlist",),
+            "hnsw": ("M", "ef_construction"),
+            "ivfpq": ("nlist", "pq_m", "pq_bits")
+        }[self.kind]
+        parts = [self.kind] + [f"{name}={getattr(self, name)}" for name in params]
+        if self.storage != "float32":
+            parts.append(f"storage={self.storage}")
+        if self.refine:
+            parts.append("refine")
+        return ",".join(parts)
+
+    @property
+    def training_size(self) -> int:
+        """Số vector nên gom trước khi build để train đủ `nlist` cụm (0 nếu index không cần nhiều dữ liệu train)."""
+        if self.kind in ("ivfflat", "ivfpq"):
+            return self.nlist * self.MIN_POINTS_PER_CENTROID
+        return 0
+
+    def _effective_nlist(self, n_train: int) -> int:
+        nlist = max(1, min(self.nlist, n_train // self.MIN_POINTS_PER_CENTROID))
+        if nlist < self.nlist:
+            logger.warning(f"Chỉ có {n_train} vector để train, giảm nlist từ {self.nlist} xuống {nlist}")
+        return nlist
+
+    def build(self, vectors: np.ndarray, metric: int = faiss.METRIC_L2) -> faiss.Index:
+        """
+        Tạo index rỗng (đã train nếu cần) cho các vector đầu vào; chưa add vector nào.
+
+        Args:
+            vectors: Ma trận float32 (n, d) dùng để train
+            metric: faiss.METRIC_L2 hoặc faiss.METRIC_INNER_PRODUCT
+
+        Returns:
+            faiss.Index: Index sẵn sàng để add
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        index = self._build_base(vectors, metric)
+        if not index.is_trained:
+            logger.info(f"Đang train {self} trên {len(vectors)} vector")
+            index.train(vectors)
+        self.apply_search_params(index)
+        if self.refine:
+            index = faiss.IndexRefineFlat(index)
+            index.k_factor = self.refine
+        return index
+
+    def _build_base(self, vectors: np.ndarray, metric: int) -> faiss.Index:
+        n, d = vectors.shape
+        qtype = self.STORAGES[self.storage]
+
+        if self.kind == "flat":
+            if qtype is None:
+                return faiss.IndexFlat(d, metric)
+            return faiss.IndexScalarQuantizer(d, qtype, metric)
+
+        if self.kind == "hnsw":
+            if qtype is None:
+                index = faiss.IndexHNSWFlat(d, self.M, metric)
+            else:
+                index = faiss.IndexHNSWSQ(d, qtype, self.M, metric)
+            index.hnsw.efConstruction = self.ef_construction
+            return index
+
+        if self.kind == "ivfpq" and d % self.pq_m != 0:
+            raise ValueError(f"pq_m={self.pq_m} phải là ước của số chiều vector {d}")
+        if self.kind == "ivfpq" and n < 2 ** self.pq_bits:
+            logger.warning(f"Không đủ vector để train PQ ({n} < {2 ** self.pq_bits}), dùng IVFFlat")
+            return IndexSpec("ivfflat", nlist=self.nlist, nprobe=self.nprobe)._build_base(vectors, metric)
+
+        nlist = self._effective_nlist(n)
+        quantizer = faiss.IndexFlat(d, metric)
+        if self.kind == "ivfpq":
+            return faiss.IndexIVFPQ(quantizer, d, nlist, self.pq_m, self.pq_bits, metric)
+        if qtype is None:
+            return faiss.IndexIVFFlat(quantizer, d, nlist, metric)
+        return faiss.IndexIVFScalarQuantizer(quantizer, d, nlist, qtype, metric)
+
+    def apply_search_params(self, index: faiss.Index) -> None:
+        """
+        Áp dụng tham số lúc tìm kiếm (nprobe / efSearch) cho index đã build hoặc load từ đĩa,
+        để chỉnh độ chính xác/tốc độ mà không cần build lại.
+        """
+        index = faiss.downcast_index(index)
+        if isinstance(index, faiss.IndexRefine):
+            if self.refine:
+                index.k_factor = self.refine
+            index = faiss.downcast_index(index.base_index)
+        if self.kind in ("ivfflat", "ivfpq") and isinstance(index, faiss.IndexIVF):
+            index.nprobe = min(self.nprobe, index.nlist)
+        elif self.kind == "hnsw" and isinstance(index, faiss.IndexHNSW):
+            index.hnsw.efSearch = self.ef_search
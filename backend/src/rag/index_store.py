@@ -0,0 +1,319 @@
+"""
+Định dạng lưu index không dùng pickle, load gần như tức thì:
+
+- `index`: FAISS index ghi bằng `faiss.write_index`, đọc lại với `IO_FLAG_MMAP` nên
+  các inverted list được memory-map (nhiều worker dùng chung một bản trong page cache).
+- `docstore.sqlite`: nội dung + metadata của chunk và bảng vị trí -> id, đọc theo nhu cầu.
+
+Hai file của mỗi lần lưu nằm chung một thư mục thế hệ `{index_name}.mmap/<số thế hệ>/`; file
+`{index_name}.mmap/CURRENT` trỏ tới thế hệ hiện tại và được thay thế bằng một `os.replace` duy nhất,
+nên worker load giữa chừng luôn thấy index và docstore của cùng một lần lưu.
+
+FAISS chỉ memory-map được dữ liệu của họ IVF, nên IndexFlat được lưu dưới dạng IndexIVFFlat với
+một cluster duy nhất: kết quả tìm kiếm giống hệt (vẫn duyệt toàn bộ vector) nhưng mmap được.
+"""
+
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import logging
+from typing import Dict, List, Optional, Tuple, Union
+
+import faiss
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+
+INDEX_FILE = "index"
+DOCSTORE_FILE = "docstore.sqlite"
+CURRENT_FILE = "CURRENT"
+
+
+def mmap_dir(folder: str, index_name: str) -> str:
+    return os.path.join(folder, f"{index_name}.mmap")
+
+
+def index_path(folder: str, index_name: str) -> str:
+    """File index của định dạng cũ (trước khi lưu theo thế hệ)."""
+    return os.path.join(folder, f"{index_name}.index")
+
+
+def docstore_path(folder: str, index_name: str) -> str:
+    """File docstore của định dạng cũ (trước khi lưu theo thế hệ)."""
+    return os.path.join(folder, f"{index_name}.docstore.sqlite")
+
+
+def _generations(root: str) -> List[str]:
+    if not os.path.isdir(root):
+        return []
+    return sorted(name for name in os.listdir(root) if name.isdigit())
+
+
+def current_files(folder: str, index_name: str) -> Optional[Tuple[str, str]]:
+    """
+    (file index, file docstore) của lần lưu hiện tại, đọc từ CURRENT (hoặc cặp file định dạng cũ);
+    None nếu chưa lưu.
+    """
+    root = mmap_dir(folder, index_name)
+    try:
+        with open(os.path.join(root, CURRENT_FILE), "r", encoding="utf-8") as f:
+            generation = f.read().strip()
+        return os.path.join(root, generation, INDEX_FILE), os.path.join(root, generation, DOCSTORE_FILE)
+    except FileNotFoundError:
+        pass
+    legacy = index_path(folder, index_name), docstore_path(folder, index_name)
+    return legacy if all(os.path.exists(path) for path in legacy) else None
+
+
+def mmap_files_exist(folder: str, index_name: str) -> bool:
+    return current_files(folder, index_name) is not None
+
+
+class SQLiteDocstore(Docstore):
+    """
+    Docstore chỉ đọc lưu chunk trong SQLite, chỉ đọc các document được truy vấn thay vì unpickle toàn bộ.
+
+    File không bao giờ bị sửa tại chỗ: mỗi lần lưu ghi một file mới rồi thay thế, nên các worker
+    đang đọc bản cũ không bị ảnh hưởng.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Args:
+            path: Đường dẫn file SQLite (tạo mới nếu chưa có)
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS docs (
+                id TEXT PRIMARY KEY,
+                page_content TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS positions (
+                position INTEGER PRIMARY KEY,
+                id TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+        """)
+        self._conn.commit()
+
+    def search(self, search: str) -> Union[str, Document]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT page_content, metadata FROM docs WHERE id = ?", (search,)
+            ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(id=search, page_content=row[0], metadata=json.loads(row[1]))
+
+    def write_documents(self, documents: Dict[str, Document]) -> None:
+        """Ghi các document (chỉ dùng khi tạo file mới trong `save_mmap`)."""
+        rows = [
+            (doc_id, doc.page_content, json.dumps(doc.metadata, ensure_ascii=False))
+            for doc_id, doc in documents.items()
+        ]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO docs (id, page_content, metadata) VALUES (?, ?, ?)", rows)
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def read_positions(self) -> Dict[int, str]:
+        """Bảng vị trí trong FAISS index -> id document."""
+        with self._lock:
+            return dict(self._conn.execute("SELECT position, id FROM positions ORDER BY position"))
+
+    def write_positions(self, index_to_docstore_id: Dict[int, str]) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM positions")
+            self._conn.executemany("INSERT INTO positions (position, id) VALUES (?, ?)", index_to_docstore_id.items())
+            self._conn.commit()
+
+    def get_meta(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key: str, value: str) -> None:
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def to_mmap_index(index: faiss.Index) -> faiss.Index:
+    """
+    Đổi IndexFlat thành IndexIVFFlat một cluster (cùng kết quả tìm kiếm) để có thể memory-map.
+    Các loại index khác được giữ nguyên.
+    """
+    # Trả về đúng object gốc: wrapper của downcast_index không sở hữu index C++ bên dưới
+    if not isinstance(faiss.downcast_index(index), faiss.IndexFlat):
+        return index
+    quantizer = faiss.IndexFlat(index.d, index.metric_type)
+    quantizer.add(np.zeros((1, index.d), dtype=np.float32))
+    ivf = faiss.IndexIVFFlat(quantizer, index.d, 1, index.metric_type)
+    ivf.is_trained = True
+    if index.ntotal:
+        ivf.add(index.reconstruct_n(0, index.ntotal))
+    return ivf
+
+
+def remove_from_index(db: FAISS, ids: List[str]) -> None:
+    """
+    Xoá document khỏi FAISS vectorstore với mọi loại index.
+
+    `FAISS.delete` giả định vị trí vector bị dồn lại sau `remove_ids`, điều chỉ đúng với IndexFlat.
+    Index IVF xoá tại chỗ bằng `remove_ids` rồi đánh số lại id trong các inverted list cho liền mạch
+    (không phải encode lại vector). HNSW (và index bọc IndexRefine) không xoá được vector nên được dựng
+    lại từ các vector còn lại, giữ nguyên phần đã train.
+    """
+    index = faiss.downcast_index(db.index)
+    if isinstance(index, faiss.IndexFlatCodes):
+        db.delete(ids)
+        return
+
+    drop = set(ids)
+    keep = [position for position, doc_id in sorted(db.index_to_docstore_id.items()) if doc_id not in drop]
+    removed = [position for position, doc_id in db.index_to_docstore_id.items() if doc_id in drop]
+    if isinstance(index, faiss.IndexIVF) and isinstance(faiss.downcast_InvertedLists(index.invlists), faiss.ArrayInvertedLists):
+        _remove_from_ivf(index, np.asarray(removed, dtype=np.int64), np.asarray(keep, dtype=np.int64))
+    else:
+        rebuilt = faiss.clone_index(index)
+        rebuilt.reset()
+        if keep:
+            rebuilt.add(index.reconstruct_batch(np.asarray(keep, dtype=np.int64)))
+        db.index = rebuilt
+    db.docstore.delete(list(drop))
+    db.index_to_docstore_id = {i: db.index_to_docstore_id[position] for i, position in enumerate(keep)}
+
+
+def _remove_from_ivf(index: faiss.IndexIVF, removed: np.ndarray, keep: np.ndarray) -> None:
+    """
+    Xoá các vị trí `removed` khỏi index IVF rồi đổi id của các vị trí `keep` (đã sắp xếp) thành 0..len(keep)-1,
+    để `add` tiếp theo (gán id từ `ntotal`) không trùng id cũ.
+    """
+    # DirectMap dạng mảng không hỗ trợ remove_ids; map cũ cũng không còn đúng sau khi đánh số lại
+    index.set_direct_map_type(faiss.DirectMap.NoMap)
+    index.remove_ids(faiss.IDSelectorBatch(removed))
+    if not len(keep):
+        return
+    remap = np.full(int(keep[-1]) + 1, -1, dtype=np.int64)
+    remap[keep] = np.arange(len(keep), dtype=np.int64)
+    invlists = index.invlists
+    for list_no in range(invlists.nlist):
+        size = invlists.list_size(list_no)
+        if size:
+            list_ids = faiss.rev_swig_ptr(invlists.get_ids(list_no), size)
+            list_ids[:] = remap[list_ids]
+
+
+def save_mmap(db: FAISS, folder: str, index_name: str) -> None:
+    """
+    Lưu FAISS vectorstore theo định dạng mmap vào một thế hệ mới rồi chuyển CURRENT sang thế hệ đó.
+
+    Không sửa file của thế hệ cũ nên các worker đang memory-map bản cũ vẫn đọc được tới khi khởi động lại.
+    `db` không bị thay đổi (IndexFlat chỉ được chuyển sang dạng mmap được trên bản ghi xuống đĩa).
+    """
+    # Vectorstore mở chỉ đọc thì chưa bị sửa, không cần ghi lại
+    if is_read_only(db):
+        return
+    root = mmap_dir(folder, index_name)
+    os.makedirs(root, exist_ok=True)
+    generations = _generations(root)
+    generation = f"{int(generations[-1]) + 1 if generations else 1:08d}"
+    generation_dir = os.path.join(root, generation)
+    os.makedirs(generation_dir)
+
+    store = SQLiteDocstore(os.path.join(generation_dir, DOCSTORE_FILE))
+    store.write_documents({doc_id: db.docstore.search(doc_id) for doc_id in db.index_to_docstore_id.values()})
+    store.write_positions(db.index_to_docstore_id)
+    store.set_meta("distance_strategy", str(db.distance_strategy.value))
+    store.set_meta("normalize_L2", json.dumps(bool(db._normalize_L2)))
+    store.close()
+    faiss.write_index(to_mmap_index(db.index), os.path.join(generation_dir, INDEX_FILE))
+
+    current = os.path.join(root, CURRENT_FILE)
+    previous = current_files(folder, index_name)
+    with open(f"{current}.tmp", "w", encoding="utf-8") as f:
+        f.write(generation)
+    os.replace(f"{current}.tmp", current)
+
+    # Dọn các thế hệ cũ (kể cả thế hệ dở dang của lần lưu bị dừng) và cặp file định dạng cũ; giữ lại thế hệ
+    # liền trước cho worker vừa đọc CURRENT nhưng chưa kịp mở file
+    keep = {generation}
+    if previous is not None:
+        keep.add(os.path.basename(os.path.dirname(previous[0])))
+    for name in _generations(root):
+        if name not in keep:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+    for path in (index_path(folder, index_name), docstore_path(folder, index_name)):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def load_mmap(folder: str, index_name: str, embedding: Embeddings, writable: bool = False) -> FAISS:
+    """
+    Load FAISS vectorstore từ định dạng mmap.
+
+    Args:
+        folder: Thư mục chứa index
+        index_name: Tên index
+        embedding: Mô hình embedding cho câu hỏi
+        writable: Đọc toàn bộ index và docstore vào RAM để có thể thêm/xoá (bản memory-map chỉ đọc)
+
+    Returns:
+        FAISS: Vectorstore dùng SQLiteDocstore (hoặc InMemoryDocstore nếu `writable`)
+    """
+    flags = 0 if writable else faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    files = current_files(folder, index_name)
+    if files is None:
+        raise FileNotFoundError(f"Không tìm thấy index mmap {index_name} trong {folder}")
+    index = faiss.read_index(files[0], flags)
+    store = SQLiteDocstore(files[1])
+    positions = store.read_positions()
+    docstore = store
+    if writable:
+        docstore = InMemoryDocstore({doc_id: store.search(doc_id) for doc_id in positions.values()})
+    db = FAISS(
+        embedding_function=embedding,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=positions,
+        normalize_L2=json.loads(store.get_meta("normalize_L2", "false")),
+        distance_strategy=DistanceStrategy(store.get_meta("distance_strategy", DistanceStrategy.EUCLIDEAN_DISTANCE.value))
+    )
+    if writable:
+        store.close()
+    return db
+
+
+def is_read_only(db: FAISS) -> bool:
+    """
+    True nếu vectorstore được mở chỉ đọc bởi `load_mmap` (docstore SQLite và/hoặc index memory-map);
+    muốn thêm/xoá phải load lại với `writable=True`.
+    """
+    if isinstance(db.docstore, SQLiteDocstore):
+        return True
+    index = faiss.downcast_index(db.index)
+    return isinstance(index, faiss.IndexIVF) and isinstance(
+        faiss.downcast_InvertedLists(index.invlists), faiss.OnDiskInvertedLists
+    )
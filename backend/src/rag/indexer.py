@@ -0,0 +1,227 @@
+import argparse
+import hashlib
+import json
+import os
+import logging
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.rag.extraction import file_sha256
+from src.rag.file_loader import Loader
+from src.rag.ingest import ingest_files
+from src.rag.vectorstore import VectorDB
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+
+
+def chunk_id(source: str, content_hash: str, index: int) -> str:
+    """Id cố định của chunk thứ `index` trong một file, phụ thuộc đường dẫn và nội dung file."""
+    source_hash = hashlib.sha1(source.encode("utf-8")).hexdigest()[:12]
+    return f"{source_hash}-{content_hash[:16]}-{index}"
+
+
+class IndexManifest:
+    """
+    Manifest lưu cạnh vector index: hash nội dung và id các chunk của từng file đã được index.
+
+    Cấu trúc file JSON:
+        {"version": 1, "config": {...}, "files": {source: {"sha256", "size", "mtime", "chunk_ids"}}}
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Args:
+            path: Đường dẫn file manifest (thường là `{persist_directory}/{index_name}.manifest.json`)
+        """
+        self.path = path
+        self.config: Dict[str, Any] = {}
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.exists = os.path.exists(path)
+        if self.exists:
+            self.load()
+
+    @classmethod
+    def for_index(cls, persist_directory: str, index_name: str) -> "IndexManifest":
+        return cls(os.path.join(persist_directory, f"{index_name}.manifest.json"))
+
+    def load(self) -> None:
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != MANIFEST_VERSION:
+            logger.warning(f"Manifest {self.path} có phiên bản không hỗ trợ, bỏ qua")
+            return
+        self.config = data.get("config", {})
+        self.files = data.get("files", {})
+
+    def save(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"version": MANIFEST_VERSION, "config": self.config, "files": self.files},
+                f,
+                ensure_ascii=False,
+                indent=1
+            )
+        os.replace(tmp_path, self.path)
+        self.exists = True
+
+
+def _scan_files(data_dir: str, pattern: str) -> Dict[str, os.stat_result]:
+    return {
+        path.absolute().as_posix(): path.stat()
+        for path in sorted(Path(data_dir).resolve().glob(pattern))
+        if path.is_file()
+    }
+
+
+def _adopt_existing_index(vectordb: VectorDB, manifest: IndexManifest, files: Dict[str, os.stat_result]) -> None:
+    """
+    Ghi manifest cho một index đã build trước khi có manifest: các file còn trên đĩa được coi là
+    đã index với nội dung hiện tại, nên không phải embed lại toàn bộ corpus.
+    """
+    groups = vectordb.documents_by_source()
+    for source, doc_ids in groups.items():
+        entry = {"sha256": None, "size": None, "mtime": None, "chunk_ids": doc_ids}
+        stat = files.get(source)
+        if stat is not None:
+            entry.update(sha256=file_sha256(source), size=stat.st_size, mtime=stat.st_mtime)
+        manifest.files[source] = entry
+    logger.info(f"Đã tạo manifest từ index hiện có ({len(groups)} file)")
+
+
+def sync_index(
+    vectordb: VectorDB,
+    data_dir: str,
+    loader: Loader,
+    manifest: Optional[IndexManifest] = None,
+    workers: int = 1,
+    pattern: str = "*.pdf",
+    config: Optional[Dict[str, Any]] = None,
+    full: bool = False,
+    batch_size: int = 256,
+    checkpoint_every: int = 2000,
+    embed_workers: int = 1
+) -> Dict[str, Any]:
+    """
+    Đồng bộ vector index với thư mục dữ liệu: chỉ embed file mới/thay đổi và xoá vector của file đã bị xoá.
+
+    File mới/thay đổi được index theo pipeline streaming (`ingest_files`) với checkpoint định kỳ;
+    sync bị dừng giữa chừng có thể chạy lại và tiếp tục từ checkpoint cuối.
+
+    Args:
+        vectordb: Vector database (đã load hoặc rỗng)
+        data_dir: Thư mục chứa dữ liệu
+        loader: Loader để tải và chia chunk các file thay đổi
+        manifest: Manifest của index, mặc định `{persist_directory}/{index_name}.manifest.json`
+        workers: Số process tải + chia chunk
+        pattern: Mẫu glob của file dữ liệu
+        config: Cấu hình ảnh hưởng tới chunk/embedding; nếu khác manifest thì index lại toàn bộ
+        full: Bỏ qua manifest và index lại toàn bộ
+        batch_size: Số chunk cho mỗi lần embed + thêm vào index
+        checkpoint_every: Số chunk giữa hai lần lưu index + manifest
+        embed_workers: Số thread embed chạy song song với bước tải file
+
+    Returns:
+        Dict[str, Any]: Số file added/updated/removed/unchanged, số chunk đã thêm/xoá và
+        thống kê thông lượng của pipeline ingest (key "ingest", nếu có file cần index), số chunk đại diện/
+        gần trùng (key "dedup", nếu `vectordb` bật chống trùng lặp)
+    """
+    if manifest is None:
+        if not vectordb.persist_directory:
+            raise ValueError("Cần persist_directory hoặc manifest để đồng bộ index")
+        manifest = IndexManifest.for_index(vectordb.persist_directory, vectordb.index_name)
+    config = config or {}
+    files = _scan_files(data_dir, pattern)
+
+    if vectordb.db and not manifest.exists and not full:
+        manifest.config = dict(config)
+        _adopt_existing_index(vectordb, manifest, files)
+    if full or manifest.config != config:
+        if manifest.files:
+            logger.info("Cấu hình index thay đổi hoặc yêu cầu index lại toàn bộ")
+        # Build lại index từ đầu (loại index có thể đã đổi), mọi file được coi là mới
+        vectordb.reset()
+        manifest.files = {}
+        manifest.config = dict(config)
+
+    stats = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0, "chunks_added": 0, "chunks_removed": 0}
+    stale_ids: List[str] = []
+    to_index: Dict[str, Tuple[str, os.stat_result]] = {}
+
+    for source in list(manifest.files):
+        if source not in files:
+            stale_ids.extend(manifest.files.pop(source)["chunk_ids"])
+            stats["removed"] += 1
+
+    for source, stat in files.items():
+        entry = manifest.files.get(source)
+        # Cùng kích thước và mtime thì không cần đọc lại file để hash
+        if entry and entry["sha256"] and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            stats["unchanged"] += 1
+            continue
+        content_hash = file_sha256(source)
+        if entry and entry["sha256"] == content_hash:
+            entry.update(size=stat.st_size, mtime=stat.st_mtime)
+            stats["unchanged"] += 1
+            continue
+        if entry:
+            stale_ids.extend(manifest.files.pop(source)["chunk_ids"])
+            stats["updated"] += 1
+        else:
+            stats["added"] += 1
+        to_index[source] = (content_hash, stat)
+
+    # Chunk không thuộc file nào trong manifest: còn sót lại khi lần sync trước bị dừng sau khi lưu index
+    # nhưng trước khi ghi manifest
+    known_ids = {doc_id for entry in manifest.files.values() for doc_id in entry["chunk_ids"]}
+    stale_ids.extend(doc_id for doc_id in vectordb.document_ids() if doc_id not in known_ids)
+    if vectordb.dedup is not None:
+        stale_ids.extend(doc_id for doc_id in vectordb.dedup.ids() if doc_id not in known_ids)
+
+    # Ghi manifest trước khi xoá: nếu bị dừng giữa chừng, chunk cũ chỉ còn là chunk thừa và được dọn ở lần sau
+    manifest.save()
+    stats["chunks_removed"] = vectordb.delete_documents(stale_ids)
+
+    if to_index:
+        logger.info(f"Đang index {len(to_index)} file mới hoặc đã thay đổi")
+        ingested = ingest_files(
+            vectordb,
+            loader,
+            to_index,
+            manifest,
+            chunk_id,
+            workers=workers,
+            embed_workers=embed_workers,
+            batch_size=batch_size,
+            checkpoint_every=checkpoint_every
+        )
+        stats["chunks_added"] = ingested["chunks_added"]
+        stats["ingest"] = ingested
+    if vectordb.dedup is not None:
+        stats["dedup"] = vectordb.dedup.stats()
+
+    logger.info(f"Đồng bộ index xong: {stats}")
+    return stats
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Đồng bộ vector index với thư mục dữ liệu (chỉ embed file thay đổi)")
+    parser.add_argument("--data-dir", default=os.getenv("DATA_DIR", "data_source/generative_ai/pdfs"))
+    parser.add_argument("--data-type", choices=["pdf", "jsonl"], default=os.getenv("DATA_TYPE", "pdf"))
+    parser.add_argument("--data-path", default=os.getenv("DATA_PATH"), help="Thư mục lưu vector index")
+    parser.add_argument("--data-name", default=os.getenv("DATA_NAME"), help="Tên index")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("INGEST_WORKERS", "8")), help="Số process tải + chia chunk")
+    parser.add_argument("--full", action="store_true", help="Index lại toàn bộ dữ liệu")
+    args = parser.parse_args()
+
+    from src.rag.chain_rag import open_vectordb, sync_vectordb
+    vectordb = open_vectordb(args.data_path, args.data_name)
+    print(sync_vectordb(vectordb, args.data_dir, args.data_type, workers=args.workers, full=args.full))
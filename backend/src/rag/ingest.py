@@ -0,0 +1,244 @@
+import os
+import queue
+import threading
+import time
+import logging
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Tuple
+
+from tqdm import tqdm
+from langchain_core.documents import Document
+from src.rag.file_loader import Loader
+from src.rag.vectorstore import VectorDB
+
+if TYPE_CHECKING:
+    from src.rag.indexer import IndexManifest
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class _Batch:
+    """Các chunk của một nhóm file trọn vẹn, đi qua các bước embed -> ghi index cùng nhau."""
+
+    def __init__(self, seq: int) -> None:
+        self.seq = seq
+        self.documents: List[Document] = []
+        self.ids: List[str] = []
+        self.files: List[Tuple[str, Dict[str, Any]]] = []
+        self.failed = 0
+        self.embeddings: List[List[float]] = []
+
+
+def _put(out: queue.Queue, item, stop: threading.Event) -> bool:
+    """Đưa item vào hàng đợi có giới hạn, bỏ cuộc nếu pipeline đã dừng."""
+    while not stop.is_set():
+        try:
+            out.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def ingest_files(
+    vectordb: VectorDB,
+    loader: Loader,
+    files: Dict[str, Tuple[str, os.stat_result]],
+    manifest: "IndexManifest",
+    chunk_id: Callable[[str, str, int], str],
+    workers: int = 1,
+    embed_workers: int = 1,
+    batch_size: int = 256,
+    queue_size: int = 4,
+    checkpoint_every: int = 2000
+) -> Dict[str, Any]:
+    """
+    Index các file theo pipeline ba bước chạy chồng lên nhau, nối bằng hàng đợi có giới hạn:
+
+        process pool tải + chia chunk -> thread embed theo batch -> ghi vào index (thread gọi)
+
+    nên bộ nhớ không tăng theo kích thước corpus và thời gian index lại toàn bộ xấp xỉ bước chậm nhất
+    thay vì tổng các bước.
+
+    Cứ mỗi `checkpoint_every` chunk, index được lưu xuống đĩa rồi mới ghi các file đã index xong vào
+    manifest. Nếu tiến trình bị dừng giữa chừng, lần chạy sau chỉ index tiếp các file chưa có trong
+    manifest (chunk thừa của lần trước được `sync_index` dọn trước khi chạy).
+
+    Args:
+        vectordb: Vector database để thêm chunk
+        loader: Loader để tải và chia chunk
+        files: source -> (hash nội dung, stat) của các file cần index
+        manifest: IndexManifest, được cập nhật ở mỗi checkpoint
+        chunk_id: Hàm tạo id chunk từ (source, hash nội dung, số thứ tự)
+        workers: Số process tải + chia chunk
+        embed_workers: Số thread embed các batch
+        batch_size: Số chunk tối thiểu cho mỗi batch embed + thêm vào index
+        queue_size: Số batch tối đa chờ ở mỗi hàng đợi
+        checkpoint_every: Số chunk giữa hai lần lưu index + manifest
+
+    Returns:
+        Dict[str, Any]: Số file đã index/không tải được, số trang/chunk (kể cả chunk gần trùng đã bỏ qua khi
+        `vectordb` bật chống trùng lặp), thời gian bận của từng bước
+        (parse_s, embed_s, index_s, wall_s) và thông lượng pages/s, chunks/s, embeds/s
+    """
+    stats: Dict[str, Any] = {"files": 0, "failed": 0, "pages": 0, "chunks_added": 0, "chunks_deduplicated": 0}
+    if not files:
+        return stats
+
+    batches: queue.Queue = queue.Queue(maxsize=queue_size)
+    embedded: queue.Queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    timings = {"parse_s": 0.0, "embed_s": 0.0, "index_s": 0.0}
+    timings_lock = threading.Lock()
+    # Index IVF cần đủ vector để train trước khi build lần đầu
+    first_batch_size = batch_size if vectordb.db else max(batch_size, vectordb.index_spec.training_size)
+
+    def produce() -> None:
+        batch = _Batch(0)
+        threshold = first_batch_size
+        try:
+            content_hashes = {source: content_hash for source, (content_hash, _) in files.items()}
+            for source, chunks, pages, seconds in loader.iter_load(list(files), workers=workers, content_hashes=content_hashes):
+                timings["parse_s"] += seconds
+                stats["pages"] += pages
+                if chunks is None:
+                    # File không tải được: không ghi vào manifest để lần sau thử lại
+                    batch.failed += 1
+                    continue
+                content_hash, stat = files[source]
+                doc_ids = [chunk_id(source, content_hash, i) for i in range(len(chunks))]
+                # Id của chính chunk và các chunk liền kề trong file, để mở rộng context không cần tìm lại
+                for i, chunk in enumerate(chunks):
+                    chunk.metadata.update(
+                        chunk_id=doc_ids[i],
+                        prev_chunk_id=doc_ids[i - 1] if i > 0 else None,
+                        next_chunk_id=doc_ids[i + 1] if i + 1 < len(doc_ids) else None
+                    )
+                if vectordb.dedup is not None:
+                    # Chunk gần trùng chunk đã index chỉ được ghi làm tham chiếu ngược, không cần embed
+                    kept = [i for i, chunk in enumerate(chunks) if vectordb.dedup.add(doc_ids[i], chunk) is None]
+                    stats["chunks_deduplicated"] += len(chunks) - len(kept)
+                    chunks, chunk_ids = [chunks[i] for i in kept], [doc_ids[i] for i in kept]
+                else:
+                    chunk_ids = doc_ids
+                batch.documents.extend(chunks)
+                batch.ids.extend(chunk_ids)
+                batch.files.append((source, {
+                    "sha256": content_hash,
+                    "size": stat.st_size,
+                    "mtime": stat.st_mtime,
+                    "chunk_ids": doc_ids
+                }))
+                if len(batch.documents) >= threshold:
+                    if not _put(batches, batch, stop):
+                        return
+                    batch, threshold = _Batch(batch.seq + 1), batch_size
+            if (batch.files or batch.failed) and not _put(batches, batch, stop):
+                return
+        except BaseException as e:
+            _put(batches, e, stop)
+            return
+        for _ in range(embed_workers):
+            _put(batches, _DONE, stop)
+
+    def embed() -> None:
+        while True:
+            try:
+                batch = batches.get(timeout=0.1)
+            except queue.Empty:
+                if stop.is_set():
+                    return
+                continue
+            if batch is _DONE or isinstance(batch, BaseException):
+                _put(embedded, batch, stop)
+                return
+            try:
+                start = time.perf_counter()
+                if batch.documents:
+                    batch.embeddings = vectordb.embedding.embed_documents([doc.page_content for doc in batch.documents])
+                with timings_lock:
+                    timings["embed_s"] += time.perf_counter() - start
+            except BaseException as e:
+                _put(embedded, e, stop)
+                return
+            if not _put(embedded, batch, stop):
+                return
+
+    committed: List[Tuple[str, Dict[str, Any]]] = []
+    since_checkpoint = 0
+    # Các thread embed trả batch theo thứ tự xong việc; batch tới sớm chờ ở đây để được ghi đúng thứ tự tạo,
+    # nhờ đó batch đầu tiên (đủ lớn để train index IVF) luôn là batch build index
+    pending: Dict[int, _Batch] = {}
+    next_seq = 0
+
+    def checkpoint() -> None:
+        nonlocal since_checkpoint
+        if vectordb.db and vectordb.persist_directory:
+            vectordb.save()
+        for source, entry in committed:
+            manifest.files[source] = entry
+        manifest.save()
+        logger.info(f"Checkpoint: {stats['files']}/{len(files)} file, {stats['chunks_added']} chunk")
+        committed.clear()
+        since_checkpoint = 0
+
+    threads = [threading.Thread(target=produce, name="ingest-loader", daemon=True)]
+    threads += [threading.Thread(target=embed, name=f"ingest-embed-{i}", daemon=True) for i in range(embed_workers)]
+    wall_start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    try:
+        remaining = embed_workers
+        with tqdm(total=len(files), desc="Đang index", unit="file") as pbar:
+            while remaining:
+                batch = embedded.get()
+                if batch is _DONE:
+                    remaining -= 1
+                    continue
+                if isinstance(batch, BaseException):
+                    raise batch
+                pending[batch.seq] = batch
+                while next_seq in pending:
+                    batch = pending.pop(next_seq)
+                    next_seq += 1
+                    start = time.perf_counter()
+                    if batch.documents:
+                        vectordb.add_documents(batch.documents, ids=batch.ids, save=False, embeddings=batch.embeddings)
+                    committed.extend(batch.files)
+                    stats["files"] += len(batch.files)
+                    stats["failed"] += batch.failed
+                    stats["chunks_added"] += len(batch.documents)
+                    since_checkpoint += len(batch.documents)
+                    if since_checkpoint >= checkpoint_every:
+                        checkpoint()
+                    timings["index_s"] += time.perf_counter() - start
+                    pbar.update(len(batch.files) + batch.failed)
+        start = time.perf_counter()
+        checkpoint()
+        timings["index_s"] += time.perf_counter() - start
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    wall = time.perf_counter() - wall_start
+    # Thời gian bận của process pool được chia cho số process để so được với các bước khác
+    parse_s = timings["parse_s"] / max(1, min(workers, loader.doc_loader.num_cpu_process))
+    embed_s = timings["embed_s"] / embed_workers
+    stats.update(
+        parse_s=round(parse_s, 2),
+        embed_s=round(embed_s, 2),
+        index_s=round(timings["index_s"], 2),
+        wall_s=round(wall, 2),
+        pages_per_s=round(stats["pages"] / parse_s, 1) if parse_s else None,
+        chunks_per_s=round(stats["chunks_added"] / wall, 1) if wall else None,
+        embeds_per_s=round(stats["chunks_added"] / embed_s, 1) if embed_s else None
+    )
+    logger.info(
+        f"Ingest xong {stats['files']} file ({stats['pages']} trang, {stats['chunks_added']} chunk, "
+        f"bỏ {stats['chunks_deduplicated']} chunk trùng) trong {stats['wall_s']}s: "
+        f"parse {stats['parse_s']}s ({stats['pages_per_s']} trang/s), embed {stats['embed_s']}s "
+        f"({stats['embeds_per_s']} chunk/s), ghi index {stats['index_s']}s, tổng {stats['chunks_per_s']} chunk/s"
+    )
+    return stats
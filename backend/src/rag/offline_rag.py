@@ -1,9 +1,17 @@
-from langchain_core.runnables import RunnablePassthrough, RunnableLambda
+from langchain_core.runnables import RunnableLambda
+from langchain_core.runnables.config import run_in_executor
 from langchain_core.output_parsers import StrOutputParser
-from langchain_community.chat_message_histories import ChatMessageHistory
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
 from src.rag.prompt_templates import get_wata_tech_rag_prompt
+from src.rag.chat_memory import BaseHistoryStore, InMemoryHistoryStore, trim_history
+from src.rag.retrieval import RetrievalService
+from src.rag.answer_cache import AnswerCache, fingerprint_documents
+from src.rag.context_packer import ContextPacker
+from src.rag.reranker import CrossEncoderReranker
+from langchain_core.documents import Document
 import re
-from typing import Dict, Any
+import time
+from typing import Dict, Any, AsyncIterator, Iterator, List, Optional, Tuple, Union
 from pathlib import Path
 class Str_OutputParser(StrOutputParser):
     def parse(self, text: str) -> str:
@@ -13,54 +21,423 @@ class Str_OutputParser(StrOutputParser):
         match = re.search(pattern, text_response, re.DOTALL)
         return match.group(1).strip() if match else text_response
 
+class AnswerStreamFilter:
+    """
+    Bỏ tiền tố "Answer:" ở đầu câu trả lời khi stream từng delta.
+    Chỉ giữ lại vài ký tự đầu cho tới khi biết chắc có tiền tố hay không.
+    """
+    PREFIX = "Answer:"
+
+    def __init__(self) -> None:
+        self.buffer = ""
+        self.decided = False
+        self.strip_leading = False
+
+    def feed(self, delta: str) -> str:
+        if self.decided:
+            if self.strip_leading:
+                delta = delta.lstrip()
+                self.strip_leading = not delta
+            return delta
+
+        self.buffer += delta
+        head = self.buffer.lstrip()
+        if len(head) < len(self.PREFIX) and self.PREFIX.startswith(head):
+            return ""
+
+        self.decided = True
+        if head.startswith(self.PREFIX):
+            text = head[len(self.PREFIX):].lstrip()
+            self.strip_leading = not text
+            return text
+        return self.buffer
+
+    def flush(self) -> str:
+        if self.decided:
+            return ""
+        self.decided = True
+        return self.buffer
+
 class Offline_RAG:
-    def __init__(self, llm) -> None:
+    def __init__(
+        self,
+        llm,
+        history_store: Optional[BaseHistoryStore] = None,
+        history_max_tokens: int = 1000,
+        answer_cache: Optional[AnswerCache] = None,
+        cache_namespace: Optional[str] = None,
+        context_packer: Optional[ContextPacker] = None,
+        reranker: Optional[CrossEncoderReranker] = None
+    ) -> None:
+        """
+        Args:
+            llm: Mô hình ngôn ngữ
+            history_store: Nơi lưu lịch sử hội thoại theo session (mặc định: LRU trong bộ nhớ)
+            history_max_tokens: Ngân sách token cho phần chat_history gửi kèm mỗi prompt
+            answer_cache: Cache câu trả lời đặt trước LLM (None để tắt)
+            cache_namespace: Khoá phân biệt câu trả lời giữa các model (mặc định lấy tên model của llm)
+            context_packer: Ghép chunk thành context trong ngân sách token (gộp chunk chồng lấn,
+                bỏ chunk trùng lặp); None để nối nguyên văn mọi chunk
+            reranker: Cross-encoder xếp hạng lại chunk sau retrieval (None để tắt)
+        """
         self.llm = llm
         self.prompt = get_wata_tech_rag_prompt()
         self.str_parser = Str_OutputParser()
-        self.chat_history = ChatMessageHistory()
+        self.history_store = history_store if history_store is not None else InMemoryHistoryStore()
+        self.history_max_tokens = history_max_tokens
+        self.answer_cache = answer_cache
+        self.context_packer = context_packer
+        self.reranker = reranker
+        self.cache_namespace = cache_namespace or getattr(llm, "model", None) or getattr(llm, "model_name", None) or type(llm).__name__
+        self.retriever = None
+        self.chain = None
+        self.rag_chain = self.prompt | self.llm | self.str_parser
+        # Chain không qua Str_OutputParser để stream từng delta
+        self.answer_chain = self.prompt | self.llm | StrOutputParser()
 
-    def get_chain(self, retriever):
-        def format_docs(docs):
-            return "\n\n".join(doc.page_content for doc in docs)
+    @staticmethod
+    def format_docs(docs) -> str:
+        return "\n\n".join(doc.page_content for doc in docs)
+
+    def format_context(self, docs: List[Document]) -> str:
+        if self.context_packer is None:
+            return self.format_docs(docs)
+        return self.context_packer.pack(docs)
+
+    @staticmethod
+    def _source_title(metadata: Dict[str, Any]) -> str:
+        # Tiêu đề trang web (corpus JSONL) hoặc tên file PDF do loader lưu; tên file nếu không có
+        return metadata.get("title") or Path(metadata.get("source", "Untitled")).stem
 
+    @staticmethod
+    def format_sources(source_docs) -> List[Dict[str, Any]]:
+        sources = []
+        for doc in source_docs:
+            if not hasattr(doc, "metadata"):
+                continue
+            duplicates = doc.metadata.get("duplicate_sources") or []
+            links = doc.metadata.get("links")
+            if links is not None:
+                # Các trang/file khác có cùng nội dung (đã gộp khi ingest) cũng là nguồn của câu trả lời
+                links = list(dict.fromkeys(links + [link for ref in duplicates for link in ref.get("links") or []]))
+            sources.append({
+                "url": doc.metadata.get("source", "#"),
+                "title": Offline_RAG._source_title(doc.metadata),
+                "links": links,
+                "duplicates": [
+                    {"url": ref.get("source", "#"), "title": Offline_RAG._source_title(ref)}
+                    for ref in duplicates
+                ]
+            })
+        return sources
 
-        def get_chat_history(inputs):
-            return self.chat_history.messages    
-    
-        # Chain cơ bản
-        rag_chain = (
+    @staticmethod
+    def format_documents(retrieved: List[Tuple[Document, Optional[float]]]) -> List[Dict[str, Any]]:
+        return [
             {
-                "context": retriever | format_docs, 
-                "question": RunnableLambda(lambda x: x),
-                "chat_history": RunnableLambda(get_chat_history)
+                "content": doc.page_content,
+                "metadata": doc.metadata,
+                "score": float(score) if score is not None else None
             }
-            | self.prompt
-            | self.llm
-            | self.str_parser
+            for doc, score in retrieved
+        ]
+
+    def _similarity_store(self):
+        """Trả về vector store nếu retriever là similarity search thuần (để lấy được score)."""
+        vectorstore = getattr(self.retriever, "vectorstore", None)
+        if vectorstore is not None and getattr(self.retriever, "search_type", None) == "similarity":
+            return vectorstore
+        return None
+
+    def retrieve(self, question: str) -> List[Tuple[Document, Optional[float]]]:
+        """
+        Truy vấn tài liệu liên quan một lần duy nhất cho mỗi câu hỏi.
+
+        Args:
+            question: Câu hỏi của người dùng
+
+        Returns:
+            List[Tuple[Document, Optional[float]]]: Danh sách (document, score);
+            score là khoảng cách của vector store (FAISS: L2, càng nhỏ càng gần),
+            score RRF (càng lớn càng liên quan) nếu RetrievalService chạy hybrid, hoặc None
+        """
+        if isinstance(self.retriever, RetrievalService):
+            return self.retriever.retrieve(question)
+        vectorstore = self._similarity_store()
+        if vectorstore is not None:
+            return vectorstore.similarity_search_with_score(question, **self.retriever.search_kwargs)
+        return [(doc, None) for doc in self.retriever.invoke(question)]
+
+    async def aretrieve(self, question: str) -> List[Tuple[Document, Optional[float]]]:
+        """Phiên bản bất đồng bộ của `retrieve`."""
+        if isinstance(self.retriever, RetrievalService):
+            return await self.retriever.aretrieve(question)
+        vectorstore = self._similarity_store()
+        if vectorstore is not None:
+            return await vectorstore.asimilarity_search_with_score(question, **self.retriever.search_kwargs)
+        return [(doc, None) for doc in await self.retriever.ainvoke(question)]
+
+    def _retrieve_for_answer(self, question: str) -> Tuple[List[Tuple[Document, Optional[float]]], Optional[List[float]]]:
+        """Retrieval (và rerank nếu bật) kèm embedding của câu hỏi (cần cho tầng semantic của answer cache)."""
+        if self.answer_cache is not None and isinstance(self.retriever, RetrievalService):
+            retrieved, query_vector = self.retriever.retrieve_with_vector(question)
+        else:
+            retrieved, query_vector = self.retrieve(question), None
+        if self.reranker is not None:
+            retrieved = self.reranker.rerank(question, retrieved)
+        return retrieved, query_vector
+
+    async def _aretrieve_for_answer(self, question: str) -> Tuple[List[Tuple[Document, Optional[float]]], Optional[List[float]]]:
+        if self.answer_cache is not None and isinstance(self.retriever, RetrievalService):
+            retrieved, query_vector = await self.retriever.aretrieve_with_vector(question)
+        else:
+            retrieved, query_vector = await self.aretrieve(question), None
+        if self.reranker is not None:
+            retrieved = await run_in_executor(None, self.reranker.rerank, question, retrieved)
+        return retrieved, query_vector
+
+    def _use_cache(self, history: List[BaseMessage]) -> bool:
+        # Câu trả lời phụ thuộc lịch sử hội thoại thì không dùng chung được
+        return self.answer_cache is not None and not history
+
+    def _cache_lookup(self, question: str, retrieved, query_vector) -> Optional[Tuple[str, str]]:
+        hit = self.answer_cache.get(
+            self.cache_namespace,
+            question,
+            fingerprint_documents(doc for doc, _ in retrieved),
+            query_vector=query_vector,
+            index_version=getattr(self.retriever, "index_version", None)
         )
+        return (hit[0], hit[1]["reply"]) if hit else None
 
-        def wrapped_chain(question: str) -> Dict[str, Any]:
+    def _cache_store(self, question: str, retrieved, query_vector, answer: str) -> None:
+        self.answer_cache.put(
+            self.cache_namespace,
+            question,
+            fingerprint_documents(doc for doc, _ in retrieved),
+            {"reply": answer},
+            query_vector=query_vector,
+            index_version=getattr(self.retriever, "index_version", None)
+        )
 
-            self.chat_history.add_user_message(question)
+    def load_history(self, session_id: Optional[str]) -> List[BaseMessage]:
+        """
+        Lấy cửa sổ lịch sử của session trong giới hạn `history_max_tokens`.
+        Không có session_id thì câu hỏi được xử lý độc lập, không có lịch sử.
+        """
+        if not session_id:
+            return []
+        return trim_history(self.history_store.get_messages(session_id), self.history_max_tokens)
 
-            answer = rag_chain.invoke(question)
-            
-            self.chat_history.add_ai_message(answer)
+    def save_turn(self, session_id: Optional[str], question: str, answer: str) -> None:
+        """Lưu một lượt hỏi - đáp vào lịch sử của session."""
+        if session_id:
+            self.history_store.add_messages(session_id, [HumanMessage(content=question), AIMessage(content=answer)])
 
-            source_docs = retriever.invoke(question)
-            sources = [
-                {
-                    "url": doc.metadata.get("source", "#"),
-                    "title": Path(doc.metadata.get("source", "Untitled")).stem
-                }
-                for doc in source_docs
-                if hasattr(doc, "metadata")
-            ]
+    async def aload_history(self, session_id: Optional[str]) -> List[BaseMessage]:
+        """Như `load_history` nhưng đọc history store (SQLite) trong executor, không chặn event loop."""
+        if not session_id:
+            return []
+        return await run_in_executor(None, self.load_history, session_id)
 
-            return {
-                "reply": answer,
-                "sources": sources[:1]
-            }
+    async def asave_turn(self, session_id: Optional[str], question: str, answer: str) -> None:
+        """Như `save_turn` nhưng ghi history store trong executor, không chặn event loop."""
+        if session_id:
+            await run_in_executor(None, self.save_turn, session_id, question, answer)
+
+    @staticmethod
+    def _parse_input(inputs: Union[str, Dict[str, Any]]) -> Tuple[str, Optional[str]]:
+        if isinstance(inputs, dict):
+            return inputs["question"], inputs.get("session_id")
+        return inputs, None
+
+    def _build_inputs(self, question: str, retrieved, history: List[BaseMessage]) -> Dict[str, Any]:
+        return {
+            "context": self.format_context([doc for doc, _ in retrieved]),
+            "question": question,
+            "chat_history": history
+        }
+
+    def _build_result(self, answer: str, retrieved, timings: Dict[str, float], cache: Optional[str] = None) -> Dict[str, Any]:
+        source_docs = [doc for doc, _ in retrieved]
+        return {
+            "reply": answer,
+            "sources": self.format_sources(source_docs)[:1],
+            "documents": self.format_documents(retrieved),
+            "timings": timings,
+            "cache": cache
+        }
+
+    @staticmethod
+    def _elapsed_ms(start: float) -> float:
+        return round((time.perf_counter() - start) * 1000, 2)
+
+    def get_chain(self, retriever):
+        self.retriever = retriever
+
+        def wrapped_chain(inputs: Union[str, Dict[str, Any]]) -> Dict[str, Any]:
+            question, session_id = self._parse_input(inputs)
+            start = time.perf_counter()
+            history = self.load_history(session_id)
+
+            # Một lần retrieval dùng cho cả context của prompt và danh sách sources
+            retrieved, query_vector = self._retrieve_for_answer(question)
+            retrieval_ms = self._elapsed_ms(start)
+
+            generation_start = time.perf_counter()
+            use_cache = self._use_cache(history)
+            cached = self._cache_lookup(question, retrieved, query_vector) if use_cache else None
+            if cached:
+                cache_tier, answer = cached
+            else:
+                cache_tier = None
+                answer = self.rag_chain.invoke(self._build_inputs(question, retrieved, history))
+                if use_cache:
+                    self._cache_store(question, retrieved, query_vector, answer)
+            generation_ms = self._elapsed_ms(generation_start)
+
+            self.save_turn(session_id, question, answer)
+
+            return self._build_result(answer, retrieved, {
+                "retrieval_ms": retrieval_ms,
+                "generation_ms": generation_ms,
+                "total_ms": self._elapsed_ms(start)
+            }, cache=cache_tier)
+
+        async def awrapped_chain(inputs: Union[str, Dict[str, Any]]) -> Dict[str, Any]:
+            question, session_id = self._parse_input(inputs)
+            start = time.perf_counter()
+            history = await self.aload_history(session_id)
+
+            # FAISS search chạy trong executor của event loop, LLM được await trực tiếp
+            retrieved, query_vector = await self._aretrieve_for_answer(question)
+            retrieval_ms = self._elapsed_ms(start)
+
+            generation_start = time.perf_counter()
+            use_cache = self._use_cache(history)
+            cached = self._cache_lookup(question, retrieved, query_vector) if use_cache else None
+            if cached:
+                cache_tier, answer = cached
+            else:
+                cache_tier = None
+                answer = await self.rag_chain.ainvoke(self._build_inputs(question, retrieved, history))
+                if use_cache:
+                    self._cache_store(question, retrieved, query_vector, answer)
+            generation_ms = self._elapsed_ms(generation_start)
+
+            await self.asave_turn(session_id, question, answer)
+
+            return self._build_result(answer, retrieved, {
+                "retrieval_ms": retrieval_ms,
+                "generation_ms": generation_ms,
+                "total_ms": self._elapsed_ms(start)
+            }, cache=cache_tier)
+
+        self.chain = RunnableLambda(wrapped_chain, afunc=awrapped_chain)
+        return self.chain
+
+    def invoke(self, question: str, session_id: Optional[str] = None) -> Dict[str, Any]:
+        return self.chain.invoke({"question": question, "session_id": session_id})
+
+    async def ainvoke(self, question: str, session_id: Optional[str] = None) -> Dict[str, Any]:
+        return await self.chain.ainvoke({"question": question, "session_id": session_id})
+
+    def stream(self, question: str, session_id: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Stream câu trả lời: các event {"type": "delta", "content": ...}
+        rồi một event {"type": "sources", "sources": [...], "timings": {...}} ở cuối.
+
+        Args:
+            question: Câu hỏi của người dùng
+            session_id: Định danh hội thoại để lấy và lưu lịch sử
+
+        Returns:
+            Iterator các event dạng dict
+        """
+        start = time.perf_counter()
+        history = self.load_history(session_id)
+        retrieved, query_vector = self._retrieve_for_answer(question)
+        retrieval_ms = self._elapsed_ms(start)
+
+        use_cache = self._use_cache(history)
+        cached = self._cache_lookup(question, retrieved, query_vector) if use_cache else None
+        answer = ""
+        first_token_ms = None
+        if cached:
+            cache_tier, answer = cached
+            first_token_ms = self._elapsed_ms(start)
+            yield {"type": "delta", "content": answer}
+        else:
+            cache_tier = None
+            answer_filter = AnswerStreamFilter()
+            for delta in self.answer_chain.stream(self._build_inputs(question, retrieved, history)):
+                text = answer_filter.feed(delta)
+                if text:
+                    first_token_ms = first_token_ms or self._elapsed_ms(start)
+                    answer += text
+                    yield {"type": "delta", "content": text}
+            text = answer_filter.flush()
+            if text:
+                answer += text
+                yield {"type": "delta", "content": text}
+            answer = answer.strip()
+            if use_cache and answer:
+                self._cache_store(question, retrieved, query_vector, answer)
+
+        self.save_turn(session_id, question, answer)
+        yield {
+            "type": "sources",
+            "sources": self.format_sources(doc for doc, _ in retrieved)[:1],
+            "timings": {
+                "retrieval_ms": retrieval_ms,
+                "first_token_ms": first_token_ms,
+                "total_ms": self._elapsed_ms(start)
+            },
+            "cache": cache_tier
+        }
+
+    async def astream(self, question: str, session_id: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Phiên bản bất đồng bộ của `stream`.
+        """
+        start = time.perf_counter()
+        history = await self.aload_history(session_id)
+        retrieved, query_vector = await self._aretrieve_for_answer(question)
+        retrieval_ms = self._elapsed_ms(start)
+
+        use_cache = self._use_cache(history)
+        cached = self._cache_lookup(question, retrieved, query_vector) if use_cache else None
+        answer = ""
+        first_token_ms = None
+        if cached:
+            cache_tier, answer = cached
+            first_token_ms = self._elapsed_ms(start)
+            yield {"type": "delta", "content": answer}
+        else:
+            cache_tier = None
+            answer_filter = AnswerStreamFilter()
+            async for delta in self.answer_chain.astream(self._build_inputs(question, retrieved, history)):
+                text = answer_filter.feed(delta)
+                if text:
+                    first_token_ms = first_token_ms or self._elapsed_ms(start)
+                    answer += text
+                    yield {"type": "delta", "content": text}
+            text = answer_filter.flush()
+            if text:
+                answer += text
+                yield {"type": "delta", "content": text}
+            answer = answer.strip()
+            if use_cache and answer:
+                self._cache_store(question, retrieved, query_vector, answer)
 
-        return RunnableLambda(wrapped_chain)
\ No newline at end of file
+        await self.asave_turn(session_id, question, answer)
+        yield {
+            "type": "sources",
+            "sources": self.format_sources(doc for doc, _ in retrieved)[:1],
+            "timings": {
+                "retrieval_ms": retrieval_ms,
+                "first_token_ms": first_token_ms,
+                "total_ms": self._elapsed_ms(start)
+            },
+            "cache": cache_tier
+        }
@@ -0,0 +1,113 @@
+import threading
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+from src.rag.offline_rag import Offline_RAG
+from src.rag.retrieval import RetrievalService
+from src.rag.chat_memory import BaseHistoryStore
+from src.rag.answer_cache import AnswerCache
+from src.rag.context_packer import ContextPacker
+from src.rag.reranker import CrossEncoderReranker
+
+logger = logging.getLogger(__name__)
+
+
+class RAGRegistry:
+    """
+    Quản lý các chain RAG theo tên model LLM.
+
+    Mọi chain dùng chung một RetrievalService (embedding model + vector index) và một
+    history store, nên thêm/bớt model không cần load lại phần retrieval.
+    """
+
+    def __init__(
+        self,
+        retrieval: RetrievalService,
+        llm_factory: Callable[[str], Any],
+        history_store: Optional[BaseHistoryStore] = None,
+        history_max_tokens: int = 1000,
+        answer_cache: Optional[AnswerCache] = None,
+        context_max_tokens: int = 0,
+        context_max_tokens_by_model: Optional[Dict[str, int]] = None,
+        reranker: Optional[CrossEncoderReranker] = None
+    ) -> None:
+        """
+        Khởi tạo RAGRegistry.
+
+        Args:
+            retrieval: Dịch vụ retrieval dùng chung
+            llm_factory: Hàm tạo LLM từ tên model (ví dụ `get_openrouter_llm`)
+            history_store: Nơi lưu lịch sử hội thoại dùng chung giữa các model
+            history_max_tokens: Ngân sách token cho lịch sử gửi kèm mỗi prompt
+            answer_cache: Cache câu trả lời dùng chung (khoá theo tên model)
+            context_max_tokens: Ngân sách token mặc định cho phần context, 0 để nối nguyên văn mọi chunk
+            context_max_tokens_by_model: Ngân sách context riêng theo tên model (ghi đè giá trị mặc định)
+            reranker: Cross-encoder dùng chung để xếp hạng lại chunk (None để tắt)
+        """
+        self.retrieval = retrieval
+        self.llm_factory = llm_factory
+        self.history_store = history_store
+        self.history_max_tokens = history_max_tokens
+        self.answer_cache = answer_cache
+        self.context_max_tokens = context_max_tokens
+        self.context_max_tokens_by_model = context_max_tokens_by_model or {}
+        self.reranker = reranker
+        self._chains: Dict[str, Offline_RAG] = {}
+        self._lock = threading.Lock()
+
+    def add_model(self, model_name: str, llm: Optional[Any] = None) -> Offline_RAG:
+        """
+        Tạo (hoặc thay thế) chain RAG cho một model.
+
+        Args:
+            model_name: Tên model trên OpenRouter
+            llm: LLM đã khởi tạo sẵn, mặc định tạo bằng `llm_factory`
+
+        Returns:
+            Offline_RAG: Chain của model
+        """
+        llm = llm if llm is not None else self.llm_factory(model_name)
+        chain = Offline_RAG(
+            llm,
+            history_store=self.history_store,
+            history_max_tokens=self.history_max_tokens,
+            answer_cache=self.answer_cache,
+            cache_namespace=model_name,
+            context_packer=self.context_packer_for(model_name),
+            reranker=self.reranker
+        )
+        chain.get_chain(retriever=self.retrieval)
+        with self._lock:
+            self._chains[model_name] = chain
+        logger.info(f"Đã thêm model {model_name} vào registry")
+        return chain
+
+    def context_packer_for(self, model_name: str) -> Optional[ContextPacker]:
+        """ContextPacker với ngân sách token của model, None nếu không giới hạn."""
+        max_tokens = self.context_max_tokens_by_model.get(model_name, self.context_max_tokens)
+        return ContextPacker(max_tokens=max_tokens) if max_tokens > 0 else None
+
+    def remove_model(self, model_name: str) -> bool:
+        """
+        Gỡ chain của một model.
+
+        Returns:
+            bool: True nếu model tồn tại và đã được gỡ
+        """
+        with self._lock:
+            removed = self._chains.pop(model_name, None) is not None
+        if removed:
+            logger.info(f"Đã gỡ model {model_name} khỏi registry")
+        return removed
+
+    def get(self, model_name: str) -> Optional[Offline_RAG]:
+        return self._chains.get(model_name)
+
+    def models(self) -> List[str]:
+        return sorted(self._chains)
+
+    def __contains__(self, model_name: str) -> bool:
+        return model_name in self._chains
+
+    def __len__(self) -> int:
+        return len(self._chains)
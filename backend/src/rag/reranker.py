@@ -0,0 +1,150 @@
+import math
+import threading
+import time
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+
+class CrossEncoderReranker:
+    """
+    Xếp hạng lại các chunk đã retrieve bằng một cross-encoder nhỏ chạy trên CPU, giữ `top_n` chunk.
+
+    Mọi cặp (câu hỏi, chunk) được chấm trong một lần forward theo batch. Thời gian chấm mỗi cặp được
+    theo dõi bằng trung bình trượt (EWMA); nếu ước lượng cho request hiện tại vượt `budget_ms` thì bỏ
+    qua bước rerank và giữ nguyên kết quả retrieval. Cứ sau `probe_every` lần bỏ qua sẽ chạy thử một
+    lần để cập nhật ước lượng (ví dụ khi máy hết tải).
+
+    Model được chạy khởi động một lần khi khởi tạo, và lần chấm đầu tiên không được tính vào ước lượng
+    (lần đầu còn gồm chi phí cấp phát/khởi tạo kernel, sẽ làm bước rerank tự bỏ qua oan `probe_every` lần).
+    """
+
+    # Cross-encoder đa ngôn ngữ (có tiếng Việt), 12 lớp x 384 chiều
+    DEFAULT_MODEL = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_MODEL,
+        top_n: int = 3,
+        budget_ms: float = 150.0,
+        max_length: int = 256,
+        probe_every: int = 50,
+        smoothing: float = 0.2,
+        model: Optional[Any] = None
+    ) -> None:
+        """
+        Args:
+            model_name: Tên cross-encoder trên HuggingFace
+            top_n: Số chunk giữ lại sau khi rerank
+            budget_ms: Thời gian tối đa (ms) cho bước rerank của một request, gồm cả thời gian chờ model
+            max_length: Số token tối đa của mỗi cặp (câu hỏi, chunk)
+            probe_every: Số lần bỏ qua liên tiếp trước khi chạy thử lại để cập nhật ước lượng
+            smoothing: Hệ số EWMA cho thời gian chấm mỗi cặp
+            model: Model đã khởi tạo sẵn (có `predict(pairs, batch_size=...)`), mặc định load `model_name`
+        """
+        if model is None:
+            from sentence_transformers import CrossEncoder
+            model = CrossEncoder(model_name, max_length=max_length, device="cpu")
+        self.model = model
+        self.model_name = model_name
+        self.top_n = top_n
+        self.budget_ms = budget_ms
+        self.probe_every = probe_every
+        self.smoothing = smoothing
+        self.ms_per_pair: Optional[float] = None
+        self._measured = False
+        self.runs = 0
+        self.skips = 0
+        self._skips_since_run = 0
+        # Một forward pass tại một thời điểm: torch đã dùng nhiều thread cho mỗi batch
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._warm_up()
+
+    def _warm_up(self) -> None:
+        """Chạy thử một batch nhỏ để lần chấm thật đầu tiên không phải trả chi phí khởi động model."""
+        start = time.perf_counter()
+        self.model.predict([("warm up", "warm up")] * 2, batch_size=2, show_progress_bar=False)
+        logger.info(f"Khởi động reranker {self.model_name} trong {(time.perf_counter() - start) * 1000:.0f}ms")
+
+    def estimate_ms(self, n_pairs: int) -> Optional[float]:
+        """Thời gian dự kiến để chấm `n_pairs` cặp, None nếu chưa chạy lần nào."""
+        if self.ms_per_pair is None:
+            return None
+        return self.ms_per_pair * n_pairs
+
+    def _skip(self, reason: str) -> None:
+        with self._stats_lock:
+            self.skips += 1
+            self._skips_since_run += 1
+        logger.debug(f"Bỏ qua rerank: {reason}")
+
+    def _record(self, elapsed_ms: float, n_pairs: int) -> None:
+        per_pair = elapsed_ms / n_pairs
+        with self._stats_lock:
+            self.runs += 1
+            self._skips_since_run = 0
+            if not self._measured:
+                # Lần đo đầu tiên thường chậm bất thường (cache, cấp phát bộ nhớ), không dùng làm ước lượng
+                self._measured = True
+            elif self.ms_per_pair is None:
+                self.ms_per_pair = per_pair
+            else:
+                self.ms_per_pair += self.smoothing * (per_pair - self.ms_per_pair)
+
+    def rerank(
+        self,
+        question: str,
+        retrieved: List[Tuple[Document, Optional[float]]]
+    ) -> List[Tuple[Document, Optional[float]]]:
+        """
+        Xếp hạng lại các chunk theo điểm cross-encoder.
+
+        Args:
+            question: Câu hỏi của người dùng
+            retrieved: Danh sách (document, score) từ retrieval
+
+        Returns:
+            List[Tuple[Document, Optional[float]]]: `top_n` cặp (document, điểm cross-encoder) theo điểm
+            giảm dần, hoặc nguyên `retrieved` nếu bước rerank bị bỏ qua
+        """
+        if len(retrieved) <= 1:
+            return retrieved
+        start = time.perf_counter()
+        estimate = self.estimate_ms(len(retrieved))
+        if estimate is not None and estimate > self.budget_ms and self._skips_since_run < self.probe_every:
+            self._skip(f"ước lượng {estimate:.0f}ms > {self.budget_ms:.0f}ms")
+            return retrieved
+
+        wait_ms = self.budget_ms - (estimate or 0)
+        if not self._lock.acquire(timeout=-1 if math.isinf(wait_ms) else max(wait_ms, 0) / 1000):
+            self._skip("model đang bận")
+            return retrieved
+        try:
+            forward_start = time.perf_counter()
+            scores = self.model.predict(
+                [(question, doc.page_content) for doc, _ in retrieved],
+                batch_size=len(retrieved),
+                show_progress_bar=False
+            )
+            forward_ms = (time.perf_counter() - forward_start) * 1000
+        finally:
+            self._lock.release()
+        self._record(forward_ms, len(retrieved))
+
+        ranked = sorted(zip(retrieved, scores), key=lambda item: item[1], reverse=True)[:self.top_n]
+        logger.debug(f"Rerank {len(retrieved)} chunk trong {(time.perf_counter() - start) * 1000:.1f}ms")
+        return [(doc, float(score)) for (doc, _), score in ranked]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "model": self.model_name,
+            "top_n": self.top_n,
+            "budget_ms": self.budget_ms,
+            "runs": self.runs,
+            "skips": self.skips,
+            "ms_per_pair": round(self.ms_per_pair, 3) if self.ms_per_pair is not None else None
+        }
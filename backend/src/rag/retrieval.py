@@ -0,0 +1,232 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import logging
+from langchain_core.documents import Document
+from langchain_core.runnables.config import run_in_executor
+from src.rag.bm25 import reciprocal_rank_fusion
+from src.rag.context_packer import overlap_length
+from src.rag.vectorstore import VectorDB
+
+logger = logging.getLogger(__name__)
+
+
+class RetrievalService:
+    """
+    Embedding model và vector index được load một lần, dùng chung cho mọi chain theo LLM.
+
+    Ở chế độ hybrid, tìm kiếm vector và BM25 chạy song song, mỗi bên lấy `candidates` kết quả rồi
+    gộp bằng Reciprocal Rank Fusion; score trả về khi đó là score RRF (càng lớn càng liên quan)
+    thay vì khoảng cách vector.
+
+    Với `neighbor_window` > 0, mỗi chunk trả về được mở rộng thành đoạn liền mạch gồm cả các chunk đứng
+    trước/sau nó trong file (theo `prev_chunk_id`/`next_chunk_id` lưu khi ingest, không cần tìm lại);
+    chunk đã nằm trong đoạn mở rộng của một kết quả xếp trên không được lặp lại.
+
+    Khi VectorDB bật chống trùng lặp, mỗi chunk trả về mang thêm `metadata["duplicate_sources"]`:
+    metadata của các chunk gần trùng (trang/file khác cùng nội dung) đã được gộp vào nó khi ingest.
+    """
+
+    def __init__(
+        self,
+        vectordb: VectorDB,
+        search_kwargs: Optional[Dict[str, Any]] = None,
+        hybrid: bool = False,
+        candidates: int = 30,
+        rrf_k: int = 60,
+        neighbor_window: int = 0
+    ) -> None:
+        """
+        Khởi tạo RetrievalService.
+
+        Args:
+            vectordb: Vector database đã được build hoặc load
+            search_kwargs: Tham số tìm kiếm (k, ...)
+            hybrid: Gộp kết quả vector với BM25 (cần VectorDB bật `keyword_search`)
+            candidates: Số ứng viên lấy từ mỗi bên trước khi gộp (ít nhất bằng k)
+            rrf_k: Hằng số làm mượt của RRF
+            neighbor_window: Số chunk liền kề mỗi phía ghép vào từng kết quả (0 để tắt)
+        """
+        if not vectordb.db:
+            raise ValueError("Vector database chưa được xây dựng")
+        if hybrid and vectordb.bm25 is None:
+            raise ValueError("Hybrid retrieval cần VectorDB với keyword_search=True")
+        self.vectordb = vectordb
+        self.search_kwargs = search_kwargs or {"k": 10}
+        self.hybrid = hybrid
+        self.candidates = max(candidates, self.search_kwargs.get("k", 4))
+        self.rrf_k = rrf_k
+        self.neighbor_window = neighbor_window
+        # BM25 chạy trên thread riêng trong lúc thread gọi embed câu hỏi và tìm FAISS
+        self._keyword_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="bm25") if hybrid else None
+
+    @property
+    def vectorstore(self):
+        return self.vectordb.db
+
+    @property
+    def index_version(self) -> int:
+        """Phiên bản vector index, tăng mỗi khi index thay đổi (dùng để invalidate cache)."""
+        return self.vectordb.version
+
+    def embed_query(self, question: str) -> List[float]:
+        """Embedding của câu hỏi."""
+        return self.vectordb.embedding.embed_query(question)
+
+    def search_by_vector(self, vector: List[float]) -> List[Tuple[Document, float]]:
+        """Tìm các document gần nhất với một embedding đã tính sẵn."""
+        return self.vectorstore.similarity_search_with_score_by_vector(vector, **self.search_kwargs)
+
+    def keyword_search(self, question: str) -> List[Tuple[Document, float]]:
+        """Ứng viên BM25 cho hybrid retrieval."""
+        return self.vectordb.keyword_search(question, k=self.candidates)
+
+    def _dense_candidates(self, question: str) -> Tuple[List[Tuple[Document, float]], List[float]]:
+        vector = self.embed_query(question)
+        search_kwargs = {**self.search_kwargs, "k": self.candidates}
+        return self.vectorstore.similarity_search_with_score_by_vector(vector, **search_kwargs), vector
+
+    def fuse(
+        self,
+        dense: List[Tuple[Document, float]],
+        keyword: List[Tuple[Document, float]]
+    ) -> List[Tuple[Document, float]]:
+        """
+        Gộp hai danh sách kết quả bằng Reciprocal Rank Fusion, giữ k kết quả đầu.
+
+        Returns:
+            List[Tuple[Document, float]]: (document, score RRF) theo score giảm dần
+        """
+        documents: Dict[str, Document] = {}
+        rankings = []
+        for results in (dense, keyword):
+            ranking = []
+            for doc, _ in results:
+                key = doc.id or doc.page_content
+                documents.setdefault(key, doc)
+                ranking.append(key)
+            rankings.append(ranking)
+        fused = reciprocal_rank_fusion(rankings, k=self.rrf_k)[:self.search_kwargs.get("k", 4)]
+        return [(documents[key], score) for key, score in fused]
+
+    @staticmethod
+    def _chunk_key(doc: Document) -> str:
+        return doc.metadata.get("chunk_id") or doc.id
+
+    @staticmethod
+    def _join_chunks(chunks: List[Document], min_overlap: int = 20) -> str:
+        """Nối các chunk liền nhau của một file, phần chồng lấp giữa hai chunk chỉ giữ một lần."""
+        text = chunks[0].page_content
+        for chunk in chunks[1:]:
+            overlap = overlap_length(text, chunk.page_content, min_overlap)
+            text += chunk.page_content[overlap:] if overlap else "\n" + chunk.page_content
+        return text
+
+    def expand_neighbors(self, results: List[Tuple[Document, float]]) -> List[Tuple[Document, float]]:
+        """
+        Ghép vào mỗi kết quả `neighbor_window` chunk liền trước/liền sau trong cùng file.
+
+        Kết quả mở rộng là bản sao của chunk (giữ id, metadata, score) với text của cả đoạn, thêm
+        `section_title` ở đầu nếu đoạn không chứa heading của mục; `metadata["expanded_chunk_ids"]`
+        là id các chunk trong đoạn. Kết quả đã nằm trong đoạn của kết quả xếp trên bị bỏ.
+        """
+        if not self.neighbor_window:
+            return results
+        expanded = []
+        included = set()
+        for doc, score in results:
+            key = self._chunk_key(doc)
+            if key in included:
+                continue
+            chunks = self.vectordb.neighbor_chunks(doc, self.neighbor_window)
+            center = next(i for i, chunk in enumerate(chunks) if chunk is doc)
+            # Chỉ mở rộng tới chunk đã thuộc một đoạn khác, để đoạn vẫn liền mạch và không lặp nội dung
+            start, end = center, center + 1
+            while start > 0 and self._chunk_key(chunks[start - 1]) not in included:
+                start -= 1
+            while end < len(chunks) and self._chunk_key(chunks[end]) not in included:
+                end += 1
+            span = chunks[start:end]
+            keys = [self._chunk_key(chunk) for chunk in span]
+            included.update(keys)
+            if len(span) == 1:
+                expanded.append((doc, score))
+                continue
+            text = self._join_chunks(span)
+            section_title = doc.metadata.get("section_title")
+            if section_title and section_title != doc.metadata.get("title") and section_title not in text:
+                text = f"{section_title}\n{text}"
+            metadata = {**doc.metadata, "expanded_chunk_ids": keys}
+            expanded.append((Document(page_content=text, metadata=metadata, id=doc.id), score))
+        return expanded
+
+    def with_duplicate_sources(self, results: List[Tuple[Document, float]]) -> List[Tuple[Document, float]]:
+        """
+        Gắn `duplicate_sources` (nguồn của các chunk gần trùng) vào metadata của từng kết quả.
+        Document trong docstore không bị sửa: kết quả có bản trùng được trả về dưới dạng bản sao.
+        """
+        if self.vectordb.dedup is None:
+            return results
+        annotated = []
+        for doc, score in results:
+            duplicates = self.vectordb.duplicate_sources(doc.id) if doc.id else []
+            if duplicates:
+                doc = Document(page_content=doc.page_content, metadata={**doc.metadata, "duplicate_sources": duplicates}, id=doc.id)
+            annotated.append((doc, score))
+        return annotated
+
+    def _finalize(self, results: List[Tuple[Document, float]]) -> List[Tuple[Document, float]]:
+        """Mở rộng chunk liền kề và gắn nguồn trùng lặp cho kết quả cuối (đọc docstore, không chạy trên event loop)."""
+        return self.with_duplicate_sources(self.expand_neighbors(results))
+
+    def retrieve_with_vector(self, question: str) -> Tuple[List[Tuple[Document, float]], List[float]]:
+        """
+        Như `retrieve` nhưng trả về cả embedding của câu hỏi (dùng cho cache câu trả lời).
+
+        Returns:
+            Tuple: (danh sách (document, score), embedding câu hỏi)
+        """
+        if not self.hybrid:
+            vector = self.embed_query(question)
+            return self._finalize(self.search_by_vector(vector)), vector
+        keyword_future = self._keyword_executor.submit(self.keyword_search, question)
+        dense, vector = self._dense_candidates(question)
+        return self._finalize(self.fuse(dense, keyword_future.result())), vector
+
+    def retrieve(self, question: str) -> List[Tuple[Document, float]]:
+        """
+        Tìm các document liên quan nhất kèm score.
+
+        Args:
+            question: Câu hỏi của người dùng
+
+        Returns:
+            List[Tuple[Document, float]]: Danh sách (document, score) theo thứ tự liên quan giảm dần
+        """
+        return self.retrieve_with_vector(question)[0]
+
+    async def aembed_query(self, question: str) -> List[float]:
+        """Phiên bản bất đồng bộ của `embed_query` (chạy trong executor của event loop)."""
+        return await run_in_executor(None, self.embed_query, question)
+
+    async def asearch_by_vector(self, vector: List[float]) -> List[Tuple[Document, float]]:
+        """Phiên bản bất đồng bộ của `search_by_vector`."""
+        return await run_in_executor(None, self.search_by_vector, vector)
+
+    async def aretrieve_with_vector(self, question: str) -> Tuple[List[Tuple[Document, float]], List[float]]:
+        """Phiên bản bất đồng bộ của `retrieve_with_vector`, hai nhánh hybrid chạy song song trong executor."""
+        if not self.hybrid:
+            return await run_in_executor(None, self.retrieve_with_vector, question)
+        (dense, vector), keyword = await asyncio.gather(
+            run_in_executor(None, self._dense_candidates, question),
+            run_in_executor(None, self.keyword_search, question)
+        )
+        return await run_in_executor(None, self._finalize, self.fuse(dense, keyword)), vector
+
+    async def aretrieve(self, question: str) -> List[Tuple[Document, float]]:
+        """Phiên bản bất đồng bộ của `retrieve` (FAISS search chạy trong executor của event loop)."""
+        return (await self.aretrieve_with_vector(question))[0]
+
+    def as_retriever(self):
+        """Retriever LangChain dùng cùng vector database."""
+        return self.vectordb.get_retriever(search_kwargs=self.search_kwargs)
@@ -1,15 +1,63 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List
+
 import fitz  # PyMuPD
 
+# Số file PDF tối đa được nhớ link khi phải tra cứu trực tiếp từ file
+SOURCE_LINK_CACHE_SIZE = int(os.getenv("SOURCE_LINK_CACHE_SIZE", "256"))
+
+_link_cache: "OrderedDict[str, tuple]" = OrderedDict()
+_link_cache_lock = threading.Lock()
+
+
+def extract_links(pdf_path) -> List[str]:
+    """
+    Lấy các URL trong file PDF (giữ thứ tự xuất hiện, không trùng lặp).
+    Dùng khi ingest để lưu vào metadata["links"] của từng chunk.
+    """
+    urls = {}
+    with fitz.open(pdf_path) as doc:
+        for page in doc:
+            for link in page.get_links():
+                uri = link.get("uri", None)
+                if uri:
+                    urls[uri] = None
+    return list(urls)
+
+
 def extract_urls_from_pdf(pdf_path):
-    urls = set()
-    doc = fitz.open(pdf_path)
-    
-    for page_num in range(len(doc)):
-        page = doc[page_num]
-        links = page.get_links()
-        for link in links:
-            uri = link.get("uri", None)
-            if uri:
-                urls.add(uri)
-    # Chuyển set thành list các đối tượng có cấu trúc {url: string}
-    return [{"url": url} for url in urls]
\ No newline at end of file
+    urls = extract_links(pdf_path)
+    # Chuyển list thành list các đối tượng có cấu trúc {url: string}
+    return [{"url": url} for url in urls]
+
+
+def get_source_links(pdf_path) -> List[Dict[str, str]]:
+    """
+    Giống `extract_urls_from_pdf` nhưng nhớ kết quả theo (đường dẫn, mtime, kích thước) trong
+    một LRU giới hạn, nên chỉ mở lại PDF khi file thay đổi. Dùng cho index cũ chưa có metadata["links"].
+
+    Returns:
+        List[Dict[str, str]]: Danh sách {url}, rỗng nếu file không tồn tại
+    """
+    try:
+        stat = os.stat(pdf_path)
+    except OSError:
+        return []
+    key = os.fspath(pdf_path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+
+    with _link_cache_lock:
+        entry = _link_cache.get(key)
+        if entry is not None and entry[0] == signature:
+            _link_cache.move_to_end(key)
+            return entry[1]
+
+    links = extract_urls_from_pdf(pdf_path)
+    with _link_cache_lock:
+        _link_cache[key] = (signature, links)
+        _link_cache.move_to_end(key)
+        while len(_link_cache) > SOURCE_LINK_CACHE_SIZE:
+            _link_cache.popitem(last=False)
+    return links
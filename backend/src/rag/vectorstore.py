@@ -1,10 +1,19 @@
-from typing import List, Optional, Type, Dict, Any, ClassVar
+from typing import List, Optional, Type, Dict, Any, ClassVar, Literal, Tuple
 import logging
 from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_core.vectorstores import VectorStore
 from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
+from src.rag.embeddings import CachedEmbeddings, MicroBatchingEmbeddings, embedding_model_name
+from src.rag import index_store
+from src.rag.index_spec import IndexSpec
+from src.rag.bm25 import BM25Index
+from src.rag.dedup import ChunkDeduplicator
+import faiss
+import numpy as np
 import os
 
 # Thiết lập logging
@@ -28,7 +37,15 @@ class VectorDB:
         embedding: Optional[Embeddings] = None,
         persist_directory: Optional[str] = None,
         vector_db_kwargs: Optional[Dict[str, Any]] = None,
-        index_name: Optional[str] = "vectordb"
+        index_name: Optional[str] = "vectordb",
+        query_cache_size: int = 0,
+        query_cache_path: Optional[str] = None,
+        query_batch_size: int = 0,
+        query_batch_wait_ms: float = 5.0,
+        storage_format: Literal["pickle", "mmap"] = "pickle",
+        index_spec: Optional[IndexSpec] = None,
+        keyword_search: bool = False,
+        dedup_threshold: Optional[float] = None
         ) -> None:
         """
         Khởi tạo VectorDB.
@@ -40,30 +57,87 @@ class VectorDB:
             persist_directory: Thư mục để lưu vector database (cho Chroma)
             vector_db_kwargs: Các tham số bổ sung cho vector database
             index_name: Tên của index (cho FAISS)
+            query_cache_size: Số embedding câu hỏi được cache (LRU), 0 để tắt cache
+            query_cache_path: File .npz để lưu cache embedding câu hỏi giữa các lần khởi động
+            query_batch_size: Số câu hỏi tối đa được gom vào một batch embedding, <= 1 để tắt micro-batching
+            query_batch_wait_ms: Thời gian tối đa (ms) chờ gom câu hỏi vào một batch
+            storage_format: Định dạng lưu FAISS: 'pickle' (.faiss + .pkl của LangChain) hoặc
+                'mmap' (index memory-map + docstore SQLite, không dùng pickle, xem `index_store`)
+            index_spec: Loại FAISS index khi build (Flat, IVFFlat, HNSW, IVFPQ) và cách lưu vector
+                (float32, fp16, sq8), mặc định Flat float32
+            keyword_search: Duy trì thêm index BM25 trên cùng các chunk (lưu ở `{index_name}.bm25.json`)
+                để tìm kiếm theo từ khoá / hybrid
+            dedup_threshold: Bật loại bỏ chunk gần trùng khi ingest (MinHash, độ tương đồng Jaccard tối thiểu,
+                ví dụ 0.85); chỉ mục chống trùng lặp và tham chiếu ngược lưu ở `{index_name}.dedup.json`
         """
         self.vector_db_cls = vector_db_cls
         self.persist_directory = persist_directory
         self.index_name = index_name
+        if storage_format not in ("pickle", "mmap"):
+            raise ValueError(f"storage_format không hợp lệ: {storage_format}")
+        self.storage_format = storage_format
+        self.index_spec = index_spec or IndexSpec()
 
         self.embedding = embedding or HuggingFaceEmbeddings(
             model_name=self.DEFAULT_EMBEDDING_MODEL
         )
+        # Micro-batching nằm dưới cache: chỉ các câu hỏi chưa có trong cache mới được gom batch
+        if query_batch_size > 1:
+            self.embedding = MicroBatchingEmbeddings(
+                self.embedding,
+                max_batch_size=query_batch_size,
+                max_wait_ms=query_batch_wait_ms
+            )
+        if query_cache_size > 0:
+            self.embedding = CachedEmbeddings(
+                self.embedding,
+                max_size=query_cache_size,
+                persist_path=query_cache_path
+            )
         
         self.vector_db_kwargs = vector_db_kwargs or {}
         
 
+        # Tăng mỗi khi nội dung index thay đổi, để các cache phía trên biết cần invalidate
+        self.version = 0
+        self.keyword_search_enabled = keyword_search
+        self.bm25: Optional[BM25Index] = None
+        self.dedup_threshold = dedup_threshold
+        self.dedup: Optional[ChunkDeduplicator] = ChunkDeduplicator(dedup_threshold) if dedup_threshold else None
         self.db = None
         if documents:
             self.db = self._build_db(documents)
         elif persist_directory:
             self.db = self._load_db()
+            if isinstance(self.db, FAISS):
+                self.index_spec.apply_search_params(self.db.index)
+            if self.db and keyword_search:
+                self.bm25 = self._load_keyword_index()
+            if self.db and dedup_threshold:
+                self.dedup = self._load_dedup_index()
+        if self.db:
+            self.version += 1
         
-    def _build_db(self, documents: List[Document]) -> VectorStore:
+    @property
+    def embedding_model_name(self) -> str:
+        """Tên mô hình embedding (bỏ qua các lớp cache/micro-batching)."""
+        return embedding_model_name(self.embedding)
+
+    def _build_db(
+        self,
+        documents: List[Document],
+        ids: Optional[List[str]] = None,
+        save: bool = True,
+        embeddings: Optional[List[List[float]]] = None
+    ) -> VectorStore:
         """
         Xây dựng cơ sở dữ liệu vector từ documents.
         
         Args:
             documents: Danh sách các document cần lưu trữ
+            ids: Id cố định cho từng document (mặc định sinh ngẫu nhiên)
+            save: Lưu ngay xuống đĩa (nếu có persist_directory)
+            embeddings: Embedding đã tính sẵn cho từng document (mặc định tính bằng `self.embedding`)
             
         Returns:
             VectorStore: Cơ sở dữ liệu vector đã được xây dựng
@@ -75,14 +149,30 @@ class VectorDB:
         try:
 
             logger.info(f"Đang xây dựng {self.vector_db_cls.__name__} với {len(documents)} document")
-            db = self.vector_db_cls.from_documents(
-                documents=documents,
-                embedding=self.embedding,
-                **self.vector_db_kwargs
-            )
+            if self.vector_db_cls is FAISS and self.index_spec != IndexSpec():
+                db = self._build_faiss_with_spec(documents, ids=ids, embeddings=embeddings)
+            elif self.vector_db_cls is FAISS and embeddings is not None:
+                db = FAISS.from_embeddings(
+                    list(zip([doc.page_content for doc in documents], embeddings)),
+                    self.embedding,
+                    metadatas=[doc.metadata for doc in documents],
+                    ids=ids,
+                    **self.vector_db_kwargs
+                )
+            else:
+                db = self.vector_db_cls.from_documents(
+                    documents=documents,
+                    embedding=self.embedding,
+                    ids=ids,
+                    **self.vector_db_kwargs
+                )
+            if self.keyword_search_enabled:
+                self.bm25 = self._build_keyword_index(db)
+            if self.dedup is not None:
+                self._register_missing(self.dedup, db)
 
             # Lưu database nếu có persist_directory
-            if self.persist_directory:
+            if save and self.persist_directory:
                 self._save_db(db)
 
             logger.info(f"Xây dựng thành công {self.vector_db_cls.__name__}")
@@ -91,6 +181,122 @@ class VectorDB:
             logger.error(f"Lỗi khi xây dựng vector database: {str(e)}")
             raise
 
+    def _build_faiss_with_spec(
+        self,
+        documents: List[Document],
+        ids: Optional[List[str]] = None,
+        embeddings: Optional[List[List[float]]] = None
+    ) -> FAISS:
+        """
+        Xây dựng FAISS với loại index theo `index_spec` (train trên chính các embedding của documents).
+        
+        Args:
+            documents: Danh sách các document cần lưu trữ
+            ids: Id cố định cho từng document
+            embeddings: Embedding đã tính sẵn cho từng document
+            
+        Returns:
+            FAISS: Vector database đã được xây dựng
+        """
+        texts = [doc.page_content for doc in documents]
+        if embeddings is None:
+            embeddings = self.embedding.embed_documents(texts)
+        vectors = np.asarray(embeddings, dtype=np.float32)
+
+        distance_strategy = self.vector_db_kwargs.get("distance_strategy", DistanceStrategy.EUCLIDEAN_DISTANCE)
+        metric = faiss.METRIC_INNER_PRODUCT if distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT else faiss.METRIC_L2
+        training = vectors.copy()
+        if self.vector_db_kwargs.get("normalize_L2"):
+            faiss.normalize_L2(training)
+
+        db = FAISS(
+            embedding_function=self.embedding,
+            index=self.index_spec.build(training, metric=metric),
+            docstore=InMemoryDocstore(),
+            index_to_docstore_id={},
+            **self.vector_db_kwargs
+        )
+        db.add_embeddings(
+            list(zip(texts, vectors.tolist())),
+            metadatas=[doc.metadata for doc in documents],
+            ids=ids
+        )
+        return db
+
+    @property
+    def keyword_index_path(self) -> Optional[str]:
+        if not self.persist_directory:
+            return None
+        return os.path.join(self.persist_directory, f"{self.index_name}.bm25.json")
+
+    def _build_keyword_index(self, db: VectorStore) -> BM25Index:
+        """
+        Dựng index BM25 từ toàn bộ chunk trong docstore của vector database.
+        """
+        bm25 = BM25Index()
+        ids = list(db.index_to_docstore_id.values())
+        bm25.add(ids, (db.docstore.search(doc_id).page_content for doc_id in ids))
+        logger.info(f"Đã dựng index BM25 với {len(bm25)} chunk")
+        return bm25
+
+    def _load_keyword_index(self) -> BM25Index:
+        """
+        Load index BM25 đã lưu; dựng lại từ docstore nếu chưa có hoặc tập id không khớp với vector index
+        (ví dụ index được build trước khi bật tìm kiếm từ khoá, hoặc tiến trình dừng giữa lúc lưu FAISS và BM25).
+        """
+        path = self.keyword_index_path
+        bm25 = BM25Index.load(path) if os.path.exists(path) else None
+        if bm25 is not None and bm25.ids() == set(self.db.index_to_docstore_id.values()):
+            logger.info(f"Đã load index BM25 từ {path}")
+            return bm25
+        bm25 = self._build_keyword_index(self.db)
+        bm25.save(path)
+        return bm25
+
+    @property
+    def dedup_index_path(self) -> Optional[str]:
+        if not self.persist_directory:
+            return None
+        return os.path.join(self.persist_directory, f"{self.index_name}.dedup.json")
+
+    @staticmethod
+    def _register_missing(dedup: ChunkDeduplicator, db: VectorStore) -> int:
+        """Đăng ký làm chunk đại diện các chunk trong index mà chỉ mục chống trùng lặp chưa biết."""
+        known = dedup.ids()
+        missing = [doc_id for doc_id in db.index_to_docstore_id.values() if doc_id not in known]
+        for doc_id in missing:
+            dedup.register(doc_id, db.docstore.search(doc_id))
+        return len(missing)
+
+    def _load_dedup_index(self) -> ChunkDeduplicator:
+        """
+        Load chỉ mục chống trùng lặp đã lưu (dựng mới nếu chưa có hoặc khác ngưỡng), rồi đăng ký các chunk
+        trong index còn thiếu (ví dụ index được build trước khi bật chống trùng lặp).
+        """
+        path = self.dedup_index_path
+        dedup = ChunkDeduplicator.load(path) if os.path.exists(path) else None
+        if dedup is None or dedup.threshold != self.dedup_threshold:
+            dedup = ChunkDeduplicator(self.dedup_threshold)
+        registered = self._register_missing(dedup, self.db)
+        if registered:
+            logger.info(f"Đã đăng ký {registered} chunk vào chỉ mục chống trùng lặp")
+            dedup.save(path)
+        return dedup
+
+    def duplicate_sources(self, doc_id: str) -> List[Dict[str, Any]]:
+        """
+        Metadata (source, page, ...) của các chunk gần trùng đã được gộp vào chunk `doc_id` khi ingest.
+
+        Args:
+            doc_id: Id chunk trong index
+
+        Returns:
+            List[Dict[str, Any]]: Metadata của từng bản trùng (kèm `chunk_id`), rỗng nếu không có
+        """
+        if self.dedup is None:
+            return []
+        return self.dedup.duplicate_refs(doc_id)
+
     def _load_db(self) -> Optional[VectorStore]:
         """
         Load vector database từ đĩa.
@@ -107,7 +313,12 @@ class VectorDB:
             index_path = os.path.join(faiss_path, f"{self.index_name}.faiss")
             index_pkl_path = os.path.join(faiss_path, f"{self.index_name}.pkl")
             
-            if os.path.exists(index_path) and os.path.exists(index_pkl_path):
+            if self.storage_format == "mmap" and index_store.mmap_files_exist(faiss_path, self.index_name):
+                logger.info(f"Đang load FAISS database (mmap) từ {faiss_path}")
+                db = index_store.load_mmap(faiss_path, self.index_name, self.embedding)
+                logger.info("Đã load FAISS database thành công")
+                return db
+            elif os.path.exists(index_path) and os.path.exists(index_pkl_path):
                 logger.info(f"Đang load FAISS database từ {faiss_path}")
                 db = FAISS.load_local(
                     folder_path=faiss_path,
@@ -116,6 +327,9 @@ class VectorDB:
                     allow_dangerous_deserialization=True
                 )
                 logger.info("Đã load FAISS database thành công")
+                if self.storage_format == "mmap":
+                    # Chuyển index cũ sang định dạng mmap để các lần khởi động sau không phải unpickle
+                    self._save_db(db)
                 return db
             else:
                 logger.warning(f"Không tìm thấy file FAISS index tại {faiss_path}")
@@ -150,30 +364,182 @@ class VectorDB:
         )
         return retriever
 
-    def add_documents(self, documents: List[Document]) -> None:
+    def add_documents(
+        self,
+        documents: List[Document],
+        ids: Optional[List[str]] = None,
+        save: bool = True,
+        embeddings: Optional[List[List[float]]] = None
+    ) -> None:
         """
         Thêm documents vào vector database đã tồn tại.
         
         Args:
             documents: Danh sách các document cần thêm
+            ids: Id cố định cho từng document (dùng để xoá/cập nhật theo file sau này)
+            save: Lưu ngay xuống đĩa; False khi thêm nhiều batch liên tiếp rồi gọi `save()` một lần
+            embeddings: Embedding đã tính sẵn cho từng document (ví dụ từ pipeline ingest),
+                mặc định tính bằng `self.embedding`
         """
         if not documents:
             logger.warning("Không có documents nào để thêm vào vector database")
             return
             
         if not self.db:
-            self.db = self._build_db(documents)
+            self.db = self._build_db(documents, ids=ids, save=save, embeddings=embeddings)
+            self.version += 1
         else:
             try:
                 logger.info(f"Đang thêm {len(documents)} documents vào vector database")
-                self.db.add_documents(documents)
+                self._ensure_writable()
+                if embeddings is not None:
+                    ids = self.db.add_embeddings(
+                        list(zip([doc.page_content for doc in documents], embeddings)),
+                        metadatas=[doc.metadata for doc in documents],
+                        ids=ids
+                    )
+                else:
+                    ids = self.db.add_documents(documents, ids=ids)
+                if self.bm25 is not None:
+                    self.bm25.add(ids, (doc.page_content for doc in documents))
+                self.version += 1
                 
-                if self.persist_directory:
+                if save and self.persist_directory:
                     self._save_db(self.db)
             except Exception as e:
                 logger.error(f"Lỗi khi thêm documents vào vector database: {str(e)}")
                 raise
        
+    def reset(self) -> None:
+        """
+        Bỏ index hiện tại; lần `add_documents` tiếp theo sẽ build lại từ đầu theo `index_spec`.
+        """
+        self.db = None
+        self.bm25 = None
+        if self.dedup is not None:
+            self.dedup = ChunkDeduplicator(self.dedup_threshold)
+        self.version += 1
+
+    def delete_documents(self, ids: List[str]) -> int:
+        """
+        Xoá các document theo id khỏi vector database (bỏ qua các id không tồn tại).
+        Khi bật chống trùng lặp, bản trùng của chunk đại diện bị xoá được thêm vào index thay thế.
+        
+        Args:
+            ids: Danh sách id cần xoá
+            
+        Returns:
+            int: Số document đã xoá
+        """
+        if not self.db or not ids:
+            return 0
+
+        promoted = self.dedup.drop(ids) if self.dedup is not None else []
+        existing = set(self.document_ids())
+        ids = [doc_id for doc_id in dict.fromkeys(ids) if doc_id in existing]
+        if not ids and not promoted:
+            if self.dedup is not None and self.persist_directory:
+                # Chỉ bỏ các bản trùng (không có trong index): vẫn lưu lại tham chiếu ngược
+                self.dedup.save(self.dedup_index_path)
+            return 0
+        try:
+            logger.info(f"Đang xoá {len(ids)} documents khỏi vector database")
+            self._ensure_writable()
+            if ids:
+                index_store.remove_from_index(self.db, ids)
+            if self.bm25 is not None:
+                self.bm25.delete(ids)
+            self.version += 1
+            if promoted:
+                logger.info(f"Thêm {len(promoted)} chunk trùng lặp thay cho chunk đại diện đã xoá")
+                self.add_documents([doc for _, doc in promoted], ids=[doc_id for doc_id, _ in promoted], save=False)
+
+            if self.persist_directory:
+                self._save_db(self.db)
+            return len(ids)
+        except Exception as e:
+            logger.error(f"Lỗi khi xoá documents khỏi vector database: {str(e)}")
+            raise
+
+    def document_ids(self) -> List[str]:
+        """
+        Danh sách id của các document đang có trong vector database (FAISS).
+        """
+        if not self.db:
+            return []
+        return list(self.db.index_to_docstore_id.values())
+
+    def keyword_search(self, query: str, k: int = 10) -> List[Tuple[Document, float]]:
+        """
+        Tìm các chunk theo từ khoá bằng BM25.
+        
+        Args:
+            query: Câu truy vấn
+            k: Số kết quả
+            
+        Returns:
+            List[Tuple[Document, float]]: (document, score BM25) theo score giảm dần
+        """
+        if self.bm25 is None:
+            raise ValueError("Chưa bật tìm kiếm từ khoá (keyword_search=True)")
+        results = []
+        for doc_id, score in self.bm25.search(query, k):
+            doc = self.db.docstore.search(doc_id)
+            if isinstance(doc, Document):
+                results.append((doc, score))
+        return results
+
+    def neighbor_chunks(self, doc: Document, window: int = 1) -> List[Document]:
+        """
+        Chunk đứng trước/sau một chunk trong cùng file, theo `prev_chunk_id`/`next_chunk_id` lưu khi ingest.
+
+        Args:
+            doc: Chunk đã retrieve
+            window: Số chunk lấy thêm mỗi phía
+
+        Returns:
+            List[Document]: Các chunk theo thứ tự trong file, gồm cả `doc`
+        """
+        if not self.db:
+            return [doc]
+        before: List[Document] = []
+        after: List[Document] = []
+        for key, out in (("prev_chunk_id", before), ("next_chunk_id", after)):
+            current = doc
+            for _ in range(window):
+                neighbor_id = current.metadata.get(key)
+                neighbor = self.db.docstore.search(neighbor_id) if neighbor_id else None
+                if not isinstance(neighbor, Document):
+                    break
+                out.append(neighbor)
+                current = neighbor
+        return before[::-1] + [doc] + after
+
+    def documents_by_source(self) -> Dict[str, List[str]]:
+        """
+        Gom id document theo metadata["source"], dùng để nhận diện index cũ chưa có manifest.
+        
+        Returns:
+            Dict[str, List[str]]: source -> danh sách id document
+        """
+        groups: Dict[str, List[str]] = {}
+        for doc_id in self.document_ids():
+            doc = self.db.docstore.search(doc_id)
+            if isinstance(doc, Document):
+                groups.setdefault(doc.metadata.get("source", ""), []).append(doc_id)
+        return groups
+
+    def _ensure_writable(self) -> None:
+        """
+        Index mở theo định dạng mmap là chỉ đọc: load lại toàn bộ vào RAM trước khi thêm/xoá.
+        """
+        if isinstance(self.db, FAISS) and index_store.is_read_only(self.db):
+            logger.info("Đang load index vào RAM để cập nhật")
+            self.db = index_store.load_mmap(
+                self.persist_directory, self.index_name, self.embedding, writable=True
+            )
+            self.index_spec.apply_search_params(self.db.index)
+
     def _save_db(self, db: VectorStore):
         """
         Lưu vector database vào đĩa.
@@ -182,7 +548,11 @@ class VectorDB:
             db: Vector database cần lưu
         """
         try:
-            if isinstance(db, FAISS):
+            if isinstance(db, FAISS) and self.storage_format == "mmap":
+                index_store.save_mmap(db, self.persist_directory, self.index_name)
+                logger.info(f"Đã lưu FAISS vector database (mmap) vào {self.persist_directory}")
+
+            elif isinstance(db, FAISS):
                 # Đảm bảo thư mục tồn tại
                 os.makedirs(self.persist_directory, exist_ok=True)
                 
@@ -195,12 +565,17 @@ class VectorDB:
             
             else:
                 logger.warning(f"Chưa hỗ trợ lưu cho loại database {type(db).__name__}")
+
+            if self.bm25 is not None:
+                self.bm25.save(self.keyword_index_path)
+            if self.dedup is not None:
+                self.dedup.save(self.dedup_index_path)
         
         except Exception as e:
             logger.error(f"Lỗi khi lưu vector database: {str(e)}")
             raise
     
-    def save(self, save_path: str) -> None:
+    def save(self, save_path: Optional[str] = None) -> None:
         """
         Lưu vector database hiện tại.
         """
@@ -211,3 +586,24 @@ class VectorDB:
             raise ValueError("Không có persist_directory để lưu database")
             
         self._save_db(self.db)
+
+    def save_query_cache(self) -> None:
+        """
+        Lưu cache embedding câu hỏi ra đĩa (nếu cache được bật và có query_cache_path).
+        """
+        if isinstance(self.embedding, CachedEmbeddings) and self.embedding.persist_path:
+            self.embedding.save()
+
+    def embedding_stats(self) -> Optional[Dict[str, Any]]:
+        """
+        Thống kê cache và micro-batching của embedding câu hỏi, None nếu không bật lớp nào.
+        """
+        stats = {}
+        embedding = self.embedding
+        while embedding is not None:
+            if isinstance(embedding, CachedEmbeddings):
+                stats["cache"] = embedding.stats()
+            elif isinstance(embedding, MicroBatchingEmbeddings):
+                stats["batching"] = embedding.stats()
+            embedding = getattr(embedding, "underlying", None)
+        return stats or None
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Chạy pytest từ thư mục gốc repo hoặc từ backend đều import được `src` và `main`
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
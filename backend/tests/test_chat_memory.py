@@ -0,0 +1,17 @@
+import pytest
+
+from src.rag.chat_memory import BaseHistoryStore, InMemoryHistoryStore, SQLiteHistoryStore
+
+
+def test_history_store_subclass_must_implement_every_method():
+    class PartialStore(BaseHistoryStore):
+        def get_messages(self, session_id):
+            return []
+
+    with pytest.raises(TypeError):
+        PartialStore()
+
+
+def test_bundled_history_stores_are_concrete(tmp_path):
+    assert len(InMemoryHistoryStore()) == 0
+    assert len(SQLiteHistoryStore(str(tmp_path / "history.sqlite"))) == 0
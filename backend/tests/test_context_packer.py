@@ -0,0 +1,45 @@
+from langchain_core.documents import Document
+
+from src.rag.context_packer import ContextPacker
+
+TEXT = (
+    "Công ty cung cấp dịch vụ phát triển phần mềm theo yêu cầu cho khách hàng trong và ngoài nước. "
+    "Đội ngũ gồm hơn một trăm kỹ sư có kinh nghiệm với điện toán đám mây và trí tuệ nhân tạo. "
+    "Văn phòng chính đặt tại Thành phố Hồ Chí Minh, chi nhánh tại Hà Nội và Singapore."
+)
+
+
+def chunk(start, end, source="a.pdf"):
+    return Document(page_content=TEXT[start:end], metadata={"source": source})
+
+
+def test_overlapping_chunks_of_one_source_are_merged():
+    packer = ContextPacker(min_overlap=20)
+    # Thứ tự retrieval không theo thứ tự trong file: chunk giữa nối được cả hai phía
+    passages = packer.passages([chunk(150, len(TEXT)), chunk(0, 120), chunk(90, 190)])
+    assert len(passages) == 1
+    assert passages[0].text == TEXT
+    assert passages[0].rank == 0
+    assert len(passages[0].documents) == 3
+
+
+def test_chunks_of_different_sources_are_not_merged():
+    packer = ContextPacker(min_overlap=20)
+    passages = packer.passages([chunk(0, 120, "a.pdf"), chunk(90, 190, "b.pdf")])
+    assert [p.source for p in passages] == ["a.pdf", "b.pdf"]
+
+
+def test_near_duplicates_are_dropped_and_rank_order_kept():
+    packer = ContextPacker(duplicate_threshold=0.9)
+    other = Document(page_content="Chính sách bảo hành sản phẩm trong mười hai tháng kể từ ngày bàn giao.", metadata={"source": "c.pdf"})
+    duplicate = Document(page_content=TEXT[:120], metadata={"source": "copy.pdf"})
+    passages = packer.passages([chunk(0, 120), other, duplicate])
+    assert [p.source for p in passages] == ["a.pdf", "c.pdf"]
+
+
+def test_budget_truncates_first_passage_and_skips_the_rest():
+    packer = ContextPacker(max_tokens=20, token_counter=lambda text: len(text) // 4 + 1)
+    selected = packer.select([chunk(0, 120), Document(page_content="x" * 200, metadata={"source": "b.pdf"})])
+    assert len(selected) == 1
+    assert len(selected[0].text) < 120
+    assert packer.pack([chunk(0, 40)]) == TEXT[:40]
@@ -0,0 +1,123 @@
+import functools
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.crawl.engine import Crawler, HostLimiter, extract_content
+from src.crawl.state import CrawlState
+
+ARTICLE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Dịch vụ AI</title><script>var x = "không lấy";</script></head>
+<body>
+<nav><a href="/menu">Menu</a></nav>
+<article>
+<h1>Giải pháp trí tuệ nhân tạo</h1>
+<p>Chúng tôi xây dựng hệ thống hỏi đáp dựa trên tài liệu nội bộ cho doanh nghiệp vừa và nhỏ.</p>
+<h2>Quy trình</h2>
+<ul><li>Thu thập dữ liệu</li><li>Huấn luyện mô hình</li></ul>
+<p>Xem thêm <a href="/lien-he#form">liên hệ</a>, <a href="lien-he">liên hệ</a> và <a href="mailto:a@b.c">email</a>.</p>
+</article>
+<footer>Bản quyền</footer>
+</body></html>
+"""
+
+
+class RecordingHandler(SimpleHTTPRequestHandler):
+    arrivals = []
+
+    def do_GET(self):
+        self.arrivals.append((self.path, time.monotonic()))
+        super().do_GET()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def site(tmp_path):
+    (tmp_path / "article.html").write_text(ARTICLE, encoding="utf-8")
+    for i in range(6):
+        (tmp_path / f"p{i}.html").write_text(f"<html><body><main><p>Trang số {i} " + "nội dung " * 30 + "</p></main></body></html>", encoding="utf-8")
+    RecordingHandler.arrivals = []
+    handler = functools.partial(RecordingHandler, directory=str(tmp_path))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_extract_content():
+    content = extract_content(ARTICLE.encode("utf-8"), base_url="http://example.com/dich-vu/")
+    assert content.title == "Dịch vụ AI"
+    assert content.headings == [{"level": 1, "text": "Giải pháp trí tuệ nhân tạo"}, {"level": 2, "text": "Quy trình"}]
+    assert "• Thu thập dữ liệu" in content.text.split("\n")
+    assert "không lấy" not in content.text and "Menu" not in content.text and "Bản quyền" not in content.text
+    # Link tuyệt đối, bỏ fragment, không trùng lặp, chỉ http(s)
+    assert content.links == ["http://example.com/lien-he", "http://example.com/dich-vu/lien-he"]
+
+
+def test_crawl_local_site(site):
+    urls = [f"{site}/article.html", f"{site}/missing.html", f"{site}/article.html"] + [f"{site}/p{i}.html" for i in range(3)]
+    with Crawler(concurrency=4, mode="http", host_delay=0.0, min_text_chars=50) as crawler:
+        results = {result.url: result for result in crawler.crawl(urls)}
+
+    assert len(results) == 5
+    article = results[f"{site}/article.html"]
+    assert article.ok and article.status == 200 and article.fetched_via == "http"
+    assert article.title == "Dịch vụ AI"
+    assert article.links == [f"{site}/lien-he"]
+    assert article.content_hash
+
+    missing = results[f"{site}/missing.html"]
+    assert not missing.ok
+    assert missing.status == 404 and missing.error == "HTTP 404"
+    assert crawler.stats == {"http": 4, "browser": 0, "unchanged": 0, "failed": 1}
+
+
+def test_host_limiter_spaces_requests(site):
+    delay = 0.1
+    urls = [f"{site}/p{i}.html" for i in range(6)]
+    with Crawler(concurrency=6, mode="http", per_host=6, host_delay=delay) as crawler:
+        assert all(result.ok for result in crawler.crawl(urls))
+    starts = sorted(arrival for _, arrival in RecordingHandler.arrivals)
+    assert len(starts) == 6
+    gaps = [later - earlier for earlier, later in zip(starts, starts[1:])]
+    assert min(gaps) >= delay * 0.8
+
+
+def test_host_limiter_caps_concurrency():
+    limiter = HostLimiter(per_host=2, delay=0.0)
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def work():
+        with limiter.slot("http://example.com/a"):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+
+    threads = [threading.Thread(target=work) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak[0] == 2
+
+
+def test_recrawl_uses_conditional_get(site, tmp_path):
+    url = f"{site}/article.html"
+    state = CrawlState(str(tmp_path / "state.json"))
+    with Crawler(mode="http", host_delay=0.0, state=state) as crawler:
+        first = crawler.fetch(url)
+        assert first.changed is True
+        state.update(url, etag=first.etag, last_modified=first.last_modified, sha256=first.content_hash)
+        second = crawler.fetch(url)
+    assert second.not_modified and second.changed is False
+    assert crawler.stats["unchanged"] == 1
@@ -0,0 +1,113 @@
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.rag.dedup import ChunkDeduplicator
+from src.rag.offline_rag import Offline_RAG
+from src.rag.retrieval import RetrievalService
+from src.rag.vectorstore import VectorDB
+
+FOOTER = "Bản quyền thuộc về công ty cổ phần công nghệ, mọi hình thức sao chép đều phải được sự đồng ý bằng văn bản."
+
+
+def page(source, text=FOOTER):
+    return Document(page_content=text, metadata={"source": source})
+
+
+def test_near_duplicate_is_recorded_as_reference():
+    dedup = ChunkDeduplicator(threshold=0.8)
+    assert dedup.add("a-0", page("a.pdf")) is None
+    assert dedup.add("b-0", page("b.pdf", FOOTER + " Trang 2")) == "a-0"
+    assert dedup.add("c-0", page("c.pdf", "Nội dung hoàn toàn khác về chính sách bảo hành sản phẩm.")) is None
+    assert [ref["source"] for ref in dedup.duplicate_refs("a-0")] == ["b.pdf"]
+    assert dedup.stats()["duplicates"] == 1
+
+
+def test_dropping_canonical_promotes_first_duplicate():
+    dedup = ChunkDeduplicator()
+    for doc_id, source in [("a-0", "a.pdf"), ("b-0", "b.pdf"), ("c-0", "c.pdf")]:
+        dedup.add(doc_id, page(source))
+
+    promoted = dedup.drop(["a-0"])
+    assert [(doc_id, doc.metadata["source"]) for doc_id, doc in promoted] == [("b-0", "b.pdf")]
+    # Bản trùng còn lại trỏ sang đại diện mới, chunk mới cùng nội dung vẫn được nhận là trùng
+    assert dedup.duplicate_of == {"c-0": "b-0"}
+    assert dedup.add("d-0", page("d.pdf")) == "b-0"
+    assert dedup.ids() == {"b-0", "c-0", "d-0"}
+
+
+def test_dropping_duplicate_only_removes_its_reference():
+    dedup = ChunkDeduplicator()
+    dedup.add("a-0", page("a.pdf"))
+    dedup.add("b-0", page("b.pdf"))
+
+    assert dedup.drop(["b-0"]) == []
+    assert dedup.duplicates == {} and dedup.duplicate_of == {}
+    assert dedup.drop(["a-0"]) == []
+    assert dedup.ids() == set()
+
+
+def test_save_and_load_round_trip(tmp_path):
+    dedup = ChunkDeduplicator(threshold=0.8)
+    dedup.add("a-0", page("a.pdf"))
+    dedup.add("b-0", page("b.pdf"))
+    path = str(tmp_path / "db.dedup.json")
+    dedup.save(path)
+
+    loaded = ChunkDeduplicator.load(path)
+    assert loaded.threshold == 0.8
+    assert loaded.duplicate_of == {"b-0": "a-0"}
+    assert loaded.add("c-0", page("c.pdf")) == "a-0"
+    assert [doc_id for doc_id, _ in loaded.drop(["a-0"])] == ["b-0"]
+
+
+def test_vectordb_delete_promotes_duplicate_into_index(tmp_path):
+    vectordb = VectorDB(
+        documents=None,
+        vector_db_cls=FAISS,
+        embedding=DeterministicFakeEmbedding(size=8),
+        persist_directory=str(tmp_path),
+        index_name="db",
+        dedup_threshold=0.85
+    )
+    vectordb.add_documents([page("a.pdf")], ids=["a-0"])
+    # Pipeline ingest chỉ ghi tham chiếu ngược cho bản trùng, không embed
+    assert vectordb.dedup.add("b-0", page("b.pdf")) == "a-0"
+
+    assert vectordb.delete_documents(["a-0"]) == 1
+    assert vectordb.document_ids() == ["b-0"]
+    assert vectordb.db.docstore.search("b-0").metadata["source"] == "b.pdf"
+
+    reopened = VectorDB(
+        documents=None,
+        vector_db_cls=FAISS,
+        embedding=DeterministicFakeEmbedding(size=8),
+        persist_directory=str(tmp_path),
+        index_name="db",
+        dedup_threshold=0.85
+    )
+    assert reopened.dedup.ids() == {"b-0"}
+
+
+def test_retrieved_chunk_lists_sources_of_its_duplicates(tmp_path):
+    vectordb = VectorDB(
+        documents=None,
+        vector_db_cls=FAISS,
+        embedding=DeterministicFakeEmbedding(size=8),
+        persist_directory=str(tmp_path),
+        index_name="db",
+        dedup_threshold=0.85
+    )
+    canonical = Document(page_content=FOOTER, metadata={"source": "/web/a.jsonl", "title": "Trang A", "links": ["http://a"]})
+    vectordb.add_documents([canonical], ids=["a-0"])
+    vectordb.dedup.add("b-0", Document(page_content=FOOTER, metadata={"source": "/web/b.jsonl", "title": "Trang B", "links": ["http://b"]}))
+
+    retrieved = RetrievalService(vectordb, search_kwargs={"k": 1}).retrieve("bản quyền")
+    doc = retrieved[0][0]
+    assert [ref["chunk_id"] for ref in doc.metadata["duplicate_sources"]] == ["b-0"]
+    # Document trong docstore không bị sửa
+    assert "duplicate_sources" not in vectordb.db.docstore.search("a-0").metadata
+
+    source = Offline_RAG.format_sources([doc])[0]
+    assert source["links"] == ["http://a", "http://b"]
+    assert source["duplicates"] == [{"url": "/web/b.jsonl", "title": "Trang B"}]
@@ -0,0 +1,43 @@
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+from src.rag.embeddings import CachedEmbeddings, MicroBatchingEmbeddings
+
+
+class NamedEmbeddings(Embeddings):
+    def __init__(self, model_name: str, value: float) -> None:
+        self.model_name = model_name
+        self.value = value
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [[self.value, float(len(text))] for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def cached(model_name: str, value: float, path: str) -> CachedEmbeddings:
+    return CachedEmbeddings(MicroBatchingEmbeddings(NamedEmbeddings(model_name, value)), persist_path=path)
+
+
+def test_namespace_resolves_through_micro_batching():
+    embeddings = CachedEmbeddings(MicroBatchingEmbeddings(NamedEmbeddings("model-a", 1.0)))
+    assert embeddings.namespace == "model-a"
+    embeddings.underlying.close()
+
+
+def test_persisted_cache_of_another_model_is_ignored(tmp_path):
+    path = str(tmp_path / "cache.npz")
+    first = cached("model-a", 1.0, path)
+    assert first.embed_query("xin chào") == [1.0, 8.0]
+    first.save()
+    first.underlying.close()
+
+    same = cached("model-a", 2.0, path)
+    assert same.embed_query("xin chào") == [1.0, 8.0]
+    same.underlying.close()
+
+    other = cached("model-b", 2.0, path)
+    assert other.embed_query("xin chào") == [2.0, 8.0]
+    other.underlying.close()
@@ -0,0 +1,39 @@
+import fitz
+import pytest
+
+from src.rag import extraction
+from src.rag.extraction import FALLBACK_BACKEND, PageCache, extract_pages, file_sha256
+
+
+@pytest.fixture
+def pdf_file(tmp_path):
+    path = tmp_path / "doc.pdf"
+    with fitz.open() as doc:
+        doc.new_page().insert_text((72, 72), "Xin chao trang mot")
+        doc.save(str(path))
+    return str(path)
+
+
+def test_fallback_result_is_cached_under_fallback_backend(pdf_file, tmp_path, monkeypatch):
+    def broken(path):
+        raise RuntimeError("broken")
+
+    monkeypatch.setitem(extraction.BACKENDS, "pymupdf", broken)
+    cache_dir = str(tmp_path / "cache")
+    pages, _ = extract_pages(pdf_file, backend="pymupdf", cache_dir=cache_dir)
+    assert "trang mot" in pages[0]
+
+    content_hash = file_sha256(pdf_file)
+    cache = PageCache(cache_dir)
+    assert cache.get(content_hash, "pymupdf") is None
+    assert cache.get(content_hash, FALLBACK_BACKEND) is not None
+
+
+def test_known_content_hash_skips_hashing(pdf_file, tmp_path, monkeypatch):
+    content_hash = file_sha256(pdf_file)
+    calls = []
+    monkeypatch.setattr(extraction, "file_sha256", lambda path: calls.append(path) or content_hash)
+    cache_dir = str(tmp_path / "cache")
+    extract_pages(pdf_file, cache_dir=cache_dir, content_hash=content_hash)
+    assert calls == []
+    assert PageCache(cache_dir).get(content_hash, "pymupdf") is not None
@@ -0,0 +1,16 @@
+from src.rag.index_spec import IndexSpec
+
+
+def test_build_key_ignores_search_params():
+    base = IndexSpec.from_string("hnsw,M=16,ef_search=32")
+    tuned = IndexSpec.from_string("hnsw,M=16,ef_search=256")
+    assert base.build_key == tuned.build_key
+    assert IndexSpec.from_string("ivfflat,nprobe=4").build_key == IndexSpec.from_string("ivfflat,nprobe=64").build_key
+    assert IndexSpec.from_string("flat,refine=2").build_key == IndexSpec.from_string("flat,refine=8").build_key
+
+
+def test_build_key_tracks_build_params():
+    assert IndexSpec.from_string("hnsw,M=16").build_key != IndexSpec.from_string("hnsw,M=32").build_key
+    assert IndexSpec.from_string("ivfflat,nlist=64").build_key != IndexSpec.from_string("ivfflat,nlist=128").build_key
+    assert IndexSpec.from_string("flat").build_key != IndexSpec.from_string("flat,refine=2").build_key
+    assert IndexSpec.from_string("flat").build_key != IndexSpec.from_string("flat,storage=sq8").build_key
@@ -0,0 +1,90 @@
+import os
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.rag import index_store
+from src.rag.index_spec import IndexSpec
+
+
+def build(spec: str, n: int = 300, dim: int = 16):
+    rng = np.random.RandomState(0)
+    vectors = rng.rand(n, dim).astype(np.float32)
+    db = FAISS(
+        embedding_function=DeterministicFakeEmbedding(size=dim),
+        index=IndexSpec.from_string(spec).build(vectors),
+        docstore=index_store.InMemoryDocstore(),
+        index_to_docstore_id={}
+    )
+    db.add_embeddings([(f"doc {i}", vector) for i, vector in enumerate(vectors)], ids=[f"id{i}" for i in range(n)])
+    return db, vectors
+
+
+def test_save_mmap_swaps_generations_and_keeps_caller_index(tmp_path):
+    db, vectors = build("flat", n=20)
+    folder = str(tmp_path)
+    index_store.save_mmap(db, folder, "db")
+    assert isinstance(faiss.downcast_index(db.index), faiss.IndexFlat)
+
+    first = index_store.current_files(folder, "db")
+    db.delete(["id0"])
+    index_store.save_mmap(db, folder, "db")
+    second = index_store.current_files(folder, "db")
+    assert first != second and all(os.path.exists(path) for path in first + second)
+    index_store.save_mmap(db, folder, "db")
+    assert not os.path.exists(first[0])
+
+    loaded = index_store.load_mmap(folder, "db", db.embeddings)
+    assert index_store.is_read_only(loaded)
+    assert sorted(loaded.index_to_docstore_id.values()) == sorted(db.index_to_docstore_id.values())
+    _, positions = loaded.index.search(vectors[5:6], 1)
+    assert loaded.docstore.search(loaded.index_to_docstore_id[int(positions[0][0])]).page_content == "doc 5"
+
+
+def check_remove(spec: str):
+    db, vectors = build(spec)
+    dropped = [f"id{i}" for i in range(0, 300, 3)]
+    index_store.remove_from_index(db, dropped)
+    assert db.index.ntotal == 200
+    assert sorted(db.index_to_docstore_id) == list(range(200))
+
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    hits = 0
+    for i in range(1, 300, 3):
+        _, positions = db.index.search(vectors[i:i + 1], 1)
+        doc_id = db.index_to_docstore_id[int(positions[0][0])]
+        assert doc_id not in dropped
+        hits += doc_id == f"id{i}"
+    assert hits >= 90
+
+    # Vector thêm sau khi xoá nhận vị trí mới, không trùng vị trí còn lại
+    db.add_embeddings([("late", vectors[0])], ids=["late"])
+    _, positions = db.index.search(vectors[0:1], 1)
+    assert db.index_to_docstore_id[int(positions[0][0])] == "late"
+
+
+def test_remove_from_ivfflat():
+    check_remove("ivfflat,nlist=4,nprobe=4")
+
+
+def test_remove_from_ivfpq_keeps_codes():
+    db, _ = build("ivfpq,nlist=4,nprobe=4,pq_m=4,pq_bits=8", n=300)
+    index = faiss.downcast_index(db.index)
+    index.make_direct_map()
+    before = {doc_id: index.reconstruct(position) for position, doc_id in db.index_to_docstore_id.items()}
+    index_store.remove_from_index(db, ["id0", "id1"])
+    index.make_direct_map()
+    for position, doc_id in db.index_to_docstore_id.items():
+        np.testing.assert_array_equal(index.reconstruct(position), before[doc_id])
+
+
+def test_remove_from_hnsw():
+    check_remove("hnsw,M=16")
+
+
+def test_remove_from_flat():
+    check_remove("flat")
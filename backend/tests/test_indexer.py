@@ -0,0 +1,184 @@
+import os
+import time
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.crawl.corpus import write_records
+from src.rag.file_loader import Loader
+from src.rag.index_spec import IndexSpec
+from src.rag.indexer import IndexManifest, sync_index
+from src.rag.vectorstore import VectorDB
+
+SPLIT_KWARGS = {"chunker": "recursive", "chunk_size": 80, "chunk_overlap": 0}
+
+
+def write_page(data_dir, name, *paragraphs):
+    write_records(str(data_dir / f"{name}.jsonl"), [{"url": f"http://example.com/{name}", "title": name, "text": "\n\n".join(paragraphs)}])
+
+
+def open_db(index_dir):
+    return VectorDB(
+        vector_db_cls=FAISS,
+        embedding=DeterministicFakeEmbedding(size=8),
+        persist_directory=str(index_dir),
+        index_name="db",
+        keyword_search=True
+    )
+
+
+def sync(index_dir, data_dir, **kwargs):
+    db = open_db(index_dir)
+    stats = sync_index(db, str(data_dir), Loader("jsonl", split_kwargs=SPLIT_KWARGS), pattern="*.jsonl", config=SPLIT_KWARGS, **kwargs)
+    return db, stats
+
+
+def manifest_ids(index_dir):
+    manifest = IndexManifest.for_index(str(index_dir), "db")
+    return sorted(doc_id for entry in manifest.files.values() for doc_id in entry["chunk_ids"])
+
+
+def sources(db):
+    return sorted({os.path.basename(db.db.docstore.search(doc_id).metadata["source"]) for doc_id in db.document_ids()})
+
+
+def test_sync_adds_updates_and_removes_files(tmp_path):
+    data_dir, index_dir = tmp_path / "data", tmp_path / "index"
+    write_page(data_dir, "a", "Trang a đoạn một về dịch vụ phần mềm.", "Trang a đoạn hai về tuyển dụng kỹ sư.")
+    write_page(data_dir, "b", "Trang b nói về trí tuệ nhân tạo.")
+
+    db, stats = sync(index_dir, data_dir)
+    assert (stats["added"], stats["updated"], stats["removed"]) == (2, 0, 0)
+    assert sources(db) == ["a.jsonl", "b.jsonl"]
+    assert sorted(db.document_ids()) == manifest_ids(index_dir)
+
+    # Không đổi gì: không embed lại
+    db, stats = sync(index_dir, data_dir)
+    assert (stats["unchanged"], stats["chunks_added"], stats["chunks_removed"]) == (2, 0, 0)
+
+    # Sửa a, xoá b, thêm c
+    write_page(data_dir, "a", "Trang a đã được viết lại hoàn toàn.")
+    os.remove(data_dir / "b.jsonl")
+    write_page(data_dir, "c", "Trang c giới thiệu văn phòng tại Hà Nội.")
+    db, stats = sync(index_dir, data_dir)
+    assert (stats["added"], stats["updated"], stats["removed"]) == (1, 1, 1)
+    assert sources(db) == ["a.jsonl", "c.jsonl"]
+    assert sorted(db.document_ids()) == manifest_ids(index_dir)
+    assert [doc.page_content for doc, _ in db.keyword_search("viết lại", 1)] == ["Trang a đã được viết lại hoàn toàn."]
+    assert db.keyword_search("trí tuệ nhân tạo", 5) == []
+
+
+def test_config_change_reindexes_everything(tmp_path):
+    data_dir, index_dir = tmp_path / "data", tmp_path / "index"
+    write_page(data_dir, "a", "Nội dung trang a.")
+    sync(index_dir, data_dir)
+    db = open_db(index_dir)
+    stats = sync_index(db, str(data_dir), Loader("jsonl", split_kwargs=SPLIT_KWARGS), pattern="*.jsonl", config={**SPLIT_KWARGS, "chunk_size": 60})
+    assert stats["added"] == 1 and stats["unchanged"] == 0
+    assert sorted(db.document_ids()) == manifest_ids(index_dir)
+
+
+class FlakyEmbedding(DeterministicFakeEmbedding):
+    """Embedding giả lỗi từ lần gọi `embed_documents` thứ `fail_at` (mô phỏng tiến trình bị dừng giữa chừng)."""
+
+    fail_at: int = 0
+    calls: int = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        if self.fail_at and self.calls >= self.fail_at:
+            raise RuntimeError("tiến trình bị dừng")
+        return super().embed_documents(texts)
+
+
+def test_interrupted_sync_resumes_from_last_checkpoint(tmp_path):
+    data_dir, index_dir = tmp_path / "data", tmp_path / "index"
+    for i in range(6):
+        write_page(data_dir, f"p{i}", f"Trang {i} đoạn một.", f"Trang {i} đoạn hai khá dài về dịch vụ.")
+
+    db = VectorDB(vector_db_cls=FAISS, embedding=FlakyEmbedding(size=8, fail_at=3), persist_directory=str(index_dir), index_name="db")
+    loader = Loader("jsonl", split_kwargs=SPLIT_KWARGS)
+    try:
+        sync_index(db, str(data_dir), loader, pattern="*.jsonl", config=SPLIT_KWARGS, batch_size=2, checkpoint_every=2)
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("sync phải bị dừng")
+
+    committed = IndexManifest.for_index(str(index_dir), "db").files
+    assert 0 < len(committed) < 6
+    assert sorted(open_db(index_dir).document_ids()) == manifest_ids(index_dir)
+
+    db, stats = sync(index_dir, data_dir, batch_size=2, checkpoint_every=2)
+    assert stats["unchanged"] == len(committed)
+    assert stats["added"] == 6 - len(committed)
+    assert len(sources(db)) == 6
+    assert sorted(db.document_ids()) == manifest_ids(index_dir)
+
+
+def test_sync_sweeps_chunks_missing_from_manifest(tmp_path):
+    data_dir, index_dir = tmp_path / "data", tmp_path / "index"
+    write_page(data_dir, "a", "Nội dung trang a.")
+    db, _ = sync(index_dir, data_dir)
+    # Index đã lưu nhưng manifest chưa kịp ghi (dừng giữa checkpoint)
+    db.add_documents([db.db.docstore.search(db.document_ids()[0])], ids=["orphan"])
+
+    db, stats = sync(index_dir, data_dir)
+    assert stats["chunks_removed"] == 1
+    assert "orphan" not in db.document_ids()
+    assert sorted(db.document_ids()) == manifest_ids(index_dir)
+
+
+class SlowFirstEmbedding(DeterministicFakeEmbedding):
+    """Embedding giả chậm ở lần gọi đầu tiên, để batch sau được embed xong trước."""
+
+    calls: int = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        if self.calls == 1:
+            time.sleep(0.3)
+        return super().embed_documents(texts)
+
+
+class RecordingVectorDB(VectorDB):
+    def add_documents(self, documents, *args, **kwargs):
+        self.added_batches = getattr(self, "added_batches", []) + [len(documents)]
+        return super().add_documents(documents, *args, **kwargs)
+
+
+def test_parallel_embed_builds_ivf_index_from_first_batch(tmp_path):
+    data_dir, index_dir = tmp_path / "data", tmp_path / "index"
+    for i in range(45):
+        write_page(data_dir, f"p{i:02d}", f"Trang {i} đoạn một giới thiệu dịch vụ phát triển phần mềm.", f"Trang {i} đoạn hai nói về quy trình tuyển dụng kỹ sư.")
+    spec = IndexSpec(kind="ivfflat", nlist=2, nprobe=2)
+    db = RecordingVectorDB(
+        vector_db_cls=FAISS,
+        embedding=SlowFirstEmbedding(size=8),
+        persist_directory=str(index_dir),
+        index_name="db",
+        index_spec=spec
+    )
+    loader = Loader("jsonl", split_kwargs=SPLIT_KWARGS)
+    stats = sync_index(db, str(data_dir), loader, pattern="*.jsonl", config=SPLIT_KWARGS, batch_size=2, embed_workers=2)
+
+    assert db.added_batches[0] >= spec.training_size
+    assert db.db.index.nlist == 2
+    assert stats["chunks_added"] == 90 == len(db.document_ids())
+
+
+def test_empty_file_is_recorded_and_broken_file_retried(tmp_path):
+    data_dir, index_dir = tmp_path / "data", tmp_path / "index"
+    write_page(data_dir, "a", "Nội dung trang a.")
+    write_page(data_dir, "empty", "")
+    (data_dir / "broken.jsonl").write_text("{không phải json\n", encoding="utf-8")
+
+    db, stats = sync(index_dir, data_dir)
+    assert (stats["ingest"]["files"], stats["ingest"]["failed"]) == (2, 1)
+    manifest = IndexManifest.for_index(str(index_dir), "db")
+    assert manifest.files[(data_dir / "empty.jsonl").as_posix()]["chunk_ids"] == []
+    assert (data_dir / "broken.jsonl").as_posix() not in manifest.files
+
+    # File rỗng không bị tải lại, file lỗi được thử lại
+    db, stats = sync(index_dir, data_dir)
+    assert (stats["unchanged"], stats["added"]) == (2, 1)
@@ -0,0 +1,69 @@
+import asyncio
+import gc
+
+import pytest
+
+from src.base.inference_pool import InferencePool, InferenceTimeoutError, PoolSaturatedError
+
+
+async def numbers(n):
+    for i in range(n):
+        await asyncio.sleep(0)
+        yield i
+
+
+def test_stream_releases_slot_when_never_iterated():
+    async def scenario():
+        pool = InferencePool(max_workers=1, max_queue=1)
+        first = pool.run_stream(numbers, 3)
+        second = pool.run_stream(numbers, 3)
+        with pytest.raises(PoolSaturatedError):
+            pool.run_stream(numbers, 3)
+        # Client ngắt kết nối trước khi response bắt đầu: stream bị bỏ mà không được đọc
+        del first, second
+        gc.collect()
+        assert pool.in_flight == 0
+        assert [item async for item in pool.run_stream(numbers, 3)] == [0, 1, 2]
+        assert pool.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_stream_aclose_releases_slot_once():
+    async def scenario():
+        pool = InferencePool(max_workers=1, max_queue=0)
+        stream = pool.run_stream(numbers, 5)
+        async for _ in stream:
+            break
+        await stream.aclose()
+        await stream.aclose()
+        assert pool.in_flight == 0
+        assert pool.completed == 1
+
+    asyncio.run(scenario())
+
+
+def test_stream_deadline():
+    async def scenario():
+        pool = InferencePool(max_workers=1, max_queue=0)
+        with pytest.raises(InferenceTimeoutError):
+            async for _ in pool.run_stream(numbers, 100, timeout=0.0):
+                pass
+        assert pool.in_flight == 0
+        assert pool.timed_out == 1
+
+    asyncio.run(scenario())
+
+
+def test_latency_recorded_from_worker_threads_is_consistent():
+    async def scenario():
+        pool = InferencePool(max_workers=8, max_queue=200)
+        results = await asyncio.gather(*(pool.run(lambda i=i: i * 2) for i in range(200)))
+        assert results == [i * 2 for i in range(200)]
+        await asyncio.sleep(0)
+        stats = pool.stats()
+        assert (stats["in_flight"], stats["completed"], stats["rejected"]) == (0, 200, 0)
+        assert stats["avg_latency"] is not None
+        pool.shutdown()
+
+    asyncio.run(scenario())
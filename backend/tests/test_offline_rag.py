@@ -0,0 +1,65 @@
+import asyncio
+import threading
+
+from langchain_core.documents import Document
+from langchain_core.language_models import FakeListChatModel
+
+from src.rag.chat_memory import InMemoryHistoryStore
+from src.rag.offline_rag import Offline_RAG
+
+
+class ThreadRecordingStore(InMemoryHistoryStore):
+    """History store ghi lại thread thực hiện mỗi lần đọc/ghi."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.threads = []
+
+    def get_messages(self, session_id):
+        self.threads.append(threading.current_thread())
+        return super().get_messages(session_id)
+
+    def add_messages(self, session_id, messages):
+        self.threads.append(threading.current_thread())
+        super().add_messages(session_id, messages)
+
+
+class StaticRetriever:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def invoke(self, question):
+        return self.documents
+
+    async def ainvoke(self, question):
+        return self.documents
+
+
+def make_rag(store, documents=None):
+    rag = Offline_RAG(FakeListChatModel(responses=["Câu trả lời"] * 10), history_store=store)
+    rag.get_chain(StaticRetriever(documents or [Document(page_content="ngữ cảnh", metadata={"source": "/data/a.pdf"})]))
+    return rag
+
+
+def test_async_paths_do_history_io_off_the_event_loop():
+    store = ThreadRecordingStore()
+    rag = make_rag(store)
+
+    async def scenario():
+        loop_thread = threading.current_thread()
+        await rag.ainvoke("câu hỏi", session_id="s1")
+        events = [event async for event in rag.astream("câu hỏi 2", session_id="s1")]
+        assert events[-1]["type"] == "sources"
+        return loop_thread
+
+    loop_thread = asyncio.run(scenario())
+    assert len(store.threads) == 4
+    assert loop_thread not in store.threads
+    assert len(store.get_messages("s1")) == 4
+
+
+def test_format_sources_prefers_page_title():
+    web = Document(page_content="x", metadata={"source": "/corpus/example_com_about.jsonl", "title": "Về chúng tôi"})
+    pdf = Document(page_content="y", metadata={"source": "/data/Address_company.pdf"})
+    sources = Offline_RAG.format_sources([web, pdf])
+    assert [source["title"] for source in sources] == ["Về chúng tôi", "Address_company"]
@@ -0,0 +1,64 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.base.http_pool import aclose_async_client
+from src.base.llm_model_openrouter import OpenRouterClient
+
+
+class RateLimitedHandler(BaseHTTPRequestHandler):
+    """Trả 429 cho key "k0", trả lời bình thường cho các key khác."""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        # Giữ request lâu một chút để các request đồng thời cùng gặp lỗi trên một key
+        time.sleep(0.05)
+        if self.headers["Authorization"] == "Bearer k0":
+            self.send_response(429)
+            self.end_headers()
+            return
+        body = json.dumps({"choices": [{"message": {"content": self.headers["Authorization"][7:]}}]}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def api():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RateLimitedHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_concurrent_rate_limits_advance_key_once(api):
+    client = OpenRouterClient(["k0", "k1", "k2"], base_url=api)
+
+    async def scenario():
+        try:
+            return await asyncio.gather(*(client.agenerate("m", "xin chào") for _ in range(5)))
+        finally:
+            await aclose_async_client()
+
+    responses = asyncio.run(scenario())
+    # Mọi request đều chuyển sang k1, không request nào bỏ qua k1 hoặc báo hết key
+    assert [response["choices"][0]["message"]["content"] for response in responses] == ["k1"] * 5
+    assert client.get_current_api_key() == "k1"
+
+
+def test_all_keys_failing_raises_after_one_round(api):
+    client = OpenRouterClient(["k0"], base_url=api)
+    with pytest.raises(Exception, match="All API keys failed"):
+        client.generate("m", "xin chào")
+    assert client.get_current_api_key() == "k0"
@@ -0,0 +1,46 @@
+import time
+
+from langchain_core.documents import Document
+
+from src.rag.reranker import CrossEncoderReranker
+
+
+class SlowFirstModel:
+    """Model giả: lần predict đầu tiên (khởi động) rất chậm, các lần sau nhanh."""
+
+    def __init__(self, first_s: float = 0.3) -> None:
+        self.calls = 0
+        self.first_s = first_s
+
+    def predict(self, pairs, batch_size=None, show_progress_bar=False):
+        self.calls += 1
+        time.sleep(self.first_s if self.calls == 1 else 0.001)
+        return [len(text) for _, text in pairs]
+
+
+def retrieved(n):
+    return [(Document(page_content="x" * (i + 1)), None) for i in range(n)]
+
+
+def test_warm_up_is_not_counted_against_the_budget():
+    model = SlowFirstModel()
+    reranker = CrossEncoderReranker(top_n=2, budget_ms=50, model=model)
+    assert model.calls == 1
+    assert reranker.ms_per_pair is None
+
+    for _ in range(3):
+        ranked = reranker.rerank("q", retrieved(5))
+        assert [doc.page_content for doc, _ in ranked] == ["xxxxx", "xxxx"]
+    assert reranker.skips == 0
+    assert reranker.runs == 3
+    assert reranker.ms_per_pair < 10
+
+
+def test_first_measurement_is_ignored():
+    model = SlowFirstModel(first_s=0.0)
+    reranker = CrossEncoderReranker(top_n=2, budget_ms=50, model=model)
+    model.first_s, model.calls = 0.5, 0
+    reranker.rerank("q", retrieved(5))
+    assert reranker.ms_per_pair is None
+    reranker.rerank("q", retrieved(5))
+    assert reranker.ms_per_pair is not None and reranker.ms_per_pair < 10
@@ -0,0 +1,68 @@
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.rag.retrieval import RetrievalService
+from src.rag.vectorstore import VectorDB
+
+TEXTS = [
+    "Giới thiệu\nCông ty thành lập năm 2015.",
+    "Công ty thành lập năm 2015. Trụ sở đặt tại Thành phố Hồ Chí Minh.",
+    "Văn phòng Hà Nội mở năm 2019.",
+    "Đội ngũ gồm hơn một trăm kỹ sư.",
+    "Khách hàng ở Nhật Bản và Singapore."
+]
+
+
+def open_db(path):
+    ids = [f"c{i}" for i in range(len(TEXTS))]
+    docs = [
+        Document(page_content=text, metadata={
+            "source": "/data/about.pdf",
+            "title": "about",
+            "section_title": "Giới thiệu",
+            "chunk_id": ids[i],
+            "prev_chunk_id": ids[i - 1] if i else None,
+            "next_chunk_id": ids[i + 1] if i + 1 < len(ids) else None
+        })
+        for i, text in enumerate(TEXTS)
+    ]
+    db = VectorDB(vector_db_cls=FAISS, embedding=DeterministicFakeEmbedding(size=8), persist_directory=str(path), index_name="db")
+    db.add_documents(docs, ids=ids)
+    return db
+
+
+def hit(db, doc_id, score=0.0):
+    return db.db.docstore.search(doc_id), score
+
+
+def test_neighbor_chunks_follow_stored_ids(tmp_path):
+    db = open_db(tmp_path)
+    doc = db.db.docstore.search("c2")
+    assert [chunk.metadata["chunk_id"] for chunk in db.neighbor_chunks(doc, window=2)] == ["c0", "c1", "c2", "c3", "c4"]
+    first = db.db.docstore.search("c0")
+    assert [chunk.metadata["chunk_id"] for chunk in db.neighbor_chunks(first)] == ["c0", "c1"]
+
+
+def test_hits_are_expanded_without_repeating_chunks(tmp_path):
+    db = open_db(tmp_path)
+    service = RetrievalService(db, search_kwargs={"k": 3}, neighbor_window=1)
+    expanded = service.expand_neighbors([hit(db, "c1", 0.1), hit(db, "c2", 0.2), hit(db, "c4", 0.3)])
+
+    # c2 đã nằm trong đoạn của c1; đoạn của c4 dừng trước c2
+    assert [doc.metadata["expanded_chunk_ids"] for doc, _ in expanded] == [["c0", "c1", "c2"], ["c3", "c4"]]
+    assert [score for _, score in expanded] == [0.1, 0.3]
+    # Phần chồng lấp giữa c0 và c1 chỉ giữ một lần
+    assert expanded[0][0].page_content == "Giới thiệu\n" + TEXTS[1] + "\n" + TEXTS[2]
+    assert expanded[0][0].id == "c1"
+    # Mục được nhắc lại ở đầu đoạn không chứa heading
+    assert expanded[1][0].page_content == "Giới thiệu\n" + TEXTS[3] + "\n" + TEXTS[4]
+    # Docstore không bị sửa
+    assert "expanded_chunk_ids" not in db.db.docstore.search("c1").metadata
+
+
+def test_expansion_disabled_returns_hits_unchanged(tmp_path):
+    db = open_db(tmp_path)
+    results = [hit(db, "c1")]
+    assert RetrievalService(db).expand_neighbors(results) is results
+    assert len(RetrievalService(db, search_kwargs={"k": 1}, neighbor_window=1).retrieve("kỹ sư")[0][0].metadata["expanded_chunk_ids"]) >= 2
@@ -0,0 +1,32 @@
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.rag.bm25 import BM25Index
+from src.rag.vectorstore import VectorDB
+
+
+def open_db(path, documents=None, **kwargs):
+    return VectorDB(
+        documents=documents,
+        vector_db_cls=FAISS,
+        embedding=DeterministicFakeEmbedding(size=8),
+        persist_directory=str(path),
+        index_name="db",
+        keyword_search=True,
+        **kwargs
+    )
+
+
+def test_stale_keyword_index_with_same_count_is_rebuilt(tmp_path):
+    db = open_db(tmp_path, [Document(page_content="alpha beta"), Document(page_content="gamma delta")])
+    stale = BM25Index.load(db.keyword_index_path)
+    # File thay đổi (cùng số chunk, id mới) và tiến trình dừng sau khi lưu FAISS nhưng trước khi lưu BM25
+    db.delete_documents(db.document_ids()[:1])
+    db.add_documents([Document(page_content="zeta omega")], ids=["new"])
+    stale.save(db.keyword_index_path)
+    assert len(stale) == len(db.document_ids())
+
+    reopened = open_db(tmp_path)
+    assert reopened.bm25.ids() == set(reopened.document_ids())
+    assert [doc.page_content for doc, _ in reopened.keyword_search("omega", 1)] == ["zeta omega"]
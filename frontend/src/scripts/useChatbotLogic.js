@@ -19,6 +19,12 @@ export const useChatbotLogic = () => {
   const messagesContainerRef = useRef(null); 
   const timeoutRef = useRef(null); // Thêm ref để lưu timeout
   const [clearNotice, setClearNotice] = useState(null);
+  // Mỗi cuộc hội thoại có session riêng để backend lưu lịch sử theo người dùng
+  const sessionIdRef = useRef(null);
+  if (!sessionIdRef.current) {
+    sessionIdRef.current = localStorage.getItem("chatSessionId") || crypto.randomUUID();
+    localStorage.setItem("chatSessionId", sessionIdRef.current);
+  }
   const availableModels = [
     { name: "LLaMA 4", value: process.env.REACT_APP_MODELS }
   ];
@@ -46,6 +52,8 @@ export const useChatbotLogic = () => {
   
     if (hasUserMessages) {
       localStorage.removeItem("chatHistory");
+      sessionIdRef.current = crypto.randomUUID();
+      localStorage.setItem("chatSessionId", sessionIdRef.current);
       setMessages([{ from: "bot", text: "Xin chào, tôi có thể giúp gì cho bạn? 😊", timestamp: new Date() }]);
       
       // Hiển thị thông báo có thể tắt
@@ -113,16 +121,19 @@ export const useChatbotLogic = () => {
     }, 50);
 
     try {
-      const res = await fetch(apiUrl, {
+      // Nhận câu trả lời dạng Server-Sent Events từ /api/chat/stream
+      const res = await fetch(`${apiUrl}/stream`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ message: text, model: selectedModel }),
+        body: JSON.stringify({ message: text, model: selectedModel, session_id: sessionIdRef.current }),
       });
   
-      const data = await res.json();
-  
-      // Sử dụng streamBotResponse để hiển thị từ từ
-      streamBotResponse(data.reply, data.sources || []);
+      if (!res.ok || !res.body) {
+        // 503 (server bận) hoặc 504 (quá thời gian xử lý)
+        throw new Error(`Request failed with status ${res.status}`);
+      }
+
+      await readBotStream(res.body);
   
     } catch (err) {
       console.error(err);
@@ -136,6 +147,69 @@ export const useChatbotLogic = () => {
     }
   };
 
+  //Cập nhật tin nhắn bot cuối cùng đang stream
+  const updateStreamingMessage = (patch) => {
+    setMessages((prev) => {
+      const last = prev[prev.length - 1];
+      const updated = last?.from === "bot" && last.streaming
+        ? [...prev.slice(0, -1), { ...last, ...patch, timestamp: new Date() }]
+        : [...prev, { from: "bot", text: "", streaming: true, timestamp: new Date(), ...patch }];
+      localStorage.setItem("chatHistory", JSON.stringify(updated));
+      return updated;
+    });
+  };
+
+  //Đọc các event: delta (một đoạn câu trả lời), sources, error, done
+  const readBotStream = async (body) => {
+    const reader = body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    let fullText = "";
+    let started = false;
+
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      const events = buffer.split("\n\n");
+      buffer = events.pop();
+
+      for (const event of events) {
+        const line = event.split("\n").find((l) => l.startsWith("data:"));
+        if (!line) continue;
+        const payload = JSON.parse(line.slice(5).trim());
+
+        if (payload.type === "delta") {
+          if (!started) {
+            started = true;
+            setIsTyping(false);
+            setError("");
+          }
+          fullText += payload.content;
+          updateStreamingMessage({ text: fullText });
+        } else if (payload.type === "sources") {
+          updateStreamingMessage({ sources: payload.sources || [] });
+        } else if (payload.type === "error") {
+          throw new Error(payload.message);
+        }
+      }
+    }
+
+    if (!started) {
+      throw new Error("Empty response from server");
+    }
+
+    setMessages((prev) => {
+      const updated = prev.map((m, i) =>
+        i === prev.length - 1 ? { ...m, text: fullText, streaming: false } : m
+      );
+      localStorage.setItem("chatHistory", JSON.stringify(updated));
+      return updated;
+    });
+    setIsBotResponding(false);
+  };
+
   //Streaming Text
   const streamBotResponse = (fullText, sources) => {
     console.log(sources);